@@ -0,0 +1,64 @@
+"""
+Throughput of serial run() vs. run_batch() against the local fake
+OpenAI-compatible server.
+
+Usage (from the repository root):
+    python -m bench.batch_throughput --queries 32 --latency 0.2 --concurrency 8
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_openai import ChatOpenAI
+
+from src.main import Orchestrator
+
+from .fake_openai_server import FakeOpenAIServer
+
+
+def bench(n_queries: int, latency: float, concurrency: int):
+    queries = [f"Write a function number {i}" for i in range(n_queries)]
+
+    with FakeOpenAIServer(latency=latency) as server, tempfile.TemporaryDirectory() as tmp:
+        memory_path = Path(tmp) / "memory.json"
+        shutil.copy("src/memory.json", memory_path)
+
+        # retries are left to the agents' call policies (see build_agents)
+        llm = ChatOpenAI(base_url=server.base_url, api_key="fake", model="fake", max_retries=0)
+        orchestrator = Orchestrator(memory_path=str(memory_path), llm=llm)
+
+        start = time.perf_counter()
+        for query in queries:
+            orchestrator.run(query)
+        serial_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = orchestrator.run_batch(queries, max_concurrency=concurrency)
+        batch_s = time.perf_counter() - start
+
+    return {
+        "queries": n_queries,
+        "latency_s": latency,
+        "max_concurrency": concurrency,
+        "serial_qps": n_queries / serial_s,
+        "batch_qps": n_queries / batch_s,
+        "speedup": serial_s / batch_s,
+        "errors": sum(1 for r in results if r.get("error")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.queries, args.latency, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Profile lookup latency: BM25 index vs. the old linear substring scan.
+
+Usage (from the repository root):
+    python -m bench.bm25_lookup --sizes 10000 100000
+"""
+import argparse
+import itertools
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.memory import Memory
+
+
+WORDS = (
+    "exam lecture seminar deadline project report meeting gym dinner birthday party "
+    "trip flight hotel visa dentist doctor library thesis draft review lab homework "
+    "quiz course python langgraph agent memory router planner schedule morning evening "
+    "weekend monday tuesday wednesday thursday friday january february march april"
+).split()
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    """WORDS plus synthetic terms; cumulative weights follow a Zipf-like 1/rank curve."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = WORDS + ["".join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)]
+    weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+    return vocabulary, weights
+
+
+def make_notes(n: int, vocabulary, weights, rng: random.Random):
+    for i in range(n):
+        title = rng.choice(["event", "note", "preference", "deadline"])
+        content = " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(6, 20))) + f" #{i}"
+        yield {"title": title, "content": content}
+
+
+def make_queries(n: int, vocabulary, weights, rng: random.Random):
+    queries = []
+    for _ in range(n):
+        a, b, c = rng.choices(vocabulary, cum_weights=weights, k=3)
+        queries.append(f"Do I have a {a} or {b} on {c}?")
+    return queries
+
+
+def linear_scan(notes, query: str, n: int = 3):
+    """The pre-index get_from_profile algorithm, for comparison."""
+    query = query.lower()
+    scored_records = []
+    for record in notes:
+        score = 0
+        if query in record.get("title", "").lower():
+            score += 3
+        if query in record.get("content", "").lower():
+            score += 2
+        if score > 0:
+            scored_records.append((score, record))
+    scored_records.sort(key=lambda x: -x[0])
+    return [record for _, record in scored_records[:n]]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": 1000 * statistics.median(samples),
+        "p95_ms": 1000 * samples[int(0.95 * (len(samples) - 1))],
+    }
+
+
+def bench_size(n_notes: int, n_queries: int, vocabulary_size: int, seed: int):
+    rng = random.Random(seed)
+    vocabulary, weights = make_vocabulary(vocabulary_size, rng)
+    queries = make_queries(n_queries, vocabulary, weights, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "memory.json"
+        notes = list(make_notes(n_notes, vocabulary, weights, rng))
+        path.write_text(json.dumps({"msg_history": [], "profile_notes": notes}), encoding="utf-8")
+
+        memory = Memory(path)
+        start = time.perf_counter()
+        memory.get_from_profile("warmup")
+        build_s = time.perf_counter() - start
+        memory.close()
+
+        memory = Memory(path)
+        start = time.perf_counter()
+        memory.get_from_profile("warmup")
+        load_s = time.perf_counter() - start
+
+        bm25 = []
+        for query in queries:
+            start = time.perf_counter()
+            memory.get_from_profile(query)
+            bm25.append(time.perf_counter() - start)
+
+        scan = []
+        for query in queries:
+            start = time.perf_counter()
+            linear_scan(notes, query)
+            scan.append(time.perf_counter() - start)
+
+    return {
+        "notes": n_notes,
+        "index_build_s": build_s,
+        "index_load_s": load_s,
+        "bm25": percentiles(bm25),
+        "linear_scan": percentiles(scan),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n_notes in args.sizes:
+        print(json.dumps(bench_size(n_notes, args.queries, args.vocabulary, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
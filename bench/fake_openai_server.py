@@ -0,0 +1,371 @@
+"""
+Local fake OpenAI-compatible chat-completions server for benchmarks.
+
+Answers POST /v1/chat/completions (plain and "stream": true) with canned
+text chosen from the agent prompt, after a configurable delay; streamed
+answers wait token_interval seconds between tokens (plain answers wait for
+all tokens). Every request is handled in its own thread, so concurrent
+clients overlap. For resilience tests a fraction of requests can fail with
+HTTP 503 (error_rate) or be delayed by slow_latency extra seconds (slow_rate).
+
+Like vLLM's automatic prefix caching, the server remembers prompt prefixes in
+blocks of block_size tokens: the leading blocks of a prompt that an earlier
+prompt already had are "cached" and reported in usage.prompt_tokens_details;
+with prefill_rate set, the uncached prompt tokens delay the first token.
+
+Canned responses are keyed by agent ("router", "decompozer",
+"code_assistant", "study_assistant", "planner"); agents without an entry get
+"default". Batch router prompts are answered line by line with the router's
+category unless a "batch_router" response is given. A key "<agent>@<model>" (e.g. "router@small") answers only
+requests for that model, so tiered setups can give a small model worse
+answers. A JSON file passed with --responses overrides them.
+
+Usage (from the repository root):
+    python -m bench.fake_openai_server --port 8089 --latency 0.5 --token-rate 50
+    python -m bench.fake_openai_server --responses bench/responses.json
+    python -m bench.fake_openai_server --error-rate 0.05 --slow-rate 0.05 --slow-latency 2
+    python -m bench.fake_openai_server --prefill-rate 2000
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+
+DEFAULT_RESPONSES = {
+    "router": "classification: programming",
+    "decompozer": "Subtasks:\n1. Analyze the task.\n2. Implement the solution.\n3. Write tests.",
+    "default": "Here is the answer.\n<TOOL_CALL>_[calculator](2 + 2)\nDone.",
+}
+
+# prompt marker -> response key
+AGENT_MARKERS = (
+    ("batch routing agent", "batch_router"),
+    ("routing agent", "router"),
+    ("decompozer agent", "decompozer"),
+    ("code assistant agent", "code_assistant"),
+    ("study assistant agent", "study_assistant"),
+    ("planner agent", "planner"),
+)
+
+
+BATCH_ITEM = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+def pick_response(prompt: str, responses: Dict[str, str], model: Optional[str] = None) -> str:
+    for marker, key in AGENT_MARKERS:
+        if marker in prompt:
+            if key == "batch_router" and not any(k.startswith("batch_router") for k in responses):
+                return batch_router_response(prompt, responses)
+            return responses.get(f"{key}@{model}", responses.get(key, responses["default"]))
+    return responses["default"]
+
+
+def batch_router_response(prompt: str, responses: Dict[str, str]) -> str:
+    """
+    "<number>: <category>" for every numbered request, with the category of
+    the canned router answer.
+    """
+    category = responses["router"].rsplit(":", 1)[-1].strip()
+    requests = prompt.split("Requests:", 1)[-1]
+    return "\n".join(f"{number}: {category}" for number in BATCH_ITEM.findall(requests))
+
+
+def load_responses(path: Optional[str]) -> Dict[str, str]:
+    """
+    Read canned responses from a JSON object file ({"router": "...", ...}).
+    """
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class PrefixCache:
+    """
+    LRU set of prompt blocks keyed by the hash of the whole prefix up to and
+    including the block, so a block only matches after the same prefix.
+    """
+
+    def __init__(self, block_size: int = 16, capacity: int = 65536):
+        self.block_size = block_size
+        self.capacity = capacity
+        self._blocks: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def match(self, tokens: Sequence[str]) -> int:
+        """
+        Number of leading tokens of tokens already cached; caches the rest.
+        """
+        cached, prefix_hash, hit = 0, 0, True
+        with self._lock:
+            for start in range(0, len(tokens) - self.block_size + 1, self.block_size):
+                prefix_hash = hash((prefix_hash, tuple(tokens[start:start + self.block_size])))
+                if hit and prefix_hash in self._blocks:
+                    self._blocks.move_to_end(prefix_hash)
+                    cached += self.block_size
+                    continue
+                hit = False
+                self._blocks[prefix_hash] = None
+                if len(self._blocks) > self.capacity:
+                    self._blocks.popitem(last=False)
+        return cached
+
+
+class FakeOpenAIServer:
+    """
+    Threaded HTTP server speaking the subset of the OpenAI API used by ChatOpenAI.
+
+    Args:
+        host, port: Address to bind; port 0 picks a free port.
+        latency: Seconds to wait before answering each request.
+        token_interval: Seconds per generated token.
+        responses: Canned answers keyed by agent (see AGENT_MARKERS) or "default".
+        token_rate: Tokens per second; overrides token_interval when set.
+        error_rate: Fraction of completion requests answered with HTTP 503.
+        slow_rate: Fraction of completion requests delayed by slow_latency more seconds.
+        seed: Seed of the fault injection.
+        prefill_rate: Uncached prompt tokens processed per second before the
+            first token; None makes prefill free (prefix hits are still counted).
+        block_size: Tokens per prefix cache block.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 token_interval: float = 0.0, responses: Optional[Dict[str, str]] = None,
+                 token_rate: Optional[float] = None, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0, seed: Optional[int] = None,
+                 prefill_rate: Optional[float] = None, block_size: int = 16):
+        self.latency = latency
+        self.token_interval = 1.0 / token_rate if token_rate else token_interval
+        self.responses = {**DEFAULT_RESPONSES, **(responses or {})}
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests: List[Dict] = []
+        self.faults = {"errors": 0, "slow": 0}
+        self.prefill_rate = prefill_rate
+        self.prefix_cache = PrefixCache(block_size)
+        self.prompt_tokens = {"total": 0, "cached": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, body: Dict):
+        with self._lock:
+            self.requests.append(body)
+
+    def prefill(self, prompt: str) -> Dict[str, int]:
+        """
+        Prompt token counts of a request, and the prefill delay they cost.
+        """
+        tokens = split_tokens(prompt)
+        cached = self.prefix_cache.match(tokens)
+        with self._lock:
+            self.prompt_tokens["total"] += len(tokens)
+            self.prompt_tokens["cached"] += cached
+        if self.prefill_rate:
+            time.sleep((len(tokens) - cached) / self.prefill_rate)
+        return {"prompt_tokens": len(tokens), "cached_tokens": cached}
+
+    def fault(self) -> Optional[str]:
+        """
+        Injected fault of the next request: "error", "slow" or None.
+        """
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.error_rate:
+                self.faults["errors"] += 1
+                return "error"
+            if draw < self.error_rate + self.slow_rate:
+                self.faults["slow"] += 1
+                return "slow"
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                try:
+                    self._handle_post()
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up: a deadline passed or a hedged duplicate won
+                    self.close_connection = True
+
+            def _handle_post(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json({"error": "not found"}, status=404)
+                    return
+
+                server.record(body)
+                prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+                text = pick_response(prompt, server.responses, body.get("model"))
+                fault = server.fault()
+                time.sleep(server.latency + (server.slow_latency if fault == "slow" else 0.0))
+                if fault == "error":
+                    self._send_json({"error": {"message": "injected failure", "type": "server_error"}}, status=503)
+                    return
+                prompt_usage = server.prefill(prompt)
+
+                if body.get("stream"):
+                    self._send_stream(body, text)
+                else:
+                    time.sleep(server.token_interval * len(split_tokens(text)))
+                    self._send_json(completion(body, text, prompt_usage))
+
+            def _send_json(self, payload: Dict, status: int = 200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, body: Dict, text: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in split_tokens(text):
+                    time.sleep(server.token_interval)
+                    self.wfile.write(f"data: {json.dumps(chunk(body, piece))}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(f"data: {json.dumps(chunk(body, None))}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def split_tokens(text: str) -> List[str]:
+    """
+    Split text into word-sized pieces (whitespace kept), a stand-in for tokens.
+    """
+    pieces, current = [], ""
+    for char in text:
+        current += char
+        if char.isspace():
+            pieces.append(current)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def usage(prompt_usage: Dict[str, int], text: str) -> Dict:
+    completion_tokens = len(split_tokens(text))
+    return {
+        "prompt_tokens": prompt_usage["prompt_tokens"],
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_usage["prompt_tokens"] + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": prompt_usage["cached_tokens"]},
+    }
+
+
+def completion(body: Dict, text: str, prompt_usage: Dict[str, int]) -> Dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        ],
+        "usage": usage(prompt_usage, text),
+    }
+
+
+def chunk(body: Dict, piece: Optional[str]) -> Dict:
+    delta = {"content": piece} if piece is not None else {}
+    return {
+        "id": "chatcmpl-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None if piece is not None else "stop"}],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=None, help="tokens per second")
+    parser.add_argument("--responses", default=None, help="JSON file with canned responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="extra delay of slow requests, seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--prefill-rate", type=float, default=None, help="uncached prompt tokens per second")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        token_interval=args.token_interval,
+        responses=load_responses(args.responses),
+        token_rate=args.token_rate,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        seed=args.seed,
+        prefill_rate=args.prefill_rate,
+    )
+    print(f"Serving fake OpenAI API at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
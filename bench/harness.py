@@ -0,0 +1,297 @@
+"""
+End-to-end benchmark of the agent graph against the local fake
+OpenAI-compatible server (bench/fake_openai_server.py).
+
+Drives the orchestrator over a query corpus in several modes:
+    run     serial Orchestrator.run
+    arun    serial Orchestrator.arun
+    batch   Orchestrator.run_batch with --concurrency (and --batch-routing)
+    stream  serial Orchestrator.stream_run (also reports time to first piece)
+
+For every mode it reports throughput, per-query p50/p95 latency, per-stage
+latency and token counters from the trace (see src/tracing.py), growth of the
+memory files and peak RSS; with --models (a ModelConfig file, see
+src/models.py, whose tiers are all served by the fake server) also calls,
+latency, cost and escalations per model tier. Results are written as JSON
+(with the git commit) so runs can be compared; --baseline prints the change
+against an older file. --error-rate / --slow-rate / --slow-latency make the
+server inject failures and slow responses; every mode then also reports the
+retries, hedges and deadline misses of the LLM calls (see src/resilience.py).
+The server simulates prefix caching: every mode reports the prompt tokens
+it reused, and --prefill-rate makes the uncached ones delay the first token.
+
+Usage (from the repository root):
+    python -m bench.harness --latency 0.05 --token-rate 200
+    python -m bench.harness --modes run batch --rounds 4 --baseline bench/results/<old>.json
+"""
+import argparse
+import json
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from src.checkpoint import make_checkpointer
+from src.main import Orchestrator, run_sync
+from src.models import ModelConfig, get_tier_stats
+from src.prerouter import PreRouter
+from src.resilience import get_call_stats
+from src.trace_report import load_spans, summarize
+from src.tracing import configure_tracing
+
+from .fake_openai_server import FakeOpenAIServer, load_responses
+
+
+BENCH_DIR = Path(__file__).parent
+MODES = ("run", "arun", "batch", "stream")
+
+
+def load_corpus(path: Path, rounds: int) -> List[str]:
+    queries = [
+        line.strip()
+        for line in path.read_text(encoding="utf-8").splitlines()
+        if line.strip() and not line.startswith("#")
+    ]
+    return queries * rounds
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def directory_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "p50_ms": 1000 * statistics.median(samples),
+        "p95_ms": 1000 * samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "max_ms": 1000 * samples[-1],
+    }
+
+
+def drive(mode: str, orchestrator: Orchestrator, queries: List[str], concurrency: int,
+          batch_routing: bool = False) -> Dict:
+    latencies: List[float] = []
+    first_piece: List[float] = []
+    errors = 0
+
+    if mode == "run":
+        for query in queries:
+            start = time.perf_counter()
+            orchestrator.run(query)
+            latencies.append(time.perf_counter() - start)
+
+    elif mode == "arun":
+        async def serial():
+            for query in queries:
+                start = time.perf_counter()
+                await orchestrator.arun(query)
+                latencies.append(time.perf_counter() - start)
+
+        # same loop as run_batch: async HTTP clients are bound to their first loop
+        run_sync(serial())
+
+    elif mode == "batch":
+        results = orchestrator.run_batch(queries, max_concurrency=concurrency, batch_routing=batch_routing)
+        errors = sum(1 for result in results if result.get("error"))
+
+    elif mode == "stream":
+        for query in queries:
+            start = time.perf_counter()
+            first = None
+            for _ in orchestrator.stream_run(query):
+                if first is None:
+                    first = time.perf_counter() - start
+            latencies.append(time.perf_counter() - start)
+            if first is not None:
+                first_piece.append(first)
+
+    else:
+        raise ValueError(f"unknown mode {mode!r}")
+
+    report = {"query_latency": percentiles_ms(latencies), "errors": errors}
+    if first_piece:
+        report["time_to_first_piece"] = percentiles_ms(first_piece)
+    return report
+
+
+def bench_mode(mode: str, args, server: FakeOpenAIServer, queries: List[str]) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        memory_dir = tmp / "memory"
+        memory_dir.mkdir()
+        shutil.copy("src/memory.json", memory_dir / "memory.json")
+        trace_path = tmp / "trace.jsonl"
+
+        # retries are left to the agents' call policies so that they are measured
+        llm = ChatOpenAI(base_url=server.base_url, api_key="fake", model="fake", max_retries=0)
+        models = None
+        if args.models:
+            models = ModelConfig.load(args.models)
+            for settings in models.tiers.values():
+                if settings:
+                    settings.update(base_url=server.base_url, api_key="fake", max_retries=0)
+        orchestrator = Orchestrator(
+            memory_path=str(memory_dir / "memory.json"),
+            llm=llm,
+            prerouter=PreRouter.load() if args.prerouter else None,
+            checkpointer=make_checkpointer(
+                f"sqlite:{tmp / 'checkpoints.sqlite3'}" if args.checkpoint == "sqlite" else args.checkpoint
+            ),
+            models=models,
+        )
+        server.prefix_cache.clear()
+        # first query opens (and migrates) the memory store; keep it out of the numbers
+        orchestrator.run(queries[0])
+
+        memory_before = directory_bytes(memory_dir)
+        requests_before = len(server.requests)
+        faults_before = dict(server.faults)
+        prompt_before = dict(server.prompt_tokens)
+        configure_tracing(str(trace_path))
+        get_tier_stats().reset()
+        get_call_stats().reset()
+
+        start = time.perf_counter()
+        report = drive(mode, orchestrator, queries, args.concurrency, args.batch_routing)
+        elapsed = time.perf_counter() - start
+
+        configure_tracing()
+        stages = summarize(load_spans([trace_path]))
+        prompt_tokens = {key: server.prompt_tokens[key] - prompt_before[key] for key in server.prompt_tokens}
+
+        result = {
+            "queries": len(queries),
+            "elapsed_s": elapsed,
+            "throughput_qps": len(queries) / elapsed,
+            **report,
+            "llm_requests": len(server.requests) - requests_before,
+            "prompt_tokens": {
+                **prompt_tokens,
+                "cached_fraction": prompt_tokens["cached"] / prompt_tokens["total"] if prompt_tokens["total"] else 0.0,
+            },
+            "injected_faults": {key: server.faults[key] - faults_before[key] for key in server.faults},
+            "llm_calls": get_call_stats().stats(),
+            "stages": stages,
+            "memory_growth_bytes": directory_bytes(memory_dir) - memory_before,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if models is not None:
+            result["models"] = get_tier_stats().stats()
+        return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: Dict, baseline: Dict) -> Dict[str, Dict[str, float]]:
+    """
+    Ratio new / baseline of the headline numbers of every mode present in both.
+    """
+    changes = {}
+    for mode, new in result["modes"].items():
+        old = baseline.get("modes", {}).get(mode)
+        if not old:
+            continue
+        row = {"throughput_qps": new["throughput_qps"] / old["throughput_qps"]}
+        for key in ("p50_ms", "p95_ms"):
+            if new["query_latency"].get(key) and old["query_latency"].get(key):
+                row[key] = new["query_latency"][key] / old["query_latency"][key]
+        if new.get("time_to_first_piece", {}).get("p50_ms") and old.get("time_to_first_piece", {}).get("p50_ms"):
+            row["ttfp_p50_ms"] = new["time_to_first_piece"]["p50_ms"] / old["time_to_first_piece"]["p50_ms"]
+        row["peak_rss_mb"] = new["peak_rss_mb"] / old["peak_rss_mb"]
+        changes[mode] = row
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=BENCH_DIR / "corpus.txt")
+    parser.add_argument("--rounds", type=int, default=1, help="repeat the corpus this many times")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="server delay per request, seconds")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="server tokens per second")
+    parser.add_argument("--responses", default=str(BENCH_DIR / "responses.json"))
+    parser.add_argument("--prefill-rate", type=float, default=None,
+                        help="server prefill speed for uncached prompt tokens, tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="extra delay of slow requests, seconds")
+    parser.add_argument("--no-prerouter", dest="prerouter", action="store_false")
+    parser.add_argument("--batch-routing", action="store_true",
+                        help="batch mode routes all queries with batched router calls")
+    parser.add_argument("--checkpoint", choices=("memory", "sqlite"), default=None,
+                        help="run with a checkpointer (measures its overhead)")
+    parser.add_argument("--models", default=None, help="ModelConfig JSON file (per-agent model tiers)")
+    parser.add_argument("--out", type=Path, default=None, help="result file (default: bench/results/)")
+    parser.add_argument("--baseline", type=Path, default=None, help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    queries = load_corpus(args.corpus, args.rounds)
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "corpus": str(args.corpus),
+            "queries": len(queries),
+            "concurrency": args.concurrency,
+            "latency_s": args.latency,
+            "token_rate": args.token_rate,
+            "responses": args.responses,
+            "prefill_rate": args.prefill_rate,
+            "error_rate": args.error_rate,
+            "slow_rate": args.slow_rate,
+            "slow_latency_s": args.slow_latency,
+            "prerouter": args.prerouter,
+            "batch_routing": args.batch_routing,
+            "checkpoint": args.checkpoint,
+            "models": args.models,
+        },
+        "modes": {},
+    }
+
+    server = FakeOpenAIServer(latency=args.latency, token_rate=args.token_rate,
+                              responses=load_responses(args.responses), error_rate=args.error_rate,
+                              slow_rate=args.slow_rate, slow_latency=args.slow_latency, seed=0,
+                              prefill_rate=args.prefill_rate)
+    with server:
+        for mode in args.modes:
+            result["modes"][mode] = bench_mode(mode, args, server, queries)
+
+    if args.baseline:
+        result["vs_baseline"] = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")))
+
+    out = args.out or BENCH_DIR / "results" / f"harness-{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    print(json.dumps({mode: {k: v for k, v in r.items() if k != "stages"} for mode, r in result["modes"].items()}, indent=2))
+    if "vs_baseline" in result:
+        print(json.dumps({"vs_baseline": result["vs_baseline"]}, indent=2))
+    print(f"Saved results to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold-start import cost of the package, measured with `python -X importtime`.
+
+Each run starts a fresh interpreter, executes the statement (by default
+`from src.main import run`) and parses the importtime report from stderr.
+Reports the median cumulative import time of the top-level module, the
+wall-clock time of the whole interpreter, the slowest imported packages and
+whether heavy dependencies (LangChain, LangGraph, OpenAI, numpy) were loaded.
+
+Usage (from the repository root):
+    python -m bench.import_time --runs 10
+    python -m bench.import_time --stmt "from src.main import build_graph; build_graph()"
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+HEAVY_PACKAGES = ("langchain_core", "langchain_openai", "langgraph", "openai", "httpx", "dotenv", "numpy")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Parse `import time: self [us] | cumulative | imported package` lines.
+
+    Returns:
+        (module, depth, self_us, cumulative_us) for every imported module, in
+        report order; depth 0 marks imports made directly by the statement.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        records.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return records
+
+
+def measure(stmt: str) -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", stmt],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, parse_importtime(completed.stderr)
+
+
+def summarize(stmt: str, runs: int, top: int) -> Dict:
+    wall: List[float] = []
+    total: List[int] = []
+    per_package: Dict[str, List[int]] = defaultdict(list)
+    loaded = set()
+
+    for _ in range(runs):
+        elapsed, records = measure(stmt)
+        wall.append(elapsed)
+        # depth-0 entries include everything imported below them
+        total.append(sum(cumulative for _, depth, _, cumulative in records if depth == 0))
+        packages: Dict[str, int] = defaultdict(int)
+        for name, _, self_us, _ in records:
+            packages[name.split(".")[0]] += self_us
+        for package, self_us in packages.items():
+            per_package[package].append(self_us)
+        loaded.update(packages)
+
+    slowest = sorted(
+        ((package, statistics.median(samples)) for package, samples in per_package.items()),
+        key=lambda item: -item[1],
+    )[:top]
+
+    return {
+        "stmt": stmt,
+        "runs": runs,
+        "python": sys.version.split()[0],
+        "wall_ms": 1000 * statistics.median(wall),
+        "import_ms": statistics.median(total) / 1000,
+        "slowest_packages_ms": {package: us / 1000 for package, us in slowest},
+        "heavy_loaded": sorted(set(HEAVY_PACKAGES) & loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stmt", default="from src.main import run")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print(json.dumps(summarize(args.stmt, args.runs, args.top), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-query overhead outside the LLM: building agents and compiling the graph
+for every request (the old run()) vs. a reused Orchestrator.
+
+Usage (from the repository root):
+    python -m bench.orchestrator_overhead --queries 200
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.main import Orchestrator
+
+from .stub_llm import StubChatModel
+
+
+CATEGORIES = ["academic", "programming", "planning", "other"]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": 1000 * statistics.fmean(samples),
+        "p50_ms": 1000 * statistics.median(samples),
+        "p95_ms": 1000 * samples[int(0.95 * (len(samples) - 1))],
+    }
+
+
+def bench(n_queries: int):
+    stubs = {category: StubChatModel(category=category) for category in CATEGORIES}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory_path = Path(tmp) / "memory.json"
+        shutil.copy("src/memory.json", memory_path)
+
+        per_request = []
+        for i in range(n_queries):
+            llm = stubs[CATEGORIES[i % len(CATEGORIES)]]
+            start = time.perf_counter()
+            Orchestrator(memory_path=str(memory_path), llm=llm).run(f"query {i}")
+            per_request.append(time.perf_counter() - start)
+
+        orchestrators = {
+            category: Orchestrator(memory_path=str(memory_path), llm=llm) for category, llm in stubs.items()
+        }
+        reused = []
+        for i in range(n_queries):
+            orchestrator = orchestrators[CATEGORIES[i % len(CATEGORIES)]]
+            start = time.perf_counter()
+            orchestrator.run(f"query {i}")
+            reused.append(time.perf_counter() - start)
+
+    return {
+        "queries": n_queries,
+        "build_per_request": summarize(per_request),
+        "reused_orchestrator": summarize(reused),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time-to-first-token of stream_run() vs. the full latency of run(), against
+the local fake OpenAI-compatible server.
+
+Usage (from the repository root):
+    python -m bench.stream_ttft --queries 10 --token-interval 0.01
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_openai import ChatOpenAI
+
+from src.main import Orchestrator
+
+from .fake_openai_server import FakeOpenAIServer
+
+
+LONG_ANSWER = " ".join(f"word{i}" for i in range(400)) + "\n<TOOL_CALL>_[calculator](2 + 2)\nDone."
+
+
+def bench(n_queries: int, latency: float, token_interval: float):
+    with FakeOpenAIServer(latency=latency, token_interval=token_interval,
+                          responses={"default": LONG_ANSWER}) as server, tempfile.TemporaryDirectory() as tmp:
+        memory_path = Path(tmp) / "memory.json"
+        shutil.copy("src/memory.json", memory_path)
+        # retries are left to the agents' call policies (see build_agents)
+        llm = ChatOpenAI(base_url=server.base_url, api_key="fake", model="fake", max_retries=0)
+        orchestrator = Orchestrator(memory_path=str(memory_path), llm=llm)
+
+        full, ttft, stream_total = [], [], []
+        for i in range(n_queries):
+            start = time.perf_counter()
+            orchestrator.run(f"Write function {i}")
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            first = None
+            for _ in orchestrator.stream_run(f"Write function {i}"):
+                if first is None:
+                    first = time.perf_counter() - start
+            ttft.append(first)
+            stream_total.append(time.perf_counter() - start)
+
+    return {
+        "queries": n_queries,
+        "run_latency_s": statistics.median(full),
+        "stream_ttft_s": statistics.median(ttft),
+        "stream_total_s": statistics.median(stream_total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.queries, args.latency, args.token_interval), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+In-process chat model stub for benchmarks: answers instantly with canned
+text chosen from the agent prompt, so timings measure only our own overhead.
+"""
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+
+class StubChatModel(SimpleChatModel):
+    category: str = "programming"
+    plan: str = "Subtasks:\n1. Analyze the task.\n2. Implement the solution.\n3. Write tests."
+    answer: str = "Stub answer. <TOOL_CALL>_[calculator](2 + 2)"
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        prompt = messages[-1].content if messages else ""
+        if "routing agent" in prompt:
+            return f"classification: {self.category}"
+        if "decompozer agent" in prompt:
+            return self.plan
+        return self.answer
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
@@ -0,0 +1,98 @@
+"""
+Tool-call parsing and substitution cost: single-pass scanner vs. the old
+regex findall + str.replace implementation.
+
+Tool execution is replaced by a constant result so only parsing and
+substitution are measured. The streaming case feeds the same text to
+ToolCallStream in small chunks.
+
+Usage (from the repository root):
+    python -m bench.tool_parser --calls 10 100 1000
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from unittest import mock
+
+from src import utils
+
+
+FILLER = (
+    "Let us work through this step by step and check every intermediate value "
+    "before moving on to the next part of the problem. "
+)
+
+ARGUMENTS = ["2 + 2", "sin(pi / 2) * (3 + 4)", "sqrt(16) + log(10)", "(1 + (2 * (3 + 4)))", "10 / 4"]
+
+
+def make_output(n_calls: int, rng: random.Random) -> str:
+    parts = []
+    for _ in range(n_calls):
+        parts.append(FILLER * rng.randint(1, 4))
+        parts.append(f"<TOOL_CALL>_[calculator]({rng.choice(ARGUMENTS)})\n")
+    parts.append(FILLER)
+    return "".join(parts)
+
+
+def legacy_apply_tools(model_output: str):
+    """The pre-scanner apply_tools algorithm, for comparison."""
+    tool_calls = [
+        {"tool": name.strip(), "arguments": args.strip()}
+        for name, args in re.findall(r"<TOOL_CALL>_\[([^\]]+)\]\(([^)]*)\)", model_output)
+    ]
+    executed = []
+    processed_text = model_output
+    for call in tool_calls:
+        result = utils.run_tool(call["tool"], call["arguments"])
+        executed.append({**call, "result": result})
+        original = f"<TOOL_CALL>_[{call['tool']}]({call['arguments']})"
+        processed_text = processed_text.replace(original, f"[Result: {result}]")
+    return processed_text, executed
+
+
+def stream_apply(text: str, chunk_size: int):
+    stream = utils.ToolCallStream()
+    out = [stream.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    out.append(stream.finish())
+    return "".join(out), stream.executed
+
+
+def timed(func, *args, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return 1000 * statistics.median(samples)
+
+
+def bench_size(n_calls: int, chunk_size: int, repeat: int, seed: int):
+    text = make_output(n_calls, random.Random(seed))
+    fake_execute = lambda name, args: {"tool": name, "arguments": args, "result": "42", "cached": False}
+    with mock.patch.object(utils, "execute_tool", fake_execute):
+        return {
+            "calls": n_calls,
+            "chars": len(text),
+            "legacy_ms": timed(legacy_apply_tools, text, repeat=repeat),
+            "scanner_ms": timed(utils.apply_tools, text, 1, repeat=repeat),
+            "stream_ms": timed(stream_apply, text, chunk_size, repeat=repeat),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n_calls in args.calls:
+        print(json.dumps(bench_size(n_calls, args.chunk_size, args.repeat, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
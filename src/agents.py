@@ -1,32 +1,53 @@
+import asyncio
 import json
-import re
-from typing import TypedDict, Optional, List, Dict, Any
-from dotenv import load_dotenv, find_dotenv
 import os
-
-# LANGCHAIN
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import TypedDict, Optional, List, Dict, Any, Iterator, AsyncIterator, Tuple
 
 # MAS 
+from .history import HistoryManager, estimate_tokens
+from .llm import get_llm
 from .memory import Memory
-from .prompts import ROUTER_PROMPT, DECOMPOZER_PROMPT, CODE_ASSISTANT_PROMPT, STUDY_ASSISTANT_PROMPT, PLANNER_PROMPT
-from .utils import AVAILABLE_TOOLS, apply_tools, get_available_tools, run_tool, extract_tool_calls
+from .prerouter import PreRouter
+from .prompts import ROUTER_PROMPT, BATCH_ROUTER_PROMPT, DECOMPOZER_PROMPT, CODE_ASSISTANT_PROMPT, STUDY_ASSISTANT_PROMPT, PLANNER_PROMPT
+from .utils import (
+    AVAILABLE_TOOLS,
+    ToolCallStream,
+    apply_tools,
+    get_available_tools,
+    run_tool,
+    extract_tool_calls,
+    tool_cache_counters,
+)
 
 
 # === MODEL INITIALIZATION ===
-load_dotenv(find_dotenv(usecwd=True))
+# The client is created by get_llm() on first use (see llm.py); BASE_LLM stays
+# available as a lazily resolved module attribute.
+def __getattr__(name: str):
+    if name == "BASE_LLM":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-BASE_URL = os.getenv("LITELLM_BASE_URL", "http://a6k2.dgx:34000/v1")
-API_KEY = os.getenv("LITELLM_API_KEY", "")
-MODEL_NAME = os.getenv("MODEL_NAME", "qwen3-32b")
+# === CHAINS ===
+def make_chain(template: str, input_variables: List[str], llm, static: Optional[Dict[str, str]] = None):
+    """
+    Build prompt | llm | StrOutputParser(). langchain_core is imported here
+    rather than at module level to keep importing the agents cheap.
+
+    static holds variables fixed for the chain's lifetime (e.g. the tool
+    list); they belong to the prompt's static prefix (see prompts.py).
+    """
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
 
-BASE_LLM = ChatOpenAI(
-        base_url=BASE_URL,
-        api_key=API_KEY,
-        model=MODEL_NAME
-    )
+    prompt = PromptTemplate(input_variables=input_variables, template=template, partial_variables=static or {})
+    return prompt | llm | StrOutputParser()
 
 
 # === STATE ===
@@ -37,18 +58,52 @@ class State(TypedDict):
     Attributes:
         query: Original user query.
         category: High-level category assigned by the router (e.g. academic, programming, planning, other).
-        memory: List of memory/profile notes relevant to the current query.
+        memory: Memory of the current user; agents built without a memory read it from here.
         execution_plan: Decomposed plan or list of subtasks for the query.
         agent_log: Per-agent logs of intermediate outputs and tool usage.
         final_answer: Final response to the user after all agents finish.
+        profile_notes: Profile notes dated within the time window of the query
+            (or the next upcoming events), used by the planner.
+        history_mode: How assistants pick past exchanges ("recent" or "relevant").
     """
 
     query: str
     category: Optional[str]
-    memory: List[Dict]
+    memory: Any
     execution_plan: Optional[str]
     agent_log: Dict[str, str]
     final_answer: Optional[str]
+    profile_notes: Optional[List[Any]]
+    history_mode: Optional[str]
+
+
+# === HISTORY ===
+def load_history(memory: Optional[Memory], query: str, mode: str = "recent", n: int = 3) -> str:
+    """
+    Format past exchanges for a prompt.
+
+    Args:
+        memory: Memory to read from; no memory gives an empty history.
+        query: Current user query, used by the "relevant" mode.
+        mode: "recent" takes the last n exchanges, "relevant" the n exchanges
+            most similar to the query (needs Memory(..., semantic=True)).
+        n: Number of exchanges.
+
+    Returns:
+        "User: ...\nAssistant: ..." blocks joined by newlines.
+    """
+    if not memory:
+        return ""
+
+    if mode == "relevant":
+        history = memory.search_history(query, n=n)
+    else:
+        history = memory.get_history(n=n)
+
+    return "\n".join([
+        f"User: {msg.get('user', '')}\nAssistant: {msg.get('assistant', '')}"
+        for msg in history or []
+    ])
 
 
 # === ROUTER AGENT ===
@@ -58,35 +113,308 @@ class RouterAgent:
 
     Uses ROUTER_PROMPT to map the query to one of the predefined categories
     (e.g. academic, programming, planning, other) and stores the decision in state["category"].
-    """
 
-    def __init__(self, llm=BASE_LLM):
-        self.llm = llm
-        prompt = PromptTemplate(
-            input_variables=["query"],
-            template=ROUTER_PROMPT
-            )
+    An optional PreRouter is consulted first; when it is confident the LLM call
+    is skipped. LLM decisions can be appended to decision_log (JSONL) to train
+    the pre-router (see train_prerouter.py).
+
+    route_batch/aroute_batch classify many queries with one LLM call per
+    batch (see BATCH_ROUTER_PROMPT). Batches are filled up to the token
+    budget of context_tokens (env ROUTER_CONTEXT_TOKENS) and at most
+    max_batch queries. The item limit halves when many answers of a batch
+    fail to parse and grows back while batches parse cleanly. Queries whose
+    line is missing or unreadable are routed again one by one. A state whose
+    category is already set (e.g. by batch routing) is not routed again.
+    """
 
-        self.chain = prompt | self.llm | StrOutputParser()
+    OUTPUT_TOKENS_PER_ITEM = 8
+
+    def __init__(self, llm=None, prerouter: Optional[PreRouter] = None, decision_log: Optional[str] = None,
+                 context_tokens: Optional[int] = None, max_batch: int = 64):
+        self.llm = llm if llm is not None else get_llm()
+        self.prerouter = prerouter
+        self.decision_log = Path(decision_log) if decision_log else None
+        self._log_lock = threading.Lock()
+        self.chain = make_chain(ROUTER_PROMPT, ["query"], self.llm)
+        self.batch_chain = make_chain(BATCH_ROUTER_PROMPT, ["queries"], self.llm)
+
+        self.context_tokens = context_tokens or int(os.getenv("ROUTER_CONTEXT_TOKENS", "8192"))
+        self.max_batch = max_batch
+        self._batch_limit = max_batch
+        self._batch_lock = threading.Lock()
+        self._batch_counters = {"batches": 0, "batched_queries": 0, "prerouted": 0, "rerouted": 0}
+
+    def _prerouted(self, state: State) -> bool:
+        if state.get("category"):
+            return True
+        if self.prerouter is None:
+            return False
+        decision = self.prerouter.classify(state["query"])
+        if decision is None:
+            return False
+
+        state["category"] = decision.category
+        state.setdefault("agent_log", {})
+        state["agent_log"]["router"] = f"classification: {decision.category}"
+        state["agent_log"]["router_source"] = f"{decision.source} ({decision.confidence:.2f})"
+        return True
 
     def run(self, state: State) -> State:
+        if self._prerouted(state):
+            return state
+
+        start = time.perf_counter()
         result = self.chain.invoke({"query": state["query"]})
 
-        text = result.lower()
-        if "academic" in text:
-            state["category"] = "academic"
-        elif "programming" in text:
-            state["category"] = "programming"
-        elif "planning" in text:
-            state["category"] = "planning"
-        else:
-            state["category"] = "other"
+        return self._apply(state, result, time.perf_counter() - start)
+
+    async def arun(self, state: State) -> State:
+        if self._prerouted(state):
+            return state
+
+        start = time.perf_counter()
+        result = await self.chain.ainvoke({"query": state["query"]})
+
+        return await self._logged(self._apply, state, result, time.perf_counter() - start)
+
+    async def _logged(self, func, *args):
+        # func may append to the decision log: file I/O stays off the event loop
+        if self.decision_log is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _apply(self, state: State, result: str, latency: float) -> State:
+        state["category"] = parse_category(result)
 
         state.setdefault("agent_log", {})
         state["agent_log"]["router"] = result
+        state["agent_log"]["router_source"] = "llm"
+
+        if self.prerouter is not None:
+            self.prerouter.observe_llm_latency(latency)
+        if self.decision_log is not None:
+            self._log_decision(state["query"], state["category"], result, latency)
 
         return state
 
+    # --- batch routing ---
+    def batch_stats(self) -> Dict[str, int]:
+        with self._batch_lock:
+            return {**self._batch_counters, "batch_limit": self._batch_limit}
+
+    def _prerouted_batch(self, queries: List[str]) -> Tuple[List[Optional[Dict[str, str]]], deque]:
+        """
+        Decisions of the pre-router (None where it abstains) and the positions left for the LLM.
+        """
+        routes: List[Optional[Dict[str, str]]] = [None] * len(queries)
+        for i, query in enumerate(queries):
+            decision = self.prerouter.classify(query) if self.prerouter is not None else None
+            if decision is not None:
+                routes[i] = {
+                    "category": decision.category,
+                    "raw": f"classification: {decision.category}",
+                    "source": f"{decision.source} ({decision.confidence:.2f})",
+                }
+        pending = deque(i for i, route in enumerate(routes) if route is None)
+        with self._batch_lock:
+            self._batch_counters["prerouted"] += len(queries) - len(pending)
+        return routes, pending
+
+    def _next_batch(self, queries: List[str], pending: deque) -> List[int]:
+        """
+        Take the next batch off pending: as many queries as fit the context
+        window, at most the current item limit (and always at least one).
+        """
+        budget = self.context_tokens - estimate_tokens(BATCH_ROUTER_PROMPT)
+        batch: List[int] = []
+        while pending and len(batch) < self._batch_limit:
+            cost = estimate_tokens(batch_line(0, queries[pending[0]])) + self.OUTPUT_TOKENS_PER_ITEM
+            if batch and cost > budget:
+                break
+            budget -= cost
+            batch.append(pending.popleft())
+        return batch
+
+    def _adapt(self, size: int, failed: int):
+        if failed > max(1, size // 5):
+            self._batch_limit = max(1, self._batch_limit // 2)
+        elif not failed:
+            self._batch_limit = min(self.max_batch, self._batch_limit + max(1, self.max_batch // 8))
+
+    def _apply_batch(self, queries: List[str], batch: List[int], raw: str, latency: float,
+                     routes: List[Optional[Dict[str, str]]]) -> List[int]:
+        """
+        Store the parsed decisions of a batch answer; return the positions to route again.
+        """
+        parsed = parse_batch_categories(raw)
+        failed = []
+        for number, i in enumerate(batch, start=1):
+            category = parsed.get(number)
+            if category is None:
+                failed.append(i)
+                continue
+            routes[i] = {"category": category, "raw": f"classification: {category}", "source": "llm_batch"}
+            if self.decision_log is not None:
+                self._log_decision(queries[i], category, routes[i]["raw"], latency / len(batch))
+
+        with self._batch_lock:
+            self._batch_counters["batches"] += 1
+            self._batch_counters["batched_queries"] += len(batch)
+            self._batch_counters["rerouted"] += len(failed)
+            self._adapt(len(batch), len(failed))
+        return failed
+
+    def _apply_single(self, query: str, raw: str, latency: float) -> Dict[str, str]:
+        category = parse_category(raw)
+        if self.decision_log is not None:
+            self._log_decision(query, category, raw, latency)
+        return {"category": category, "raw": raw, "source": "llm"}
+
+    def route_batch(self, queries: List[str]) -> List[Dict[str, str]]:
+        """
+        Route many queries with as few LLM calls as possible.
+
+        Returns:
+            One {"category", "raw", "source"} per query, in input order; source
+            is the pre-router's, "llm_batch" or "llm" (routed on its own).
+        """
+        routes, pending = self._prerouted_batch(queries)
+        retry: List[int] = []
+        while pending:
+            batch = self._next_batch(queries, pending)
+            start = time.perf_counter()
+            raw = self.batch_chain.invoke({"queries": format_batch([queries[i] for i in batch])})
+            retry += self._apply_batch(queries, batch, raw, time.perf_counter() - start, routes)
+
+        if retry:
+            start = time.perf_counter()
+            answers = self.chain.batch([{"query": queries[i]} for i in retry])
+            latency = time.perf_counter() - start
+            for i, raw in zip(retry, answers):
+                routes[i] = self._apply_single(queries[i], raw, latency)
+        return routes
+
+    async def aroute_batch(self, queries: List[str]) -> List[Dict[str, str]]:
+        """
+        Async variant of route_batch.
+        """
+        routes, pending = self._prerouted_batch(queries)
+        retry: List[int] = []
+        while pending:
+            batch = self._next_batch(queries, pending)
+            start = time.perf_counter()
+            raw = await self.batch_chain.ainvoke({"queries": format_batch([queries[i] for i in batch])})
+            retry += await self._logged(self._apply_batch, queries, batch, raw, time.perf_counter() - start, routes)
+
+        if retry:
+            start = time.perf_counter()
+            answers = await self.chain.abatch([{"query": queries[i]} for i in retry])
+            latency = time.perf_counter() - start
+            for i, raw in zip(retry, answers):
+                routes[i] = await self._logged(self._apply_single, queries[i], raw, latency)
+        return routes
+
+    def _log_decision(self, query: str, category: str, raw: str, latency: float):
+        record = {"query": query, "category": category, "router": raw, "latency_s": round(latency, 4)}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._log_lock, open(self.decision_log, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def parse_category(text: str) -> str:
+    """
+    Map raw router output to one of the known categories.
+    """
+    text = text.lower()
+    if "academic" in text:
+        return "academic"
+    elif "programming" in text:
+        return "programming"
+    elif "planning" in text:
+        return "planning"
+    else:
+        return "other"
+
+
+BATCH_LINE = re.compile(r"^\W*(\d+)\W+(?:classification:\s*)?(academic|programming|planning|other)\b", re.IGNORECASE)
+
+
+def batch_line(number: int, query: str) -> str:
+    # one line per query: the numbering must stay unambiguous
+    return f"{number}. {' '.join(query.split())}"
+
+
+def format_batch(queries: List[str]) -> str:
+    return "\n".join(batch_line(number, query) for number, query in enumerate(queries, start=1))
+
+
+def parse_batch_categories(text: str) -> Dict[int, str]:
+    """
+    Map the "<number>: <category>" lines of a batch router answer to
+    {number: category}; unreadable lines are skipped.
+    """
+    categories: Dict[int, str] = {}
+    for line in text.splitlines():
+        match = BATCH_LINE.match(line)
+        if match:
+            categories.setdefault(int(match.group(1)), match.group(2).lower())
+    return categories
+
+
+ROUTER_LINE = re.compile(
+    r"^\W*(?:classification\W+)?(academic|programming|planning|other)\W*$", re.IGNORECASE | re.MULTILINE
+)
+
+
+def router_output_valid(text: str) -> bool:
+    """
+    True when the output has a `classification: <category>` line (or a line
+    that is just a category) and it names the category parse_category reads.
+    Anything else ("another", an explanation, a hedge between categories) is
+    junk that parse_category would silently turn into a category.
+    """
+    match = ROUTER_LINE.search(text)
+    return match is not None and match.group(1).lower() == parse_category(text)
+
+
+SUBTASK_LINE = re.compile(r"^\s*(\d+)[.)]\s+(.+?)\s*$")
+
+
+def parse_subtasks(execution_plan: str) -> List[str]:
+    """
+    Extract the numbered items of a decomposer plan ("Subtasks:\n1. ...\n2. ...").
+    Indented lines following an item are appended to it.
+    """
+    subtasks: List[str] = []
+    for line in execution_plan.splitlines():
+        match = SUBTASK_LINE.match(line)
+        if match:
+            subtasks.append(match.group(2))
+        elif subtasks and line[:1] in (" ", "\t") and line.strip():
+            subtasks[-1] += " " + line.strip()
+    return subtasks
+
+
+def plan_valid(execution_plan: str) -> bool:
+    """
+    True when a decomposer plan contains at least one numbered subtask.
+    """
+    return bool(parse_subtasks(execution_plan))
+
+
+def group_subtasks(subtasks: List[str], max_groups: int) -> List[List[str]]:
+    """
+    Split subtasks into at most max_groups contiguous groups of near-equal size.
+    """
+    groups = min(len(subtasks), max(1, max_groups))
+    size, extra = divmod(len(subtasks), groups) if groups else (0, 0)
+    result, start = [], 0
+    for i in range(groups):
+        end = start + size + (1 if i < extra else 0)
+        result.append(subtasks[start:end])
+        start = end
+    return result
+
 
 # === DECOMPOZER AGENT ===
 class DecompozerAgent:
@@ -96,26 +424,124 @@ class DecompozerAgent:
     Uses DECOMPOZER_PROMPT to generate a structured plan stored in state["execution_plan"].
     """
 
-    def __init__(self, llm=BASE_LLM):
-        self.llm = llm
+    def __init__(self, llm=None):
+        self.llm = llm if llm is not None else get_llm()
 
-        prompt = PromptTemplate(
-            input_variables=["query"],
-            template=DECOMPOZER_PROMPT
-            )
-
-        self.chain = prompt | self.llm | StrOutputParser()
+        self.chain = make_chain(DECOMPOZER_PROMPT, ["query"], self.llm)
 
     def run(self, state: State) -> State:
         execution_plan = self.chain.invoke({"query": state["query"]})
+
+        return self._apply(state, execution_plan)
+
+    async def arun(self, state: State) -> State:
+        execution_plan = await self.chain.ainvoke({"query": state["query"]})
+
+        return self._apply(state, execution_plan)
+
+    def _apply(self, state: State, execution_plan: str) -> State:
         state["execution_plan"] = execution_plan
         state["agent_log"]["execution_plan"] = execution_plan
 
         return state
 
 
+# === ASSISTANT BASE ===
+class AssistantAgent:
+    """
+    Shared execution logic of the answering agents (code, study, planner).
+
+    Subclasses build self.chain and implement _inputs(state). The processed
+    answer is stored in state["agent_log"][log_key], the executed tool calls
+    in state["agent_log"][log_key + "_tools"] and their tool cache hits/misses
+    in state["agent_log"][log_key + "_tools_cache"].
+
+    With a history_manager the history block is kept within the agent's token
+    budget and its statistics (tokens used and saved) are stored in
+    state["agent_log"][log_key + "_history"].
+
+    run/arun generate the whole answer at once; stream/astream yield the answer
+    piece by piece as tokens arrive, executing tool calls as soon as their
+    marker is complete, and update the state once the stream ends.
+    """
+
+    log_key: str = ""
+    memory: Optional[Memory] = None
+    history_mode: str = "recent"
+    history_manager: Optional[HistoryManager] = None
+
+    def _history(self, state: State) -> str:
+        memory = self.memory or state.get("memory")
+        mode = state.get("history_mode") or self.history_mode
+        if self.history_manager is None:
+            return load_history(memory, state["query"], mode)
+
+        history, stats = self.history_manager.build(memory, state["query"], self.log_key, mode)
+        state["agent_log"][f"{self.log_key}_history"] = stats
+        return history
+
+    def _inputs(self, state: State) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def run(self, state: State) -> State:
+        result = self.chain.invoke(self._inputs(state))
+        processed, executed = apply_tools(result)
+
+        return self._apply(state, processed, executed)
+
+    async def arun(self, state: State) -> State:
+        # memory/history reads and writes and tool calls block, keep them off the event loop
+        inputs = await asyncio.to_thread(self._inputs, state)
+        result = await self.chain.ainvoke(inputs)
+        processed, executed = await asyncio.to_thread(apply_tools, result)
+
+        return await asyncio.to_thread(self._apply, state, processed, executed)
+
+    def stream(self, state: State) -> Iterator[str]:
+        tool_stream = ToolCallStream()
+        pieces: List[str] = []
+
+        for chunk in self.chain.stream(self._inputs(state)):
+            text = tool_stream.feed(chunk)
+            if text:
+                pieces.append(text)
+                yield text
+
+        text = tool_stream.finish()
+        if text:
+            pieces.append(text)
+            yield text
+
+        self._apply(state, "".join(pieces), tool_stream.executed)
+
+    async def astream(self, state: State) -> AsyncIterator[str]:
+        tool_stream = ToolCallStream()
+        pieces: List[str] = []
+
+        inputs = await asyncio.to_thread(self._inputs, state)
+        async for chunk in self.chain.astream(inputs):
+            text = await tool_stream.afeed(chunk)
+            if text:
+                pieces.append(text)
+                yield text
+
+        text = await tool_stream.afinish()
+        if text:
+            pieces.append(text)
+            yield text
+
+        await asyncio.to_thread(self._apply, state, "".join(pieces), tool_stream.executed)
+
+    def _apply(self, state: State, processed: str, executed: List[Dict[str, Any]]) -> State:
+        state["agent_log"][self.log_key] = processed
+        state["agent_log"][f"{self.log_key}_tools"] = executed
+        state["agent_log"][f"{self.log_key}_tools_cache"] = tool_cache_counters(executed)
+
+        return state
+
+
 # === CODE ASSISTANT AGENT ===
-class CodeAssistantAgent:
+class CodeAssistantAgent(AssistantAgent):
     """
     Agent that provides coding help based on the query and prepared execution plan.
 
@@ -123,45 +549,32 @@ class CodeAssistantAgent:
     which are executed and inlined into the final response.
     """
 
-    def __init__(self, llm=BASE_LLM, memory: Memory = None):
-        self.llm = llm
+    log_key = "code_assistant"
+
+    def __init__(self, llm=None, memory: Memory = None, history_mode: str = "recent",
+                 history_manager: Optional[HistoryManager] = None):
+        self.llm = llm if llm is not None else get_llm()
         self.memory = memory
+        self.history_mode = history_mode
+        self.history_manager = history_manager
         
-        prompt = PromptTemplate(
-            input_variables=["query", "execution_plan", "history", "tools"],
-            template=CODE_ASSISTANT_PROMPT
+        self.chain = make_chain(
+            CODE_ASSISTANT_PROMPT, ["query", "execution_plan", "history"], self.llm, static={"tools": get_available_tools()}
         )
-        self.chain = prompt | self.llm | StrOutputParser()
 
-    def run(self, state: State) -> State:
+    def _inputs(self, state: State) -> Dict[str, Any]:
         execution_plan = state.get("execution_plan", "")
-        tools = get_available_tools()
+        history_str = self._history(state)
         
-        history_str = ""
-        if self.memory:
-            history = self.memory.get_history(n=3) or []
-            history_str = "\n".join([
-                f"User: {msg.get('user', '')}\nAssistant: {msg.get('assistant', '')}"
-                for msg in history
-            ])
-        
-        result = self.chain.invoke({
+        return {
             "query": state["query"],
             "execution_plan": execution_plan,
             "history": history_str,
-            "tools": tools
-        })
-
-        processed, executed = apply_tools(result)
-
-        state["agent_log"]["code_assistant"] = processed
-        state["agent_log"]["code_assistant_tools"] = executed
-
-        return state
+        }
 
 
 # === STUDY ASSISTANT AGENT ===
-class StudyAssistantAgent:
+class StudyAssistantAgent(AssistantAgent):
     """
     Agent that helps with academic/theoretical questions using user profile memory.
 
@@ -169,91 +582,69 @@ class StudyAssistantAgent:
     are detected and executed, with results inlined into the final output.
     """
 
-    def __init__(self, llm=BASE_LLM, memory: Memory = None):
-        self.llm = llm
+    log_key = "study_assistant"
+
+    def __init__(self, llm=None, memory: Memory = None, history_mode: str = "recent",
+                 history_manager: Optional[HistoryManager] = None):
+        self.llm = llm if llm is not None else get_llm()
         self.memory = memory
+        self.history_mode = history_mode
+        self.history_manager = history_manager
 
-        prompt = PromptTemplate(
-            input_variables=["query", "memory", "history", "tools"],
-            template=(STUDY_ASSISTANT_PROMPT)
+        self.chain = make_chain(
+            STUDY_ASSISTANT_PROMPT, ["query", "memory", "history"], self.llm, static={"tools": get_available_tools()}
         )
 
-        self.chain = prompt | self.llm | StrOutputParser()
-
-    def run(self, state: State) -> State:
+    def _inputs(self, state: State) -> Dict[str, Any]:
         profile_info = []
-        history_str = ""
-        
-        if self.memory:
-            profile_info = self.memory.get_from_profile(state["query"]) or []
-            history = self.memory.get_history(n=3) or []
-            history_str = "\n".join([
-                f"User: {msg.get('user', '')}\nAssistant: {msg.get('assistant', '')}"
-                for msg in history
-            ])
+        history_str = self._history(state)
+
+        memory = self.memory or state.get("memory")
+        if memory:
+            profile_info = memory.get_from_profile(state["query"]) or []
 
         memory_str = "\n".join([
             f"{n.get('title','')}: {n.get('content','')}" for n in profile_info
         ])
 
-        tools = get_available_tools()
-
-        result = self.chain.invoke({
+        return {
             "query": state["query"],
             "memory": memory_str,
             "history": history_str,
-            "tools": tools
-        })
-
-        processed, executed = apply_tools(result)
-
-        state["agent_log"]["study_assistant"] = processed
-        state["agent_log"]["study_assistant_tools"] = executed
-
-
-        return state
+        }
 
 
 # === PLANNER AGENT ===
-class PlannerAgent:
+class PlannerAgent(AssistantAgent):
     """
     Agent that creates schedules and step-by-step plans based on the user query.
 
     Uses PLANNER_PROMPT and optional memory context about upcoming events or constraints.
     """
-    def __init__(self, llm=BASE_LLM, profile_notes=None, memory: Memory = None):
-        self.llm = llm
+
+    log_key = "planner"
+
+    def __init__(self, llm=None, profile_notes=None, memory: Memory = None, history_mode: str = "recent",
+                 history_manager: Optional[HistoryManager] = None):
+        self.llm = llm if llm is not None else get_llm()
         self.profile_notes = profile_notes
         self.memory = memory
+        self.history_mode = history_mode
+        self.history_manager = history_manager
 
-        prompt = PromptTemplate(
-            input_variables=["query", "history", "tools"],
-            partial_variables={"profile_notes": str(self.profile_notes)},
-            template=PLANNER_PROMPT
+        self.chain = make_chain(
+            PLANNER_PROMPT, ["query", "profile_notes", "history"], self.llm, static={"tools": get_available_tools()}
         )
 
-        self.chain = prompt | self.llm | StrOutputParser()
-
-    def run(self, state: State) -> State:
-        tools = get_available_tools()
-        
-        history_str = ""
-        if self.memory:
-            history = self.memory.get_history(n=3) or []
-            history_str = "\n".join([
-                f"User: {msg.get('user', '')}\nAssistant: {msg.get('assistant', '')}"
-                for msg in history
-            ])
+    def _inputs(self, state: State) -> Dict[str, Any]:
+        history_str = self._history(state)
         
-        result = self.chain.invoke({
+        profile_notes = state.get("profile_notes")
+        if profile_notes is None:
+            profile_notes = self.profile_notes
+
+        return {
             "query": state["query"],
+            "profile_notes": str(profile_notes),
             "history": history_str,
-            "tools": tools
-        })
-
-        processed, executed = apply_tools(result)
-
-        state["agent_log"]["planner"] = processed
-        state["agent_log"]["planner_tools"] = executed
-
-        return state
\ No newline at end of file
+        }
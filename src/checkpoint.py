@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+
+def run_key(memory_path: Path, query: str, history_mode: str) -> str:
+    """
+    Default run id: retrying the same query against the same memory finds the
+    checkpoints of the failed attempt.
+    """
+    text = f"{Path(memory_path).resolve()}\n{history_mode}\n{query}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+_SQLITE_SAVER_CLASS = None
+
+
+def sqlite_checkpointer(path: str):
+    """
+    LangGraph checkpointer storing checkpoints in a SQLite file (needs
+    langgraph-checkpoint-sqlite).
+
+    SqliteSaver only implements the sync interface; the async methods used by
+    ainvoke/astream run the sync ones in a worker thread, so one saver serves
+    both kinds of runs.
+    """
+    global _SQLITE_SAVER_CLASS
+    if _SQLITE_SAVER_CLASS is None:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        class ThreadedSqliteSaver(SqliteSaver):
+            async def aget_tuple(self, config):
+                return await asyncio.to_thread(self.get_tuple, config)
+
+            async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[Any]:
+                items = await asyncio.to_thread(
+                    lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+                )
+                for item in items:
+                    yield item
+
+            async def aput(self, config, checkpoint, metadata, new_versions):
+                return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+            async def aput_writes(self, config, writes, task_id, task_path=""):
+                return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+            async def adelete_thread(self, thread_id):
+                return await asyncio.to_thread(self.delete_thread, thread_id)
+
+        _SQLITE_SAVER_CLASS = ThreadedSqliteSaver
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return _SQLITE_SAVER_CLASS(conn)
+
+
+def make_checkpointer(spec: Optional[str]):
+    """
+    Build a checkpointer from a short spec:
+        "" / None         no checkpointing
+        "memory"          in-process (survives failed attempts, not restarts)
+        "sqlite:<path>"   SQLite file (survives restarts)
+    """
+    if not spec:
+        return None
+    if spec == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return InMemorySaver()
+    if spec.startswith("sqlite:"):
+        return sqlite_checkpointer(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown checkpointer '{spec}', expected 'memory' or 'sqlite:<path>'")
+
@@ -0,0 +1,231 @@
+import bisect
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        (
+            ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+            ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+            ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec"),
+        ),
+        start=1,
+    )
+    for name in names
+}
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+_MONTH = r"(?P<{0}>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_DAY = r"(?P<{0}>\d{{1,2}})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s+(?P<{0}>\d{{4}}))?"
+
+# "January 6th[, 2026]" or "6 January [2026]", optionally followed by a range
+# end: "-8", "to 9th", "- January 9th", "until 9 February"
+_DATE_PATTERN = re.compile(
+    r"\b(?:" + _MONTH.format("month") + r"\s+" + _DAY.format("day")
+    + r"|" + _DAY.format("day2") + r"\s+(?:of\s+)?" + _MONTH.format("month2") + r")" + _YEAR.format("year")
+    + r"(?:\s*(?:-|–|to|until|through|till)\s*(?:"
+    + _MONTH.format("end_month") + r"\s+" + _DAY.format("end_day")
+    + r"|" + _DAY.format("end_day2") + r"(?:\s+(?:of\s+)?" + _MONTH.format("end_month2") + r")?"
+    + r")" + _YEAR.format("end_year") + r")?\b",
+    re.IGNORECASE,
+)
+_ISO_PATTERN = re.compile(
+    r"\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})"
+    r"(?:\s*(?:–|to|until|through|till|/|\.\.)\s*(?P<end_year>\d{4})-(?P<end_month>\d{2})-(?P<end_day>\d{2}))?\b"
+)
+_MONTH_ONLY_PATTERN = re.compile(r"\b(?:in|during|for|of|throughout)\s+" + _MONTH.format("month") + r"\b", re.IGNORECASE)
+
+
+# === DATE PARSING ===
+def resolve(month: int, day: int, year: Optional[int], today: date) -> Optional[date]:
+    """
+    Date for month/day; without a year, its next occurrence on or after today
+    (notes and queries are resolved the same way, so they line up).
+    """
+    try:
+        if year is not None:
+            return date(year, month, day)
+        for candidate_year in range(today.year, today.year + 5):
+            try:
+                candidate = date(candidate_year, month, day)
+            except ValueError:
+                continue  # February 29th outside a leap year
+            if candidate >= today:
+                return candidate
+    except ValueError:
+        pass
+    return None
+
+
+def parse_dates(text: str, today: Optional[date] = None) -> List[Tuple[date, date]]:
+    """
+    Dates and date ranges mentioned in text, as inclusive (start, end) pairs.
+
+    Understands "January 6th", "6 Jan", "January 6-8", "Jan 30 to Feb 2",
+    optional years ("January 6th, 2027") and ISO dates ("2027-01-06",
+    "2027-01-06 to 2027-01-09"). Dates without a year resolve to their next
+    occurrence on or after today.
+    """
+    today = today or date.today()
+    spans: List[Tuple[date, date]] = []
+
+    for match in _ISO_PATTERN.finditer(text):
+        try:
+            start = date(int(match["year"]), int(match["month"]), int(match["day"]))
+            end = start
+            if match["end_year"]:
+                end = date(int(match["end_year"]), int(match["end_month"]), int(match["end_day"]))
+        except ValueError:
+            continue
+        spans.append((start, max(start, end)))
+
+    for match in _DATE_PATTERN.finditer(text):
+        month = MONTHS[(match["month"] or match["month2"]).lower()]
+        day = int(match["day"] or match["day2"])
+        year = int(match["year"]) if match["year"] else None
+        end_month_name = match["end_month"] or match["end_month2"]
+        end_month = MONTHS[end_month_name.lower()] if end_month_name else month
+        if year is None and match["end_year"]:
+            # "January 6-8, 2027", "December 30 - January 2, 2027"
+            year = int(match["end_year"]) - (end_month < month)
+        start = resolve(month, day, year, today)
+        if start is None:
+            continue
+
+        end = start
+        end_day = match["end_day"] or match["end_day2"]
+        if end_day:
+            end_year = int(match["end_year"]) if match["end_year"] else start.year
+            end = resolve(end_month, int(end_day), end_year, today)
+            if end is not None and end < start and not match["end_year"]:
+                # "December 30 to January 2"
+                end = resolve(end_month, int(end_day), end_year + 1, today)
+            if end is None or end < start:
+                end = start
+        spans.append((start, end))
+    return spans
+
+
+def month_span(month: int, today: date) -> Tuple[date, date]:
+    """
+    The next (or current) occurrence of a whole month.
+    """
+    year = today.year if month >= today.month else today.year + 1
+    first = date(year, month, 1)
+    last = (date(year + (month == 12), month % 12 + 1, 1)) - timedelta(days=1)
+    return first, last
+
+
+def query_window(query: str, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """
+    Time window a query asks about, as an inclusive (start, end) pair, or
+    None when it names none. Explicit dates and ranges win; otherwise
+    "in January", "today", "tomorrow", "this/next week", "this weekend",
+    "this/next month" and weekday names ("on Friday") are recognised.
+    """
+    today = today or date.today()
+    spans = parse_dates(query, today)
+    if spans:
+        return min(start for start, _ in spans), max(end for _, end in spans)
+
+    text = query.lower()
+    months = [MONTHS[m["month"].lower()] for m in _MONTH_ONLY_PATTERN.finditer(text)]
+    if months:
+        windows = [month_span(month, today) for month in months]
+        return min(start for start, _ in windows), max(end for _, end in windows)
+
+    week_start = today - timedelta(days=today.weekday())
+    if "today" in text or "tonight" in text:
+        return today, today
+    if "tomorrow" in text:
+        return today + timedelta(days=1), today + timedelta(days=1)
+    if "next week" in text:
+        return week_start + timedelta(days=7), week_start + timedelta(days=13)
+    if "weekend" in text:
+        saturday = week_start + timedelta(days=5)
+        if "next weekend" in text:
+            saturday += timedelta(days=7)
+        return max(today, saturday), saturday + timedelta(days=1)
+    if "this week" in text:
+        return today, week_start + timedelta(days=6)
+    if "next month" in text:
+        first = date(today.year + (today.month == 12), today.month % 12 + 1, 1)
+        return month_span(first.month, first)
+    if "this month" in text:
+        return today, month_span(today.month, today)[1]
+    for number, weekday in enumerate(WEEKDAYS):
+        if re.search(rf"\b{weekday}\b", text):
+            day = today + timedelta(days=(number - today.weekday()) % 7)
+            return day, day
+    return None
+
+
+# === CALENDAR INDEX ===
+class EventCalendar:
+    """
+    Dated profile notes in an interval index sorted by start date.
+
+    Every date or range a note mentions becomes one interval pointing at the
+    note's position in Memory.profile_notes(), so the calendar, like the
+    BM25 index, is brought up to date by adding only the notes it has not
+    seen. Overlap queries bisect the sorted starts: O(log n) plus the
+    intervals starting within the longest interval's length before the window.
+    """
+
+    def __init__(self, today: Optional[date] = None):
+        self.today = today or date.today()
+        self.n_notes = 0
+        self._starts: List[date] = []
+        self._intervals: List[Tuple[date, date, int]] = []
+        self._longest = timedelta(0)
+
+    def __len__(self) -> int:
+        return self.n_notes
+
+    def add(self, note: Dict) -> int:
+        """
+        Index the dates of a note and return its id (its position).
+        """
+        note_id = self.n_notes
+        text = f"{note.get('title', '')} {note.get('content', '')}"
+        for start, end in set(parse_dates(text, self.today)):
+            position = bisect.bisect_right(self._starts, start)
+            self._starts.insert(position, start)
+            self._intervals.insert(position, (start, end, note_id))
+            self._longest = max(self._longest, end - start)
+        self.n_notes += 1
+        return note_id
+
+    def overlapping(self, start: date, end: date) -> List[Tuple[date, date, int]]:
+        """
+        Intervals (start, end, note_id) overlapping [start, end], by start date.
+        """
+        low = bisect.bisect_left(self._starts, start - self._longest)
+        high = bisect.bisect_right(self._starts, end)
+        return [interval for interval in self._intervals[low:high] if interval[1] >= start]
+
+    def upcoming(self, n: int) -> List[Tuple[date, date, int]]:
+        """
+        The first n intervals that have not ended before today.
+        """
+        result = []
+        low = bisect.bisect_left(self._starts, self.today - self._longest)
+        for interval in self._intervals[low:]:
+            if interval[1] >= self.today:
+                result.append(interval)
+                if len(result) == n:
+                    break
+        return result
+
+    def note_ids(self, intervals: List[Tuple[date, date, int]]) -> List[int]:
+        """
+        Distinct note ids of intervals, in date order.
+        """
+        seen: Dict[int, None] = {}
+        for _, _, note_id in intervals:
+            seen.setdefault(note_id, None)
+        return list(seen)
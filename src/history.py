@@ -0,0 +1,253 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .storage import JsonlLog
+
+
+# Prompt token budgets for the history block of each assistant.
+DEFAULT_HISTORY_BUDGETS = {
+    "code_assistant": 1500,
+    "study_assistant": 1000,
+    "planner": 600,
+}
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+CODE_BLOCK = re.compile(r"```.*?```", re.DOTALL)
+RESULT_MARKER = re.compile(r"\[Result: [^\]]*\]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about 4 characters per token for English text and code).
+    """
+    return (len(text) + 3) // 4
+
+
+def format_exchange(entry: Dict) -> str:
+    return f"User: {entry.get('user', '')}\nAssistant: {entry.get('assistant', '')}"
+
+
+def cut_to_tokens(text: str, tokens: int) -> str:
+    """
+    text, or its beginning followed by "..." so that it fits in tokens.
+    """
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, 4 * tokens - 3)] + "..."
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join(RESULT_MARKER.sub("", CODE_BLOCK.sub(" [code] ", text)).split())
+    sentence = SENTENCE_END.split(text, 1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 3].rstrip() + "..."
+    return sentence
+
+
+def extractive_summary(entry: Dict) -> str:
+    """
+    One-line summary of an exchange: the first sentence of the question and of
+    the answer, code blocks and tool results left out. Needs no LLM call.
+    """
+    user = _first_sentence(entry.get("user", ""), 120)
+    assistant = _first_sentence(entry.get("assistant", ""), 200)
+    return f"User asked: {user} | Assistant answered: {assistant}"
+
+
+def llm_summarizer(llm) -> Callable[[Dict], str]:
+    """
+    Summarizer that asks llm for a one-sentence summary of each exchange.
+    Each exchange is summarized once; the result is stored (see SummaryStore).
+    """
+    from .agents import make_chain
+    from .prompts import HISTORY_SUMMARY_PROMPT
+
+    chain = make_chain(HISTORY_SUMMARY_PROMPT, ["user", "assistant"], llm)
+
+    def summarize(entry: Dict) -> str:
+        summary = chain.invoke({"user": entry.get("user", ""), "assistant": entry.get("assistant", "")})
+        return " ".join(summary.split())
+
+    return summarize
+
+
+# === SUMMARY STORE ===
+class SummaryStore:
+    """
+    Persisted summaries of past exchanges, keyed by a hash of the exchange, in
+    an append-only "<memory stem>.summaries.jsonl" next to the memory file.
+    The stored history itself is never modified.
+    """
+
+    def __init__(self, path: Path):
+        self.log = JsonlLog(path)
+        self._summaries = {record["key"]: record["summary"] for record in self.log.read_all()}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(entry: Dict) -> str:
+        return hashlib.sha1(format_exchange(entry).encode("utf-8")).hexdigest()
+
+    def peek(self, entry: Dict) -> Optional[str]:
+        """
+        The stored summary of entry, or None without computing one.
+        """
+        return self._summaries.get(self.key(entry))
+
+    def get(self, entry: Dict, summarize: Callable[[Dict], str]) -> Tuple[str, bool]:
+        """
+        Return (summary, computed): the stored summary of entry, or a new one
+        made with summarize and appended to the log.
+        """
+        key = self.key(entry)
+        summary = self._summaries.get(key)
+        if summary is not None:
+            return summary, False
+
+        summary = summarize(entry)
+        with self._lock:
+            if key not in self._summaries:
+                self._summaries[key] = summary
+                self.log.append({"key": key, "summary": summary})
+        return summary, True
+
+
+# === HISTORY MANAGER ===
+class HistoryManager:
+    """
+    Builds the history block of an assistant prompt within a token budget.
+
+    The newest exchanges are kept verbatim as long as they fit (the latest
+    one is cut to the budget rather than left out); older ones are replaced
+    by their stored summary; whatever still does not fit is dropped.
+    Summaries are computed once per exchange and persisted, so a request only
+    summarizes turns it has not seen before, and only when the budget left
+    can hold a summary line (summaries are cut to summary_tokens), so no
+    summary is computed just to be dropped.
+
+    The summary stores of at most MEMORY_MAX_OPEN (default 1024) memories
+    stay loaded, like the memories themselves (see get_memory); the least
+    recently used one is dropped.
+
+    Args:
+        budgets: Token budget per agent (log_key); others get default_budget.
+        default_budget: Budget for agents not listed in budgets.
+        summarizer: Function entry -> summary; defaults to extractive_summary.
+        n: Number of past exchanges considered.
+        summary_tokens: Longest summary line; enough for an extractive summary.
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 1000,
+        summarizer: Optional[Callable[[Dict], str]] = None,
+        n: int = 3,
+        summary_tokens: int = 96,
+    ):
+        self.budgets = {**DEFAULT_HISTORY_BUDGETS, **(budgets or {})}
+        self.default_budget = default_budget
+        self.summarizer = summarizer or extractive_summary
+        self.n = n
+        self.summary_tokens = summary_tokens
+
+        self._lock = threading.Lock()
+        self._stores: "OrderedDict[Path, SummaryStore]" = OrderedDict()
+        self._counters = {"requests": 0, "tokens": 0, "full_tokens": 0, "summaries_computed": 0, "summaries_reused": 0}
+
+    def _store(self, memory) -> SummaryStore:
+        path = memory.path.with_name(f"{memory.path.stem}.summaries.jsonl")
+        with self._lock:
+            store = self._stores.get(path)
+            if store is None:
+                store = self._stores[path] = SummaryStore(path)
+                max_open = int(os.getenv("MEMORY_MAX_OPEN", "1024"))
+                while len(self._stores) > max(max_open, 1):
+                    self._stores.popitem(last=False)
+            else:
+                self._stores.move_to_end(path)
+            return store
+
+    def build(self, memory, query: str, agent: str, mode: str = "recent") -> Tuple[str, Dict[str, int]]:
+        """
+        Returns:
+            The history text for the prompt and its statistics: "budget",
+            "tokens" used, "full_tokens" (all n exchanges verbatim),
+            "saved_tokens", "verbatim", "summarized" and "dropped" exchanges.
+        """
+        budget = self.budgets.get(agent, self.default_budget)
+        stats = {"budget": budget, "tokens": 0, "full_tokens": 0, "saved_tokens": 0,
+                 "verbatim": 0, "summarized": 0, "dropped": 0}
+        if not memory:
+            return "", stats
+
+        if mode == "relevant":
+            entries = memory.search_history(query, n=self.n)
+        else:
+            entries = memory.get_history(n=self.n)
+        entries = entries or []
+
+        blocks = [format_exchange(entry) for entry in entries]
+        stats["full_tokens"] = estimate_tokens("\n".join(blocks))
+        if budget <= 0:
+            stats["dropped"] = len(entries)
+            stats["saved_tokens"] = stats["full_tokens"]
+            return "", stats
+
+        parts: List[str] = []
+        used = computed = 0
+        for entry, block in zip(reversed(entries), reversed(blocks)):
+            tokens = estimate_tokens(block)
+            if not stats["summarized"] and used + tokens <= budget:
+                parts.append(block)
+                used += tokens
+                stats["verbatim"] += 1
+                continue
+            if not parts:
+                # the latest exchange matters most: keep its beginning, reserving
+                # a quarter of the budget for summaries of the older ones
+                block = cut_to_tokens(block, budget - budget // 4)
+                parts.append(block)
+                used += estimate_tokens(block)
+                stats["verbatim"] += 1
+                continue
+
+            store = self._store(memory)
+            summary = store.peek(entry)
+            if summary is None:
+                if used + self.summary_tokens > budget:
+                    stats["dropped"] += 1
+                    continue
+                summary, is_new = store.get(entry, self.summarizer)
+                computed += is_new
+            line = cut_to_tokens(f"Earlier: {summary}", self.summary_tokens)
+            tokens = estimate_tokens(line)
+            if used + tokens > budget:
+                stats["dropped"] += 1
+                continue
+            parts.append(line)
+            used += tokens
+            stats["summarized"] += 1
+
+        text = "\n".join(reversed(parts))
+        stats["tokens"] = estimate_tokens(text)
+        stats["saved_tokens"] = max(0, stats["full_tokens"] - stats["tokens"])
+
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["tokens"] += stats["tokens"]
+            self._counters["full_tokens"] += stats["full_tokens"]
+            self._counters["summaries_computed"] += computed
+            self._counters["summaries_reused"] += stats["summarized"] - computed
+        return text, stats
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["saved_tokens"] = counters["full_tokens"] - counters["tokens"]
+        return counters
@@ -0,0 +1,54 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+DEFAULT_BASE_URL = "http://a6k2.dgx:34000/v1"
+DEFAULT_MODEL_NAME = "qwen3-32b"
+
+_ENV_LOADED = False
+_CLIENTS: Dict[Tuple[str, str, str, str], Any] = {}
+_LOCK = threading.Lock()
+
+
+def load_env():
+    """
+    Load .env (searched from the working directory upwards) once per process.
+    """
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    from dotenv import load_dotenv, find_dotenv
+
+    load_dotenv(find_dotenv(usecwd=True))
+    _ENV_LOADED = True
+
+
+def get_llm(model: Optional[str] = None, base_url: Optional[str] = None, api_key: Optional[str] = None, **kwargs):
+    """
+    Return the chat model client for model, creating it on first use.
+
+    langchain_openai is imported and .env is read only here, so importing the
+    agents costs nothing until an LLM is actually needed. Clients are shared
+    per (base_url, api_key, model, kwargs), which also shares their HTTP connection pools.
+
+    Args:
+        model: Model name; defaults to MODEL_NAME from the environment.
+        base_url: OpenAI-compatible endpoint; defaults to LITELLM_BASE_URL.
+        api_key: Defaults to LITELLM_API_KEY.
+        **kwargs: Extra ChatOpenAI parameters (temperature, timeout, ...).
+    """
+    with _LOCK:
+        load_env()
+        base_url = base_url or os.getenv("LITELLM_BASE_URL", DEFAULT_BASE_URL)
+        api_key = api_key or os.getenv("LITELLM_API_KEY", "")
+        model = model or os.getenv("MODEL_NAME", DEFAULT_MODEL_NAME)
+
+        key = (base_url, api_key, model, repr(sorted(kwargs.items())))
+        client = _CLIENTS.get(key)
+        if client is None:
+            from langchain_openai import ChatOpenAI
+
+            client = ChatOpenAI(base_url=base_url, api_key=api_key, model=model, **kwargs)
+            _CLIENTS[key] = client
+        return client
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from .tracing import annotate
+
+
+CACHE_FILE_NAME = "llm_cache.sqlite3"
+# generation_info flag of the responses served from an LLMResponseCache
+CACHE_HIT = "llm_cache_hit"
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Hash of the rendered prompt and the model string. LangChain's llm_string
+    already contains the model name and all generation parameters.
+    """
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _encode(generations: Sequence[Generation]) -> str:
+    return json.dumps(
+        [{"chat": isinstance(g, ChatGeneration), "text": g.text} for g in generations],
+        ensure_ascii=False,
+    )
+
+
+def _as_hits(generations: Sequence[Generation]) -> Sequence[Generation]:
+    # copies, so callers (LangChain zeroes the cost of cached messages) never touch the stored ones
+    return [
+        generation.model_copy(update={"generation_info": {**(generation.generation_info or {}), CACHE_HIT: True}})
+        for generation in generations
+    ]
+
+
+def is_cache_hit(response) -> bool:
+    """
+    True when an LLMResult (as passed to callbacks) was served from an LLMResponseCache.
+    """
+    generations = [generation for batch in response.generations for generation in batch]
+    return bool(generations) and all((g.generation_info or {}).get(CACHE_HIT) for g in generations)
+
+
+def _decode(value: str) -> Sequence[Generation]:
+    return [
+        ChatGeneration(message=AIMessage(content=item["text"])) if item["chat"] else Generation(text=item["text"])
+        for item in json.loads(value)
+    ]
+
+
+# === RESPONSE CACHE ===
+class LLMResponseCache(BaseCache):
+    """
+    Two-tier LangChain cache for chat model responses.
+
+    Tier 1 is an in-process LRU of max_entries items; tier 2 is an optional
+    SQLite file bounded by max_disk_bytes, evicting least recently used rows.
+    Entries older than ttl seconds are ignored and removed on lookup.
+    Returned responses carry CACHE_HIT in their generation_info (see is_cache_hit).
+
+    Attach it to a model with with_cache(llm, cache) to enable it for one agent.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Tuple[float, Sequence[Generation]]]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed);
+                """
+            )
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                created, generations = entry
+                if not self._expired(created, now):
+                    self._lru.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    annotate(llm_cache_hits=1)
+                    return _as_hits(generations)
+                del self._lru[key]
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value, created, size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created, size = row
+                    if not self._expired(created, now):
+                        with self._conn:
+                            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                        generations = _decode(value)
+                        self._remember(key, created, generations)
+                        self._counters["disk_hits"] += 1
+                        annotate(llm_cache_hits=1)
+                        return _as_hits(generations)
+                    with self._conn:
+                        self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._disk_bytes -= size
+
+            self._counters["misses"] += 1
+            annotate(llm_cache_misses=1)
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, return_val)
+            self._counters["stores"] += 1
+
+            if self._conn is not None:
+                value = _encode(return_val)
+                size = len(value.encode("utf-8"))
+                with self._conn:
+                    old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                        (key, value, now, now, size),
+                    )
+                self._disk_bytes += size - (old[0] if old else 0)
+                self._evict_disk()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache")
+                self._disk_bytes = 0
+
+    def _remember(self, key: str, created: float, generations: Sequence[Generation]):
+        self._lru[key] = (created, generations)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            with self._conn:
+                for key, size in rows:
+                    if self._disk_bytes <= self.max_disk_bytes:
+                        break
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._disk_bytes -= size
+                    self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            counters["hit_rate"] = (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+            counters["memory_entries"] = len(self._lru)
+            counters["disk_bytes"] = self._disk_bytes
+            return counters
+
+
+def with_cache(llm, cache: Optional[BaseCache]):
+    """
+    Return a copy of a LangChain chat model that uses cache (shares its HTTP
+    clients). Models that are not pydantic chat models are returned as they are.
+    """
+    if cache is None or not hasattr(llm, "model_copy"):
+        return llm
+    return llm.model_copy(update={"cache": cache})
+
+
+_CACHES: Dict[Optional[str], LLMResponseCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_llm_cache(directory: Optional[str] = None) -> Optional[LLMResponseCache]:
+    """
+    Process-wide response cache, or None unless LLM_CACHE=1.
+
+    The SQLite file is LLM_CACHE_PATH, else CACHE_FILE_NAME in directory (the
+    orchestrator passes its memory directory); an empty LLM_CACHE_PATH or no
+    directory keeps the cache in memory only. LLM_CACHE_TTL sets the TTL in seconds.
+    """
+    if os.getenv("LLM_CACHE", "0") in ("", "0"):
+        return None
+    path = os.getenv("LLM_CACHE_PATH")
+    if path is None and directory is not None:
+        path = str(Path(directory) / CACHE_FILE_NAME)
+    path = path or None
+
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            ttl = os.getenv("LLM_CACHE_TTL")
+            cache = _CACHES[path] = LLMResponseCache(path=path, ttl=float(ttl) if ttl else 7 * 24 * 3600)
+        return cache
@@ -1,24 +1,52 @@
-from typing import TypedDict, Optional, Dict, Any, List
-from langgraph.graph import StateGraph, END
-
-from .memory import Memory
+import asyncio
+import operator
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, TypedDict, Optional, Dict, Any, List, Tuple, Iterator, AsyncIterator
+
+from .checkpoint import make_checkpointer, run_key
+from .history import HistoryManager
+from .memory import get_memory, shard_path
+from .models import ModelConfig, escalating_model
+from .prerouter import PreRouter
+from .resilience import CallPolicy, resilient_model
+from .tracing import annotate, get_tracer, token_usage_handler
 from .agents import (
     RouterAgent,
     DecompozerAgent,
     CodeAssistantAgent,
     StudyAssistantAgent,
-    PlannerAgent
+    PlannerAgent,
+    group_subtasks,
+    parse_subtasks,
+    plan_valid,
+    router_output_valid,
 )
 
+# LangGraph and LangChain are imported where they are first needed (building
+# agents and the graph), so `from src.main import run` stays cheap.
+if TYPE_CHECKING:
+    from langchain_core.caches import BaseCache
+    from langchain_core.runnables import RunnableLambda
+
 # === STATE ===
+# State holds only plain data so a checkpointer can serialize it. Per-run
+# handles travel in config["configurable"]: "memory" (the Memory of the run)
+# and "stream" (terminal nodes stream their answer), see run_config().
 class State(TypedDict):
     query: str
     category: Optional[str]
-    memory: Any
     execution_plan: Optional[str]
     agent_log: Dict[str, str]
     final_answer: Optional[str]
     profile_notes: Optional[List[Any]]
+    history_mode: Optional[str]
+    # fan-out mode: the group of subtasks one worker handles, and the merged worker results
+    subtask: Optional[Dict[str, Any]]
+    subtask_results: Annotated[List[Dict[str, Any]], operator.add]
 
 
 def choose_agent(state: State) -> str:
@@ -33,67 +61,294 @@ def choose_agent(state: State) -> str:
     return "other"
 
 
-# === NODES ===
-def router_node(state: State) -> State:
-    router = RouterAgent()
-
-    return router.run(state)
+DEFAULT_MEMORY_PATH = "src/memory.json"
+
+
+# === AGENTS ===
+# Agents whose output depends only on the query, so their LLM responses may be cached.
+CACHED_AGENTS = ("router", "decompozer")
+# Output checks deciding whether an agent with several model tiers escalates to the next one.
+ESCALATION_CHECKS = {"router": router_output_valid, "decompozer": plan_valid}
+
+
+def build_agents(
+    llm=None,
+    prerouter: Optional[PreRouter] = None,
+    router_log_path: Optional[str] = None,
+    llm_cache: Optional["BaseCache"] = None,
+    cached_agents: Tuple[str, ...] = CACHED_AGENTS,
+    history_manager: Optional[HistoryManager] = None,
+    models: Optional[ModelConfig] = None,
+    call_policies: Optional[Dict[str, Optional[CallPolicy]]] = None,
+) -> Dict[str, Any]:
+    """
+    Build one instance of every agent. Agents hold no per-request data, so
+    the same pool serves all requests; memory and profile notes come from state.
+
+    Args:
+        llm: Chat model shared by all agents; defaults to get_llm(). Agents
+            with a call policy retry on their own, so a model passed here
+            should be built with max_retries=0.
+        prerouter: Local classifier tried before the LLM router.
+        router_log_path: JSONL file receiving LLM routing decisions (training data for the pre-router).
+        llm_cache: Response cache used by the agents listed in cached_agents.
+        cached_agents: Agents whose LLM calls go through llm_cache. The
+            assistants depend on history and memory, so they are not cached by default.
+        history_manager: Keeps the assistants' history within per-agent token
+            budgets; defaults to HistoryManager() with DEFAULT_HISTORY_BUDGETS.
+        models: Model tiers per agent (see ModelConfig); llm backs the
+            "default" tier. Agents with several tiers listed in
+            ESCALATION_CHECKS move to the next tier when a response fails the check.
+        call_policies: Deadline, retry and hedging policy per agent (see
+            resilient_model); agents not listed use CallPolicy.from_env(),
+            agents mapped to None call their model directly.
+    """
+    from .llm import get_llm
+    from .llm_cache import with_cache
+
+    call_policies = call_policies or {}
+
+    def policy_for(name: str) -> Optional[CallPolicy]:
+        return call_policies[name] if name in call_policies else CallPolicy.from_env(name)
+
+    def base_llm(name: str):
+        if llm is not None:
+            return llm
+        # resilient_model retries; the client under it must not retry each attempt again
+        return get_llm(max_retries=0) if policy_for(name) is not None else get_llm()
+
+    def wrapped(name: str, model):
+        if name in cached_agents:
+            model = with_cache(model, llm_cache)
+        policy = policy_for(name)
+        return resilient_model(name, model, policy) if policy is not None else model
+
+    def llm_for(name: str):
+        if models is None:
+            return wrapped(name, base_llm(name))
+        tiers = [(tier, wrapped(name, models.llm(tier, base_llm(name)))) for tier in models.tiers_for(name)]
+        if len(tiers) == 1 or name not in ESCALATION_CHECKS:
+            # no check to escalate on: the first tier answers
+            return tiers[0][1]
+        return escalating_model(name, tiers, ESCALATION_CHECKS[name])
+
+    history_manager = history_manager or HistoryManager()
+
+    return {
+        "router": RouterAgent(llm=llm_for("router"), prerouter=prerouter, decision_log=router_log_path),
+        "decompozer": DecompozerAgent(llm=llm_for("decompozer")),
+        "code_assistant": CodeAssistantAgent(llm=llm_for("code_assistant"), history_manager=history_manager),
+        "study_assistant": StudyAssistantAgent(llm=llm_for("study_assistant"), history_manager=history_manager),
+        "planner": PlannerAgent(llm=llm_for("planner"), history_manager=history_manager),
+    }
 
 
-def decompozer_node(state: State) -> State:
-    decompozer = DecompozerAgent()
+# === NODES ===
+def _runtime(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return (config or {}).get("configurable") or {}
 
-    return decompozer.run(state)
 
+def _agent_state(state: State, config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The state as the agents see it, with the run's memory attached.
+    """
+    return {**state, "memory": _runtime(config).get("memory")}
 
-def code_assistant_node(state: State) -> State:
-    memory = state["memory"]
-    code_assistant = CodeAssistantAgent(memory=memory)
-    result = code_assistant.run(state)
-    result["final_answer"] = result["agent_log"]["code_assistant"]
 
+def _node_update(result: Dict[str, Any]) -> Dict[str, Any]:
+    result.pop("memory", None)
     return result
 
 
-def study_assistant_node(state: State) -> State:
-    memory = state["memory"]
-    study_assistant = StudyAssistantAgent(memory=memory)
-
-    result = study_assistant.run(state)
-    result["final_answer"] = result["agent_log"]["study_assistant"]
+# terminal node -> (agent, agent_log key holding the final answer)
+TERMINAL_NODES = {
+    "code_assistant": ("code_assistant", "code_assistant"),
+    "study_assistant": ("study_assistant", "study_assistant"),
+    "planner": ("planner", "planner"),
+    "other": ("study_assistant", "study_assistant"),
+}
+
+
+def make_node(name: str, agent, answer_key: Optional[str] = None) -> "RunnableLambda":
+    """
+    Wrap an agent as a graph node with both a sync (run) and an async (arun)
+    implementation, so the same compiled graph serves invoke and ainvoke.
+
+    Terminal nodes (with an answer_key) stream their answer through the
+    LangGraph custom stream writer when the run config sets "stream".
+
+    Every call runs inside a "node.<name>" trace span (see tracing.py).
+    """
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.config import get_stream_writer
+
+    tracer = get_tracer()
+
+    def node(state: State, config) -> State:
+        state = _agent_state(state, config)
+        with tracer.span(f"node.{name}", "node"):
+            if answer_key and _runtime(config).get("stream"):
+                writer = get_stream_writer()
+                for piece in agent.stream(state):
+                    writer(piece)
+                result = state
+            else:
+                result = agent.run(state)
+        if answer_key:
+            result["final_answer"] = result["agent_log"][answer_key]
+
+        return _node_update(result)
+
+    async def anode(state: State, config) -> State:
+        state = _agent_state(state, config)
+        with tracer.span(f"node.{name}", "node"):
+            if answer_key and _runtime(config).get("stream"):
+                writer = get_stream_writer()
+                async for piece in agent.astream(state):
+                    writer(piece)
+                result = state
+            else:
+                result = await agent.arun(state)
+        if answer_key:
+            result["final_answer"] = result["agent_log"][answer_key]
+
+        return _node_update(result)
+
+    return RunnableLambda(node, afunc=anode, name=name)
+
+
+def make_nodes(agents: Dict[str, Any]) -> Dict[str, "RunnableLambda"]:
+    """
+    Create graph nodes bound to a pool of pre-built agents.
+    """
+    nodes = {
+        "router": make_node("router", agents["router"]),
+        "decompozer": make_node("decompozer", agents["decompozer"]),
+    }
+    for name, (agent_name, answer_key) in TERMINAL_NODES.items():
+        nodes[name] = make_node(name, agents[agent_name], answer_key)
+
+    return nodes
+
+
+# === SUBTASK FAN-OUT ===
+SUBTASK_PLAN = """Work only on these subtasks; the other subtasks of the plan are handled separately:
+{subtasks}
+
+Full plan for context:
+{execution_plan}"""
+
+
+def make_fanout(agent, max_parallel: int):
+    """
+    Nodes for answering the decomposer's subtasks in parallel.
+
+    Returns (fan_out, worker, reduce): fan_out is the conditional edge after
+    the decomposer; it sends at most max_parallel groups of consecutive
+    subtasks to worker nodes (LangGraph Send), or goes to the regular
+    code_assistant node when the plan has fewer than two subtasks. Each worker
+    runs the code assistant on its group; reduce merges the partial answers
+    in plan order.
+    """
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.config import get_stream_writer
+    from langgraph.types import Send
+
+    tracer = get_tracer()
+
+    def fan_out(state: State):
+        subtasks = parse_subtasks(state.get("execution_plan") or "")
+        if len(subtasks) < 2:
+            return "code_assistant"
+
+        sends, number = [], 1
+        for index, group in enumerate(group_subtasks(subtasks, max_parallel)):
+            numbered = [f"{number + i}. {text}" for i, text in enumerate(group)]
+            number += len(group)
+            sends.append(Send("subtask_worker", {**state, "subtask": {"index": index, "subtasks": numbered}}))
+        return sends
+
+    def worker_state(state: State, config) -> Dict[str, Any]:
+        subtask = state["subtask"]
+        return {
+            **_agent_state(state, config),
+            "execution_plan": SUBTASK_PLAN.format(
+                subtasks="\n".join(subtask["subtasks"]),
+                execution_plan=state.get("execution_plan") or "",
+            ),
+            "agent_log": {},
+        }
 
-    return result
+    def worker_result(state: State, result: State) -> Dict[str, Any]:
+        log = result["agent_log"]
+        return {
+            "subtask_results": [
+                {
+                    "index": state["subtask"]["index"],
+                    "subtasks": state["subtask"]["subtasks"],
+                    "answer": log.get(agent.log_key, ""),
+                    "tools": log.get(f"{agent.log_key}_tools", []),
+                }
+            ]
+        }
 
+    def worker(state: State, config) -> Dict[str, Any]:
+        with tracer.span("node.subtask_worker", "node", index=state["subtask"]["index"]):
+            return worker_result(state, agent.run(worker_state(state, config)))
 
-def planner_node(state: State) -> State:
-    memory = state["memory"]
-    profile_notes = state["profile_notes"]
-    planner = PlannerAgent(profile_notes=profile_notes, memory=memory)
-    result = planner.run(state)
-    result["final_answer"] = result["agent_log"]["planner"]
+    async def aworker(state: State, config) -> Dict[str, Any]:
+        with tracer.span("node.subtask_worker", "node", index=state["subtask"]["index"]):
+            return worker_result(state, await agent.arun(worker_state(state, config)))
 
-    return result
+    def reduce(state: State, config) -> Dict[str, Any]:
+        # only changed keys are returned: returning subtask_results would append them again
+        with tracer.span("node.subtask_reduce", "node"):
+            results = sorted(state["subtask_results"], key=lambda r: r["index"])
+            answer = "\n\n".join(r["answer"] for r in results)
 
+            agent_log = dict(state["agent_log"])
+            agent_log[agent.log_key] = answer
+            agent_log[f"{agent.log_key}_tools"] = [call for r in results for call in r["tools"]]
+            agent_log[f"{agent.log_key}_subtasks"] = [r["subtasks"] for r in results]
 
-def reserve_node(state: State) -> State:
-    memory = state["memory"]
-    reserve_agent = StudyAssistantAgent(memory=memory)
+            if _runtime(config).get("stream"):
+                get_stream_writer()(answer)
 
-    result = reserve_agent.run(state)
-    result["final_answer"] = result["agent_log"]["study_assistant"]
+        return {"agent_log": agent_log, "final_answer": answer}
 
-    return result
+    return (
+        fan_out,
+        RunnableLambda(worker, afunc=aworker, name="subtask_worker"),
+        RunnableLambda(reduce, name="subtask_reduce"),
+    )
 
 
-def build_graph():
+def build_graph(
+    agents: Optional[Dict[str, Any]] = None,
+    fanout: bool = False,
+    max_parallel: int = 4,
+    checkpointer=None,
+):
+    """
+    Compile the agent graph.
+
+    Args:
+        agents: Agent pool from build_agents(); built with defaults if omitted.
+        fanout: Answer the decomposer's subtasks with parallel code-assistant
+            workers whose answers are merged (see make_fanout), instead of one
+            code-assistant call for the whole plan.
+        max_parallel: Maximum number of parallel workers in fan-out mode.
+        checkpointer: LangGraph checkpointer (see checkpoint.make_checkpointer).
+            State is saved after every node under the run's thread_id, so a
+            failed run can be resumed without repeating the finished nodes.
+    """
+    from langgraph.graph import StateGraph, END
+
+    agents = agents or build_agents()
     workflow = StateGraph(State)
 
-    workflow.add_node("router", router_node)
-    workflow.add_node("decompozer", decompozer_node)
-    workflow.add_node("code_assistant", code_assistant_node)
-    workflow.add_node("study_assistant", study_assistant_node)
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("other", reserve_node)
+    for name, node in make_nodes(agents).items():
+        workflow.add_node(name, node)
 
     workflow.set_entry_point("router")
 
@@ -108,34 +363,536 @@ def build_graph():
         }
     )
 
-    workflow.add_edge("decompozer", "code_assistant")
+    if fanout:
+        fan_out, worker, reduce = make_fanout(agents["code_assistant"], max_parallel)
+        workflow.add_node("subtask_worker", worker)
+        workflow.add_node("subtask_reduce", reduce)
+        workflow.add_conditional_edges("decompozer", fan_out, ["code_assistant", "subtask_worker"])
+        workflow.add_edge("subtask_worker", "subtask_reduce")
+        workflow.add_edge("subtask_reduce", END)
+    else:
+        workflow.add_edge("decompozer", "code_assistant")
 
     workflow.add_edge("study_assistant", END)
     workflow.add_edge("code_assistant", END)
     workflow.add_edge("planner", END)
     workflow.add_edge("other", END)
 
-    return workflow.compile()  
-    
-
-def run(query: str, memory_path: str = "src/memory.json"):
-    memory = Memory(memory_path)
-    profile_notes = memory.get_from_profile("event")
-
-    state: State = {
-        "query": query,
-        "category": None,
-        "memory": memory,
-        "execution_plan": None,
-        "agent_log": {},
-        "final_answer": None,
-        "profile_notes": profile_notes,
-    }
+    return workflow.compile(checkpointer=checkpointer)
+
+
+# === ORCHESTRATOR ===
+class RunInProgress(RuntimeError):
+    """An explicit run_id was passed while a run with that id is still going."""
+
+
+class Orchestrator:
+    """
+    Long-lived session object: builds the agent pool and compiles the graph
+    once, then serves any number of queries. Per-request data (profile
+    notes, history mode) is injected through the initial state, the memory
+    handle through the run config.
+
+    Runs with a user_id read and write that user's own memory shard,
+    "<shard_dir>/<user_id>/memory.json" (shard_dir defaults to "users" next
+    to memory_path); runs without one use memory_path. Writes to a shard are
+    serialized by its file lock, so different users never contend.
+
+    With fanout=True, programming plans are answered by up to max_parallel
+    code-assistant workers in parallel (see build_graph).
+
+    With a checkpointer the graph state is saved after every node under the
+    run id, so retrying a failed run reuses the outputs of the nodes that
+    had already finished (router, decomposer, ...).
+    """
+
+    def __init__(
+        self,
+        memory_path: str = DEFAULT_MEMORY_PATH,
+        llm=None,
+        agents: Optional[Dict[str, Any]] = None,
+        prerouter: Optional[PreRouter] = None,
+        router_log_path: Optional[str] = None,
+        llm_cache: Optional["BaseCache"] = None,
+        fanout: bool = False,
+        max_parallel: int = 4,
+        shard_dir: Optional[str] = None,
+        checkpointer=None,
+        models: Optional[ModelConfig] = None,
+    ):
+        self.memory_path = memory_path
+        self.shard_dir = shard_dir or str(Path(memory_path).parent / "users")
+        self.llm_cache = llm_cache
+        self.agents = agents or build_agents(
+            llm,
+            prerouter=prerouter,
+            router_log_path=router_log_path,
+            llm_cache=llm_cache,
+            models=models,
+        )
+        self.checkpointer = checkpointer
+        self.graph = build_graph(self.agents, fanout=fanout, max_parallel=max_parallel, checkpointer=checkpointer)
+
+        self._lock = threading.Lock()
+        self._active_runs = set()
+        self._counters = {"runs": 0, "resumed": 0}
+
+    def initial_state(self, query: str, memory, history_mode: str = "recent",
+                      route: Optional[Dict[str, str]] = None) -> State:
+        """
+        Fresh graph input. A route (from RouterAgent.route_batch) presets the
+        category, so the router node passes the query on without routing it.
+        """
+        return {
+            "query": query,
+            "category": route["category"] if route else None,
+            "execution_plan": None,
+            "agent_log": {"router": route["raw"], "router_source": route["source"]} if route else {},
+            "final_answer": None,
+            "profile_notes": memory.events_for(query),
+            "history_mode": history_mode,
+            "subtask": None,
+            "subtask_results": [],
+        }
 
-    graph = build_graph()
+    def _memory(self, memory_path: Optional[str], history_mode: str, user_id: Optional[str] = None):
+        if user_id is not None and memory_path is None:
+            memory_path = str(shard_path(self.shard_dir, user_id))
+        return get_memory(memory_path or self.memory_path, semantic=history_mode == "relevant")
+
+    def _save_history(self, memory, query: str, result: State):
+        memory.update_history(query, result["final_answer"] or "")
+
+    def run_config(self, memory, run_id: Optional[str] = None, stream: bool = False) -> Dict[str, Any]:
+        """
+        Graph run config: the run's memory and stream flag, the checkpoint
+        thread (run_id) and, with tracing enabled, the LLM token usage callback.
+        """
+        configurable = {"memory": memory, "stream": stream}
+        if run_id is not None:
+            configurable["thread_id"] = run_id
+        config = {"configurable": configurable}
+        if get_tracer().enabled:
+            config["callbacks"] = [token_usage_handler()]
+        return config
+
+    # --- checkpointed runs ---
+    @contextmanager
+    def _run_id(self, run_id: Optional[str], query: str, memory, history_mode: str) -> Iterator[Optional[str]]:
+        """
+        Reserve the checkpoint thread of a run for its duration. Without an
+        explicit run_id the thread is derived from query, memory and history
+        mode (see checkpoint.run_key); a concurrent duplicate of a running
+        query then gets a thread of its own.
+        """
+        if self.checkpointer is None:
+            yield None
+            return
+
+        explicit = run_id is not None
+        run_id = run_id if explicit else run_key(memory.path, query, history_mode)
+        with self._lock:
+            if run_id in self._active_runs:
+                if explicit:
+                    raise RunInProgress(f"Run {run_id} is already in progress")
+                run_id = f"{run_id}:{uuid.uuid4().hex[:8]}"
+            self._active_runs.add(run_id)
+        try:
+            yield run_id
+        finally:
+            with self._lock:
+                self._active_runs.discard(run_id)
+
+    def _resume_or_start(self, snapshot, query: str, memory, history_mode: str,
+                         route: Optional[Dict[str, str]] = None) -> Tuple[Optional[State], bool]:
+        """
+        Returns (graph input, stale): None continues the unfinished checkpointed
+        run of the same query; otherwise a fresh initial state, and whether
+        leftover checkpoints of the thread must be dropped first.
+        """
+        with self._lock:
+            self._counters["runs"] += 1
+            if snapshot is not None and snapshot.next and snapshot.values.get("query") == query:
+                self._counters["resumed"] += 1
+                annotate(resumed_runs=1)
+                return None, False
+        stale = snapshot is not None and bool(snapshot.values)
+        return self.initial_state(query, memory, history_mode, route), stale
+
+    def _graph_input(self, query: str, memory, history_mode: str, config: Dict[str, Any],
+                     route: Optional[Dict[str, str]] = None) -> Optional[State]:
+        run_id = config["configurable"].get("thread_id")
+        snapshot = self.graph.get_state(config) if run_id else None
+        state, stale = self._resume_or_start(snapshot, query, memory, history_mode, route)
+        if stale:
+            self.checkpointer.delete_thread(run_id)
+        return state
+
+    async def _agraph_input(self, query: str, memory, history_mode: str, config: Dict[str, Any],
+                            route: Optional[Dict[str, str]] = None) -> Optional[State]:
+        run_id = config["configurable"].get("thread_id")
+        snapshot = await self.graph.aget_state(config) if run_id else None
+        # the initial state reads the memory (profile notes, calendar): keep it off the event loop
+        state, stale = await asyncio.to_thread(self._resume_or_start, snapshot, query, memory, history_mode, route)
+        if stale:
+            await self.checkpointer.adelete_thread(run_id)
+        return state
+
+    def _finish_run(self, run_id: Optional[str]):
+        # a finished run is not resumed; its checkpoints are only kept on failure
+        if run_id is not None:
+            self.checkpointer.delete_thread(run_id)
+
+    async def _afinish_run(self, run_id: Optional[str]):
+        if run_id is not None:
+            await self.checkpointer.adelete_thread(run_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "active_checkpointed_runs": len(self._active_runs)}
+
+    # --- entry points ---
+    def run(
+        self,
+        query: str,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        route: Optional[Dict[str, str]] = None,
+    ) -> State:
+        """
+        Answer query. With a checkpointer, a run that failed earlier with the
+        same query (or the same explicit run_id) continues after its last
+        finished node instead of starting over. route presets the routing
+        decision (see run_batch).
+        """
+        with get_tracer().span("run", "run", query=query, history_mode=history_mode, user_id=user_id) as span:
+            memory = self._memory(memory_path, history_mode, user_id)
+            with self._run_id(run_id, query, memory, history_mode) as run_id:
+                config = self.run_config(memory, run_id)
+                state = self._graph_input(query, memory, history_mode, config, route)
+
+                result = self.graph.invoke(state, config=config)
+
+                self._save_history(memory, query, result)
+                self._finish_run(run_id)
+            if span is not None:
+                span.attributes["category"] = result.get("category")
+
+        return result
+
+    async def arun(
+        self,
+        query: str,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        route: Optional[Dict[str, str]] = None,
+    ) -> State:
+        with get_tracer().span("run", "run", query=query, history_mode=history_mode, user_id=user_id) as span:
+            # opening a memory may lock, migrate and recover its files
+            memory = await asyncio.to_thread(self._memory, memory_path, history_mode, user_id)
+            with self._run_id(run_id, query, memory, history_mode) as run_id:
+                config = self.run_config(memory, run_id)
+                state = await self._agraph_input(query, memory, history_mode, config, route)
+
+                result = await self.graph.ainvoke(state, config=config)
+
+                await asyncio.to_thread(self._save_history, memory, query, result)
+                await self._afinish_run(run_id)
+            if span is not None:
+                span.attributes["category"] = result.get("category")
+
+        return result
+
+    def stream_run(
+        self,
+        query: str,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Run the graph and yield the final answer piece by piece as the terminal
+        agent generates it. Tool calls are executed as soon as their marker is
+        complete; history is written once the answer is finished.
+
+        The generator returns the final state (available as the StopIteration
+        value or via `result = yield from orchestrator.stream_run(...)`).
+        A stream closed early keeps its checkpoints, so a retry resumes it.
+        """
+        with get_tracer().span("run", "run", query=query, history_mode=history_mode, user_id=user_id, stream=True):
+            memory = self._memory(memory_path, history_mode, user_id)
+            with self._run_id(run_id, query, memory, history_mode) as run_id:
+                config = self.run_config(memory, run_id, stream=True)
+                state = self._graph_input(query, memory, history_mode, config)
+
+                result = state
+                for mode, chunk in self.graph.stream(state, config=config, stream_mode=["custom", "values"]):
+                    if mode == "custom":
+                        yield chunk
+                    else:
+                        result = chunk
+
+                self._save_history(memory, query, result)
+                self._finish_run(run_id)
+
+        return result
+
+    async def astream_run(
+        self,
+        query: str,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Async variant of stream_run.
+        """
+        with get_tracer().span("run", "run", query=query, history_mode=history_mode, user_id=user_id, stream=True):
+            memory = await asyncio.to_thread(self._memory, memory_path, history_mode, user_id)
+            with self._run_id(run_id, query, memory, history_mode) as run_id:
+                config = self.run_config(memory, run_id, stream=True)
+                state = await self._agraph_input(query, memory, history_mode, config)
+
+                result = state
+                async for mode, chunk in self.graph.astream(state, config=config, stream_mode=["custom", "values"]):
+                    if mode == "custom":
+                        yield chunk
+                    else:
+                        result = chunk
+
+                await asyncio.to_thread(self._save_history, memory, query, result)
+                await self._afinish_run(run_id)
+
+    async def arun_batch(
+        self,
+        queries: List[str],
+        max_concurrency: int = 8,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_ids: Optional[List[Optional[str]]] = None,
+        limiter=None,
+        batch_routing: bool = False,
+    ) -> List[State]:
+        """
+        Run many queries concurrently, at most max_concurrency at a time.
+        user_ids, if given, holds the user of each query (see run). A shared
+        limiter (async context manager, e.g. a semaphore) replaces the
+        per-call max_concurrency limit.
+
+        With batch_routing, all queries are first classified together by
+        RouterAgent.aroute_batch (one LLM call per batch instead of one per
+        query); if that fails, every query is routed on its own as usual.
+
+        Results keep the order of queries. A failing query does not affect the
+        others: its result has final_answer None and the exception text in "error".
+        """
+        if user_ids is None:
+            user_ids = [None] * len(queries)
+        elif len(user_ids) != len(queries):
+            raise ValueError("user_ids must have one entry per query")
+        semaphore = limiter or asyncio.Semaphore(max_concurrency)
+
+        routes: List[Optional[Dict[str, str]]] = [None] * len(queries)
+        if batch_routing and queries:
+            with get_tracer().span("route_batch", "run", queries=len(queries)):
+                try:
+                    routes = await self.agents["router"].aroute_batch(queries)
+                except Exception:
+                    # the router nodes route the queries one by one instead
+                    annotate(route_batch_errors=1)
+
+        async def run_one(query: str, user_id: Optional[str], route: Optional[Dict[str, str]]) -> State:
+            try:
+                async with semaphore:
+                    return await self.arun(
+                        query, memory_path=memory_path, history_mode=history_mode, user_id=user_id, route=route
+                    )
+            except Exception as exc:
+                return {
+                    "query": query,
+                    "category": None,
+                    "execution_plan": None,
+                    "agent_log": {},
+                    "final_answer": None,
+                    "error": f"{type(exc).__name__}: {exc}",
+                }
+
+        return await asyncio.gather(
+            *(run_one(query, user_id, route) for query, user_id, route in zip(queries, user_ids, routes))
+        )
+
+    def run_batch(
+        self,
+        queries: List[str],
+        max_concurrency: int = 8,
+        memory_path: Optional[str] = None,
+        history_mode: str = "recent",
+        user_ids: Optional[List[Optional[str]]] = None,
+        batch_routing: bool = False,
+    ) -> List[State]:
+        """
+        Synchronous wrapper around arun_batch.
+        """
+        return run_sync(
+            self.arun_batch(queries, max_concurrency, memory_path, history_mode, user_ids, batch_routing=batch_routing)
+        )
+
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Process-wide event loop running in a daemon thread.
+
+    Async LLM clients (httpx connection pools) are bound to the loop they were
+    first used on, so sync entry points must keep using the same loop instead
+    of a fresh asyncio.run() loop per call.
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="mas-event-loop", daemon=True).start()
+        return _LOOP
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine to completion from sync code on the background loop. Works
+    also when an event loop is already running in this thread (e.g. inside a
+    Jupyter notebook).
+    """
+    loop = background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run_sync() called from the background loop, await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+_DEFAULT_ORCHESTRATOR: Optional[Orchestrator] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def build_orchestrator(llm=None, client_settings: Optional[Dict[str, Any]] = None) -> Orchestrator:
+    """
+    Orchestrator configured from the environment: local pre-router, LLM
+    response cache (LLM_CACHE=1, kept next to the memory file unless
+    LLM_CACHE_PATH says otherwise, see get_llm_cache), ROUTER_LOG_PATH, MEMORY_SHARD_DIR, SUBTASK_FANOUT=1 /
+    SUBTASK_MAX_PARALLEL for parallel subtask workers, CHECKPOINT
+    ("memory" or "sqlite:<path>") for resumable runs, and MODEL_CONFIG /
+    MODEL_<AGENT> for per-agent model tiers (see ModelConfig.load).
+    client_settings are passed to the clients of all tiers.
+    """
+    from .llm_cache import get_llm_cache
+
+    return Orchestrator(
+        llm=llm,
+        prerouter=PreRouter.load(),
+        router_log_path=os.getenv("ROUTER_LOG_PATH") or None,
+        llm_cache=get_llm_cache(str(Path(DEFAULT_MEMORY_PATH).parent)),
+        fanout=os.getenv("SUBTASK_FANOUT", "") not in ("", "0"),
+        max_parallel=int(os.getenv("SUBTASK_MAX_PARALLEL", "4")),
+        shard_dir=os.getenv("MEMORY_SHARD_DIR") or None,
+        checkpointer=make_checkpointer(os.getenv("CHECKPOINT")),
+        models=ModelConfig.load(client_settings=client_settings),
+    )
 
-    result = graph.invoke(state)
 
-    memory.update_history(query, result["final_answer"] or "")
+def get_orchestrator() -> Orchestrator:
+    """
+    Return the process-wide Orchestrator used by run() (see build_orchestrator).
+    """
+    global _DEFAULT_ORCHESTRATOR
+    if _DEFAULT_ORCHESTRATOR is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT_ORCHESTRATOR is None:
+                _DEFAULT_ORCHESTRATOR = build_orchestrator()
+    return _DEFAULT_ORCHESTRATOR
+
+
+def run(
+    query: str,
+    memory_path: Optional[str] = None,
+    history_mode: str = "recent",
+    user_id: Optional[str] = None,
+    run_id: Optional[str] = None,
+):
+    """
+    Run the agent graph on a single query.
+
+    Args:
+        query: User query.
+        memory_path: Path of the memory file (default "src/memory.json").
+        history_mode: "recent" to give assistants the last exchanges, or
+            "relevant" for the most similar ones (local semantic search).
+        user_id: Use this user's own memory shard instead of memory_path.
+        run_id: Checkpoint thread of the run (with CHECKPOINT set); a failed
+            run is resumed by calling run() again with the same query or run_id.
+    """
+    return get_orchestrator().run(query, memory_path=memory_path, history_mode=history_mode, user_id=user_id, run_id=run_id)
+
+
+async def arun(
+    query: str,
+    memory_path: Optional[str] = None,
+    history_mode: str = "recent",
+    user_id: Optional[str] = None,
+    run_id: Optional[str] = None,
+):
+    """
+    Async variant of run().
+    """
+    return await get_orchestrator().arun(query, memory_path=memory_path, history_mode=history_mode, user_id=user_id, run_id=run_id)
+
+
+def run_batch(
+    queries: List[str],
+    max_concurrency: int = 8,
+    memory_path: Optional[str] = None,
+    history_mode: str = "recent",
+    user_ids: Optional[List[Optional[str]]] = None,
+    batch_routing: bool = False,
+):
+    """
+    Run many queries concurrently under a semaphore of max_concurrency.
+    batch_routing classifies all queries up front with batched router calls
+    (for offline backlogs, see RouterAgent.route_batch).
+
+    Returns:
+        One result per query, in input order; failed queries carry an "error" key.
+    """
+    return get_orchestrator().run_batch(
+        queries,
+        max_concurrency=max_concurrency,
+        memory_path=memory_path,
+        history_mode=history_mode,
+        user_ids=user_ids,
+        batch_routing=batch_routing,
+    )
 
-    return result
+
+def stream_run(query: str, memory_path: Optional[str] = None, history_mode: str = "recent", user_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the final answer to query token by token (see Orchestrator.stream_run).
+    """
+    return (yield from get_orchestrator().stream_run(query, memory_path=memory_path, history_mode=history_mode, user_id=user_id))
+
+
+async def astream_run(query: str, memory_path: Optional[str] = None, history_mode: str = "recent", user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Async variant of stream_run().
+    """
+    async for piece in get_orchestrator().astream_run(query, memory_path=memory_path, history_mode=history_mode, user_id=user_id):
+        yield piece
@@ -1,54 +1,372 @@
-from typing import Dict
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
-import json
+
+from .events import EventCalendar, query_window
+from .retrieval import BM25Index, chain_digest, note_fields
+from .storage import open_backend
+from .tracing import traced
+
 
 class Memory:
-    def __init__(self, path: str = "./memory.json"):
+    """
+    Conversation history and profile notes of the user.
+
+    Storage is delegated to a pluggable backend (see storage.py):
+    "jsonl" (append-only log, default), "sqlite" or the legacy "json" file.
+    An existing memory.json at path is migrated into the chosen backend.
+
+    Reads are served from an in-memory snapshot. The snapshot is dropped when
+    the backend fingerprint (file mtime/size, SQLite data_version) changes
+    behind our back, and is updated in place by our own writes.
+
+    Profile lookups go through a BM25 inverted index persisted next to the
+    memory file as "<stem>.bm25.json"; it is flushed every
+    index_flush_every additions and on close().
+
+    Dated notes ("Family dinner - January 13th") are also kept in an
+    in-memory EventCalendar, so events_for/events_between answer date range
+    queries without scanning the notes (see events.py).
+
+    With semantic=True, history entries and notes are also embedded with a
+    local hashing encoder into memory-mapped float32 matrices
+    ("<stem>.history.f32", "<stem>.profile.f32") for search_history/search_profile.
+
+    A Memory can be shared by threads: writes hold the backend lock (a file
+    lock for jsonl/json, so other processes are excluded too) and the
+    snapshot is guarded by a per-instance lock.
+    """
+
+    def __init__(
+        self,
+        path: str = "./memory.json",
+        backend: str = "jsonl",
+        index_flush_every: int = 64,
+        semantic: bool = False,
+    ):
         self.path = Path(path)
-        if not self.path.exists():
-            self._write({"msg_history": [], "profile": []})
-    
+        self.backend = open_backend(self.path, backend)
+        self.version = 0
+
+        self.index_path = self.path.with_name(f"{self.path.stem}.bm25.json")
+        self.index_flush_every = index_flush_every
+        self._index: Optional[BM25Index] = None
+        self._index_unsaved = 0
+        self._calendar: Optional[EventCalendar] = None
 
-    def _read(self) -> Dict:
-        return json.loads(self.path.read_text(encoding="utf-8"))
+        self.semantic = semantic
+        self._encoder = None
+        self._vectors = None
 
+        self._fingerprint = self.backend.fingerprint()
+        self._history: Optional[List[Dict]] = None
+        self._history_complete = False
+        self._history_limit = 0
+        self._profile: Optional[List[Dict]] = None
+        self._lock = threading.RLock()
 
-    def _write(self, data: Dict):
-        self.path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
+    def _validate_cache(self):
+        fingerprint = self.backend.fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._history = None
+            self._history_complete = False
+            self._profile = None
+            self.version += 1
 
+
+    @traced("memory.get_history", "memory")
     def get_history(self, n: int = 3):
-        mem_file = self._read()
-        return mem_file["msg_history"][-n:]
+        if n <= 0:
+            return []
+
+        with self._lock:
+            self._validate_cache()
+            cached = self._history
+            if cached is None or (len(cached) < n and not self._history_complete):
+                self._history_limit = max(self._history_limit, n)
+                cached = self.backend.tail_history(self._history_limit)
+                self._history = cached
+                self._history_complete = len(cached) < self._history_limit
 
+            return cached[-n:]
 
+
+    @traced("memory.update_history", "memory")
     def update_history(self, user: str, assistant: str):
-        mem_file = self._read()
-        mem_file["msg_history"].append({"user": user, "assistant": assistant})
-        self._write(mem_file)
+        entry = {"user": user, "assistant": assistant}
+        with self._lock, self.backend.lock():
+            self._validate_cache()
+            self.backend.append_history(entry)
+
+            if self._history is not None:
+                # copy: readers may still hold the list returned by get_history
+                history = self._history + [entry]
+                if len(history) > self._history_limit:
+                    del history[0]
+                    self._history_complete = False
+                self._history = history
+            self._after_write()
+
+            if self._vectors is not None:
+                self._sync_vectors()
 
 
+    @traced("memory.get_from_profile", "memory")
     def get_from_profile(self, query: str, n: int = 3):
-        mem_file = self._read()
-        query = query.lower()
-        scored_records = []
+        with self._lock:
+            notes = self.profile_notes()
+            index = self._sync_index(notes)
 
-        for record in mem_file["profile_notes"]:
-            score = 0
-            if query in record.get("title", "").lower():
-                score += 3
-            if query in record.get("content", "").lower():
-                score += 2
-            if score > 0:
-                scored_records.append((score, record))
-        scored_records.sort(key=lambda x: -x[0])
+            return [notes[doc_id] for doc_id, _ in index.search(query, k=n)]
 
-        return [record for _, record in scored_records[:n]]
 
+    def profile_notes(self) -> List[Dict]:
+        with self._lock:
+            self._validate_cache()
+            if self._profile is None:
+                self._profile = self.backend.profile_notes()
+            return self._profile
 
+
+    @traced("memory.add_to_profile", "memory")
     def add_to_profile(self, title: str, content: str):
-        mem_file = self._read()
-        mem_file["profile_notes"].append({"title": title, "content": content})
-        self._write(mem_file)
+        note = {"title": title, "content": content}
+        with self._lock, self.backend.lock():
+            self._validate_cache()
+            self.backend.append_profile(note)
+
+            if self._profile is not None:
+                self._profile = self._profile + [note]
+            self._after_write()
+
+            if self._index is not None:
+                self._sync_index(self.profile_notes())
+            if self._calendar is not None:
+                self._sync_calendar(self.profile_notes())
+            if self._vectors is not None:
+                self._sync_vectors()
+
+
+    def _sync_index(self, notes: List[Dict]) -> BM25Index:
+        """
+        Load the persisted BM25 index and index only the notes it has not seen.
+        """
+        if self._index is None:
+            index = BM25Index.load(self.index_path)
+            if index is not None and index.digest != notes_digest(notes[:len(index)]):
+                # saved for other notes (the store was replaced or edited), rebuild it
+                index = None
+            self._index = index or BM25Index()
+        if len(self._index) > len(notes):
+            # the store was replaced or truncated, the index no longer lines up
+            self._index = BM25Index()
+
+        missing = notes[len(self._index):]
+        for note in missing:
+            self._index.add(note_fields(note), note_text(note))
+
+        self._index_unsaved += len(missing)
+        if self._index_unsaved >= self.index_flush_every:
+            self.flush_index()
+        return self._index
+
+
+    @traced("memory.events_for", "memory")
+    def events_for(self, query: str, n: int = 5, today: Optional[date] = None) -> List[Dict]:
+        """
+        Profile notes dated within the time window the query asks about (see
+        events.query_window), in date order. A query naming no window gets
+        the next n upcoming events instead.
+        """
+        with self._lock:
+            notes = self.profile_notes()
+            calendar = self._sync_calendar(notes)
+            window = query_window(query, today or calendar.today)
+            if window is None:
+                intervals = calendar.upcoming(n)
+            else:
+                intervals = calendar.overlapping(*window)
+            return [notes[note_id] for note_id in calendar.note_ids(intervals)]
+
+
+    def events_between(self, start: date, end: date) -> List[Dict]:
+        """
+        Profile notes with a date or range overlapping [start, end], in date order.
+        """
+        with self._lock:
+            notes = self.profile_notes()
+            calendar = self._sync_calendar(notes)
+            return [notes[note_id] for note_id in calendar.note_ids(calendar.overlapping(start, end))]
+
+
+    def _sync_calendar(self, notes: List[Dict]) -> EventCalendar:
+        """
+        Add the notes the calendar has not seen. It is rebuilt when the store
+        shrank or the day changed (dates without a year resolve relative to today).
+        """
+        if self._calendar is None or len(self._calendar) > len(notes) or self._calendar.today != date.today():
+            self._calendar = EventCalendar()
+        for note in notes[len(self._calendar):]:
+            self._calendar.add(note)
+        return self._calendar
+
+
+    def flush_index(self):
+        with self._lock:
+            if self._index is not None and self._index_unsaved:
+                self._index.save(self.index_path)
+                self._index_unsaved = 0
+
+
+    @traced("memory.search_history", "memory")
+    def search_history(self, query: str, n: int = 3) -> List[Dict]:
+        """
+        Return the n past exchanges most similar to query, in chronological order.
+        """
+        with self._lock:
+            store = self._semantic_stores()["history"]
+            hits = store.search(self._encoder.encode([query]), k=n)[0]
+            positions = sorted(row for row, score in hits if score > 0)
+            return self.backend.history_at(positions)
+
+
+    @traced("memory.search_profile", "memory")
+    def search_profile(self, query: str, n: int = 3) -> List[Dict]:
+        """
+        Return the n profile notes most similar to query, best first.
+        """
+        with self._lock:
+            store = self._semantic_stores()["profile"]
+            notes = self.profile_notes()
+            hits = store.search(self._encoder.encode([query]), k=n)[0]
+            return [notes[row] for row, score in hits if score > 0]
+
+
+    def _semantic_stores(self):
+        if self._vectors is None:
+            if not self.semantic:
+                raise RuntimeError("Semantic search is disabled, create Memory(..., semantic=True)")
+            # numpy is only needed once semantic search is used
+            from .semantic import HashingEncoder, VectorStore
+
+            self._encoder = HashingEncoder()
+            self._vectors = {
+                section: VectorStore(self.path.with_name(f"{self.path.stem}.{section}.f32"), self._encoder.dim)
+                for section in ("history", "profile")
+            }
+        self._sync_vectors()
+        return self._vectors
+
+
+    def _sync_vectors(self):
+        """
+        Embed only the history entries and notes that have no vector yet.
+        """
+        history_store = self._vectors["history"]
+        total, stored = self.backend.history_count(), len(history_store)
+        if stored > total:
+            history_store.reset()
+            stored = 0
+        if stored < total:
+            entries = self.backend.tail_history(total - stored)
+            history_store.append(self._encoder.encode([history_text(e) for e in entries]))
+
+        profile_store = self._vectors["profile"]
+        notes = self.profile_notes()
+        if len(profile_store) > len(notes):
+            profile_store.reset()
+        missing = notes[len(profile_store):]
+        if missing:
+            profile_store.append(self._encoder.encode([note_text(n) for n in missing]))
+
+
+    def _after_write(self):
+        self.version += 1
+        self._fingerprint = self.backend.fingerprint()
+
+
+    def close(self):
+        with self._lock:
+            self.flush_index()
+            self.backend.close()
+
+
+def history_text(entry: Dict) -> str:
+    return f"{entry.get('user', '')}\n{entry.get('assistant', '')}"
+
+
+def note_text(note: Dict) -> str:
+    return f"{note.get('title', '')}: {note.get('content', '')}"
+
+
+def notes_digest(notes: List[Dict]) -> str:
+    """
+    BM25Index.digest of an index holding exactly notes.
+    """
+    digest = ""
+    for note in notes:
+        digest = chain_digest(digest, note_text(note))
+    return digest
+
+
+# === USER SHARDS ===
+_SAFE_USER_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def shard_path(shard_dir: str, user_id: str) -> Path:
+    """
+    Memory file of one user: "<shard_dir>/<user_id>/memory.json". Ids that are
+    not plain file names are replaced by their SHA-1, so any string is safe.
+    """
+    name = user_id if _SAFE_USER_ID.match(user_id) else hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    directory = Path(shard_dir) / name
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / "memory.json"
+
+
+_OPEN_MEMORIES: "OrderedDict[Tuple[Path, str], Memory]" = OrderedDict()
+_OPEN_LOCK = threading.Lock()
+
+
+def get_memory(path: str = "./memory.json", backend: str = "jsonl", semantic: bool = False) -> Memory:
+    """
+    Return a process-wide Memory for path, so its read cache survives across runs.
+
+    At most MEMORY_MAX_OPEN (default 1024) stores stay open; the least recently
+    used one is closed (its index flushed, its connection released), so the
+    limit should exceed the number of users served at the same time.
+    Memories are opened outside the lock; when two callers open the same path
+    at once, the first one cached wins and the other copy is closed.
+    """
+    key = (Path(path).resolve(), backend)
+    with _OPEN_LOCK:
+        memory = _OPEN_MEMORIES.get(key)
+        if memory is not None:
+            _OPEN_MEMORIES.move_to_end(key)
+            memory.semantic = memory.semantic or semantic
+            return memory
+
+    opened = Memory(path, backend=backend, semantic=semantic)
+    evicted: List[Memory] = []
+    with _OPEN_LOCK:
+        memory = _OPEN_MEMORIES.get(key)
+        if memory is None:
+            memory = _OPEN_MEMORIES[key] = opened
+            max_open = int(os.getenv("MEMORY_MAX_OPEN", "1024"))
+            while len(_OPEN_MEMORIES) > max(max_open, 1):
+                evicted.append(_OPEN_MEMORIES.popitem(last=False)[1])
+        else:
+            _OPEN_MEMORIES.move_to_end(key)
+            evicted.append(opened)
+        memory.semantic = memory.semantic or semantic
 
-      
\ No newline at end of file
+    for stale in evicted:
+        stale.close()
+    return memory
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .llm import get_llm
+from .tracing import annotate, response_token_usage
+
+
+DEFAULT_TIER = "default"
+AGENT_NAMES = ("router", "decompozer", "code_assistant", "study_assistant", "planner")
+
+
+# === TIER STATISTICS ===
+class TierStats:
+    """
+    Per-tier LLM call counters: calls, errors, latency, tokens and cost, plus
+    how often each agent escalated from one tier to the next. Responses
+    served from the LLM response cache are counted as cache_hits only, so
+    they do not pull the latency statistics down.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._tiers: Dict[str, Dict[str, float]] = defaultdict(
+                lambda: {"calls": 0, "errors": 0, "cache_hits": 0, "seconds": 0.0,
+                         "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+            )
+            self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+            self._escalations: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, tier: str, seconds: float, prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            counters = self._tiers[tier]
+            counters["calls"] += 1
+            counters["seconds"] += seconds
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["cost"] += cost
+            self._latencies[tier].append(seconds)
+
+    def record_cache_hit(self, tier: str):
+        with self._lock:
+            self._tiers[tier]["cache_hits"] += 1
+
+    def record_error(self, tier: str):
+        with self._lock:
+            self._tiers[tier]["errors"] += 1
+
+    def record_escalation(self, agent: str, from_tier: str, to_tier: str):
+        with self._lock:
+            self._escalations[agent][f"{from_tier}->{to_tier}"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for tier, counters in self._tiers.items():
+                latencies = sorted(self._latencies[tier])
+                calls = counters["calls"]
+                tiers[tier] = {
+                    **counters,
+                    "avg_latency_s": counters["seconds"] / calls if calls else 0.0,
+                    "p95_latency_s": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0,
+                }
+            escalations = {agent: dict(counts) for agent, counts in self._escalations.items()}
+        return {"tiers": tiers, "escalations": escalations}
+
+
+_TIER_STATS = TierStats()
+
+
+def get_tier_stats() -> TierStats:
+    """
+    Process-wide per-tier statistics, filled by the models of every ModelConfig.
+    """
+    return _TIER_STATS
+
+
+_TIER_HANDLER_CLASS = None
+
+
+def tier_usage_handler(tier: str, prompt_cost: float = 0.0, completion_cost: float = 0.0):
+    """
+    LangChain callback handler recording every call of a tier's model in
+    get_tier_stats(). Costs are per million tokens.
+    """
+    global _TIER_HANDLER_CLASS
+    if _TIER_HANDLER_CLASS is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        from .llm_cache import is_cache_hit
+
+        class TierUsageHandler(BaseCallbackHandler):
+            run_inline = True
+
+            def __init__(self, tier: str, prompt_cost: float, completion_cost: float):
+                self.tier = tier
+                self.prompt_cost = prompt_cost
+                self.completion_cost = completion_cost
+                self._starts: Dict[Any, float] = {}
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+                self._starts[run_id] = time.perf_counter()
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any) -> None:
+                self._starts[run_id] = time.perf_counter()
+
+            def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+                start = self._starts.pop(run_id, None)
+                if is_cache_hit(response):
+                    _TIER_STATS.record_cache_hit(self.tier)
+                    return
+                seconds = time.perf_counter() - start if start is not None else 0.0
+                prompt_tokens, completion_tokens = response_token_usage(response)
+                cost = (prompt_tokens * self.prompt_cost + completion_tokens * self.completion_cost) / 1e6
+                _TIER_STATS.record(self.tier, seconds, prompt_tokens, completion_tokens, cost)
+
+            def on_llm_error(self, error, *, run_id, **kwargs: Any) -> None:
+                self._starts.pop(run_id, None)
+                # a hedged duplicate that lost the race is cancelled, not failed
+                if not isinstance(error, asyncio.CancelledError):
+                    _TIER_STATS.record_error(self.tier)
+
+        _TIER_HANDLER_CLASS = TierUsageHandler
+    return _TIER_HANDLER_CLASS(tier, prompt_cost, completion_cost)
+
+
+# === CONFIGURATION ===
+class ModelConfig:
+    """
+    Which model tier(s) every agent uses.
+
+    tiers maps a tier name to its settings, all optional:
+        {"model": "qwen3-4b", "base_url": "...", "api_key": "...",
+         "prompt_cost_per_mtok": 0.1, "completion_cost_per_mtok": 0.3, "timeout": 30}
+    (model, base_url and api_key default to MODEL_NAME / LITELLM_*; other
+    keys are passed to ChatOpenAI, max_retries defaulting to 0 since the
+    calls are retried by resilient_model). agents maps an agent to a tier name or
+    to a list of tiers tried in order: the next tier is only called when the
+    previous one's output fails the agent's check (see escalating_model).
+    Agents not listed use the "default" tier. client_settings are passed to
+    every tier's client, e.g. a shared http_async_client connection pool.
+
+    Example file (MODEL_CONFIG=models.json):
+        {"tiers": {"small": {"model": "qwen3-4b"}, "large": {"model": "qwen3-32b"}},
+         "agents": {"router": ["small", "large"], "decompozer": ["small", "large"]}}
+    """
+
+    COST_KEYS = ("prompt_cost_per_mtok", "completion_cost_per_mtok")
+
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, Dict[str, Any]]] = None,
+        agents: Optional[Dict[str, Union[str, List[str]]]] = None,
+        client_settings: Optional[Dict[str, Any]] = None,
+    ):
+        self.tiers = {DEFAULT_TIER: {}, **(tiers or {})}
+        self.client_settings = dict(client_settings or {})
+        self.agents = {
+            agent: [names] if isinstance(names, str) else list(names)
+            for agent, names in (agents or {}).items()
+        }
+        for agent, names in self.agents.items():
+            unknown = [name for name in names if name not in self.tiers]
+            if not names or unknown:
+                raise ValueError(f"Agent '{agent}' uses unknown model tiers {unknown or names}")
+        self._llms: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, client_settings: Optional[Dict[str, Any]] = None) -> "ModelConfig":
+        """
+        Read the JSON file at path (default: env MODEL_CONFIG, if set), then
+        apply env overrides MODEL_<AGENT>=model[,model...], e.g.
+        MODEL_ROUTER=qwen3-4b,qwen3-32b. A model name that is not a tier name
+        becomes a tier of its own.
+        """
+        path = path or os.getenv("MODEL_CONFIG")
+        data: Dict[str, Any] = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        tiers = dict(data.get("tiers") or {})
+        agents = dict(data.get("agents") or {})
+
+        for agent in AGENT_NAMES:
+            value = os.getenv(f"MODEL_{agent.upper()}")
+            if not value:
+                continue
+            names = [name.strip() for name in value.split(",") if name.strip()]
+            for name in names:
+                tiers.setdefault(name, {"model": name})
+            agents[agent] = names
+        return cls(tiers, agents, client_settings)
+
+    def tiers_for(self, agent: str) -> List[str]:
+        return self.agents.get(agent) or [DEFAULT_TIER]
+
+    def llm(self, tier: str, default_llm=None):
+        """
+        Chat model of a tier, recording its calls in get_tier_stats(). The
+        "default" tier uses default_llm when given (e.g. a test server client).
+        """
+        with self._lock:
+            model = self._llms.get(tier)
+            if model is None:
+                settings = dict(self.tiers[tier])
+                prompt_cost, completion_cost = (float(settings.pop(key, 0.0)) for key in self.COST_KEYS)
+                if tier == DEFAULT_TIER and default_llm is not None and not settings:
+                    base = default_llm
+                else:
+                    # resilient_model retries the calls; the client itself must not (see build_agents)
+                    settings.setdefault("max_retries", 0)
+                    base = get_llm(**{**self.client_settings, **settings})
+                handler = tier_usage_handler(tier, prompt_cost, completion_cost)
+                if hasattr(base, "model_copy"):
+                    # a copy shares the HTTP clients of the cached base model
+                    model = base.model_copy(update={"callbacks": [*(base.callbacks or []), handler]})
+                else:
+                    model = base.with_config(callbacks=[handler])
+                self._llms[tier] = model
+            return model
+
+
+# === ESCALATION ===
+def escalating_model(
+    agent: str,
+    tiers: Sequence[Tuple[str, Any]],
+    accept: Callable[[str], bool],
+):
+    """
+    Runnable standing in for a chat model: calls the tiers in order and
+    returns the first response whose text passes accept (the last tier's
+    response is returned regardless). Escalations are counted in
+    get_tier_stats() and on the current trace span.
+
+    Streaming through it yields the accepted response in one piece, so only
+    agents with more than one tier should be wrapped.
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    def escalate(index: int):
+        from_tier, to_tier = tiers[index][0], tiers[index + 1][0]
+        _TIER_STATS.record_escalation(agent, from_tier, to_tier)
+        annotate(escalations=1)
+
+    def call(prompt, config):
+        for index, (_, model) in enumerate(tiers):
+            message = model.invoke(prompt, config)
+            if index == len(tiers) - 1 or accept(message.content):
+                return message
+            escalate(index)
+
+    async def acall(prompt, config):
+        for index, (_, model) in enumerate(tiers):
+            message = await model.ainvoke(prompt, config)
+            if index == len(tiers) - 1 or accept(message.content):
+                return message
+            escalate(index)
+
+    return RunnableLambda(call, afunc=acall, name=f"{agent}_tiers")
@@ -0,0 +1,244 @@
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .retrieval import TOKEN_PATTERN
+
+
+CATEGORIES = ("academic", "programming", "planning", "other")
+
+DEFAULT_MODEL_PATH = Path(__file__).with_name("prerouter.npz")
+
+_WHEN = r"(today|tonight|tomorrow|this week|next week|weekend|monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+
+# Patterns that on their own identify a category. A query matching patterns
+# of more than one category is left to the model / LLM router. Rules are
+# opt-in (PREROUTER_RULES=1) and only decide with a confidence measured on
+# labelled data by train_prerouter.py, or one passed explicitly.
+RULES: Dict[str, List[re.Pattern]] = {
+    "programming": [
+        re.compile(p, re.IGNORECASE)
+        for p in (
+            r"```",
+            r"\bdef\s+\w+\s*\(",
+            r"\bclass\s+\w+\s*[:(]",
+            r"\b(traceback|stack ?trace|segfault|syntax error|compile error|stderr)\b",
+            r"\b(debug|refactor|implement|unit[- ]?tests?)\b.*\b(code|function|class|script|module|api|endpoint)\b",
+            r"\b(python|javascript|typescript|java|c\+\+|rust|golang|sql)\b.*\b(function|class|script|code|bug)\b",
+        )
+    ],
+    "planning": [
+        re.compile(p, re.IGNORECASE)
+        for p in (
+            r"\b(plans?|planning|schedul(e|es|ing)|timetable|routines?|calendar|itinerary|agenda|organi[sz]e)\b"
+            r".*\b(my|me|week|weeks|weekend|day|days|month|trip)\b",
+            r"\b(my|me)\b.*\b(plans?|schedule|timetable|routine|calendar|itinerary|agenda)\b",
+            r"\bdo i have (any )?(plans|events|meetings)\b",
+            r"\b(i|my|me)\b.*\b" + _WHEN + r"\b",
+        )
+    ],
+    "academic": [
+        re.compile(p, re.IGNORECASE)
+        for p in (
+            r"\b(explain|define|definition of|difference between|theorem|intuition behind)\b",
+        )
+    ],
+}
+
+
+class Decision(NamedTuple):
+    category: str
+    confidence: float
+    source: str
+
+
+# === FEATURES ===
+def hashed_features(text: str, dim: int) -> Dict[int, float]:
+    """
+    Hash word unigrams and bigrams of text into dim buckets.
+
+    Returns:
+        Sparse feature vector as {bucket: value}, L2-normalized.
+    """
+    words = TOKEN_PATTERN.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    features: Dict[int, float] = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode("utf-8")) % dim
+        features[bucket] = features.get(bucket, 0.0) + 1.0
+
+    norm = sum(v * v for v in features.values()) ** 0.5
+    if norm:
+        features = {bucket: value / norm for bucket, value in features.items()}
+    return features
+
+
+# === LINEAR MODEL ===
+class LinearRouterModel:
+    """
+    Multinomial logistic regression over hashed n-grams, stored as a .npz
+    file with "weights" (classes x dim), "bias" and "classes", plus the
+    "threshold" and "rule_precision" measured on held-out data by
+    train_prerouter.py (absent in older files).
+    """
+
+    def __init__(
+        self,
+        weights,
+        bias,
+        classes: Tuple[str, ...],
+        threshold: Optional[float] = None,
+        rule_precision: Optional[float] = None,
+    ):
+        self.weights = weights
+        self.bias = bias
+        self.classes = tuple(classes)
+        self.dim = weights.shape[1]
+        self.threshold = threshold
+        self.rule_precision = rule_precision
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        import numpy as np
+
+        features = hashed_features(text, self.dim)
+        if not features:
+            return self.classes[0], 0.0
+
+        buckets = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        values = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+        logits = self.weights[:, buckets] @ values + self.bias
+        logits -= logits.max()
+        probs = np.exp(logits)
+        probs /= probs.sum()
+
+        best = int(probs.argmax())
+        return self.classes[best], float(probs[best])
+
+    def save(self, path: Path):
+        import numpy as np
+
+        measured = {
+            key: value
+            for key, value in (("threshold", self.threshold), ("rule_precision", self.rule_precision))
+            if value is not None
+        }
+        np.savez(path, weights=self.weights, bias=self.bias, classes=np.array(self.classes), **measured)
+
+    @classmethod
+    def load(cls, path: Path) -> "LinearRouterModel":
+        import numpy as np
+
+        with np.load(path) as data:
+            measured = {key: float(data[key]) for key in ("threshold", "rule_precision") if key in data.files}
+            return cls(data["weights"], data["bias"], tuple(str(c) for c in data["classes"]), **measured)
+
+
+# === PRE-ROUTER ===
+class PreRouter:
+    """
+    Local classification tier in front of the LLM router.
+
+    The optional keyword/regex rules (use_rules) are tried first, then the
+    optional linear model. classify() returns a Decision only when its
+    confidence reaches threshold; otherwise None, and the caller falls back
+    to the LLM router. threshold and rule_confidence default to the values
+    train_prerouter.py measured and saved with the model; without a model
+    (or a rule_confidence passed explicitly) the rules never decide, so an
+    untrained PreRouter always falls back.
+
+    Counters (see stats()) track the hit rate, the local decision time and
+    the LLM routing latency, from which the saved time is estimated.
+    """
+
+    def __init__(
+        self,
+        model: Optional[LinearRouterModel] = None,
+        threshold: Optional[float] = None,
+        rule_confidence: Optional[float] = None,
+        use_rules: bool = False,
+    ):
+        self.model = model
+        if threshold is None:
+            threshold = model.threshold if model is not None and model.threshold is not None else 0.9
+        if rule_confidence is None and model is not None:
+            rule_confidence = model.rule_precision
+        self.threshold = threshold
+        self.rule_confidence = rule_confidence
+        self.use_rules = use_rules
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._fallbacks = 0
+        self._decision_time = 0.0
+        self._llm_calls = 0
+        self._llm_time = 0.0
+
+    @classmethod
+    def load(cls, model_path: Optional[Path] = DEFAULT_MODEL_PATH, **kwargs) -> "PreRouter":
+        """
+        Create a PreRouter with the trained model at model_path if it exists
+        (without one nothing is routed early). Rules are enabled by
+        PREROUTER_RULES=1 unless use_rules is given.
+        """
+        model = None
+        if model_path is not None and Path(model_path).exists():
+            model = LinearRouterModel.load(model_path)
+        kwargs.setdefault("use_rules", os.getenv("PREROUTER_RULES", "0") not in ("", "0"))
+        return cls(model=model, **kwargs)
+
+    def match_rules(self, query: str) -> Optional[str]:
+        matched = [category for category, patterns in RULES.items() if any(p.search(query) for p in patterns)]
+        return matched[0] if len(matched) == 1 else None
+
+    def classify(self, query: str) -> Optional[Decision]:
+        start = time.perf_counter()
+        decision = self._classify(query)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._decision_time += elapsed
+            if decision is None:
+                self._fallbacks += 1
+            else:
+                self._hits += 1
+        return decision
+
+    def _classify(self, query: str) -> Optional[Decision]:
+        if self.use_rules and self.rule_confidence is not None and self.rule_confidence >= self.threshold:
+            category = self.match_rules(query)
+            if category is not None:
+                return Decision(category, self.rule_confidence, "rules")
+
+        if self.model is not None:
+            category, confidence = self.model.predict(query)
+            if confidence >= self.threshold:
+                return Decision(category, confidence, "model")
+
+        return None
+
+    def observe_llm_latency(self, seconds: float):
+        """
+        Record the latency of an LLM routing call made after a fallback.
+        """
+        with self._lock:
+            self._llm_calls += 1
+            self._llm_time += seconds
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self._hits + self._fallbacks
+            llm_avg = self._llm_time / self._llm_calls if self._llm_calls else 0.0
+            return {
+                "queries": total,
+                "hits": self._hits,
+                "fallbacks": self._fallbacks,
+                "hit_rate": self._hits / total if total else 0.0,
+                "avg_decision_us": 1e6 * self._decision_time / total if total else 0.0,
+                "llm_router_avg_s": llm_avg,
+                "estimated_saved_s": self._hits * llm_avg,
+            }
@@ -0,0 +1,457 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+
+# Whole-call budget per agent in seconds (all attempts and backoff included).
+DEFAULT_DEADLINES = {
+    "router": 30.0,
+    "decompozer": 60.0,
+    "code_assistant": 180.0,
+    "study_assistant": 180.0,
+    "planner": 180.0,
+}
+# Agents hedged unless LLM_HEDGE / LLM_HEDGE_<AGENT> say otherwise: their
+# answers are short, so a duplicate request costs little. The assistants
+# generate long answers, and a losing sync attempt is not cancelled (see
+# CallPolicy), so hedging them would roughly double their token spend.
+DEFAULT_HEDGED = ("router", "decompozer")
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """
+    An LLM call (retries and hedges included) did not finish within its agent's deadline.
+    """
+
+
+# === POLICY ===
+class CallPolicy:
+    """
+    How the LLM calls of one agent are made.
+
+    Args:
+        deadline: Seconds for the whole call; None waits as long as the client does.
+        retries: Extra attempts after a transient error (connection errors,
+            timeouts, HTTP 429 and 5xx).
+        backoff: Base of the exponential backoff; the wait before retry n is
+            uniform in [0, min(max_backoff, backoff * 2**n)] ("full jitter").
+        max_backoff: Upper bound of one wait.
+        hedge: Send a duplicate request when the first one is slower than the
+            hedge_quantile of this agent's recent latencies; the first answer
+            wins. The losing async attempt is cancelled; a losing sync attempt
+            (like a sync attempt past the deadline) cannot be and runs to the
+            end in the worker pool, tokens included.
+        hedge_quantile: Latency quantile after which to hedge.
+        hedge_min_samples: Latencies needed before hedging starts.
+        hedge_min_delay: Never hedge sooner than this (keeps cache hits from
+            dragging the quantile down to zero).
+    """
+
+    def __init__(
+        self,
+        deadline: Optional[float] = 60.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.5,
+    ):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+
+    @classmethod
+    def from_env(cls, agent: str) -> "CallPolicy":
+        """
+        Policy of an agent from LLM_DEADLINE_<AGENT> / LLM_DEADLINE (seconds,
+        0 = none), LLM_RETRIES and LLM_HEDGE_<AGENT> / LLM_HEDGE=0|1, falling
+        back to DEFAULT_DEADLINES and DEFAULT_HEDGED.
+        """
+        deadline = os.getenv(f"LLM_DEADLINE_{agent.upper()}") or os.getenv("LLM_DEADLINE")
+        hedge = os.getenv(f"LLM_HEDGE_{agent.upper()}") or os.getenv("LLM_HEDGE")
+        return cls(
+            deadline=(float(deadline) or None) if deadline else DEFAULT_DEADLINES.get(agent, 60.0),
+            retries=int(os.getenv("LLM_RETRIES", "2")),
+            hedge=hedge != "0" if hedge else agent in DEFAULT_HEDGED,
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Errors worth retrying: timeouts, connection failures, rate limits and server errors.
+    """
+    if isinstance(error, LLMDeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    try:
+        import httpx
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError))
+
+
+# === STATISTICS ===
+class CallStats:
+    """
+    Per-agent counters of the resilient LLM calls: calls, attempts, retries,
+    hedges sent and won, deadlines exceeded and failed calls.
+    """
+
+    FIELDS = ("calls", "attempts", "retries", "hedges", "hedge_wins", "deadline_exceeded", "failures")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._agents: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def add(self, agent: str, **counters: int):
+        with self._lock:
+            row = self._agents[agent]
+            for key, value in counters.items():
+                row[key] += value
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {agent: dict(row) for agent, row in self._agents.items()}
+
+
+_CALL_STATS = CallStats()
+
+
+def get_call_stats() -> CallStats:
+    """
+    Process-wide counters of all resilient LLM calls.
+    """
+    return _CALL_STATS
+
+
+class LatencyWindow:
+    """
+    Recent successful attempt latencies of one model, for the hedge delay.
+    """
+
+    def __init__(self, size: int = 256):
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_POOL: Optional[concurrent.futures.Executor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> concurrent.futures.Executor:
+    # sync attempts run here so they can be timed out and hedged; the executor
+    # copies the caller's context (trace span) into the worker thread
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+            _POOL = ContextThreadPoolExecutor(
+                max_workers=int(os.getenv("LLM_CALL_THREADS", "64")), thread_name_prefix="llm-call"
+            )
+        return _POOL
+
+
+# === WRAPPER ===
+_RESILIENT_CLASS = None
+
+
+def resilient_model(agent: str, model, policy: Optional[CallPolicy] = None):
+    """
+    Runnable standing in for a chat model that applies an agent's CallPolicy:
+    a deadline for the whole call, jittered retries on transient errors and
+    hedged duplicate requests. Counters go to get_call_stats() and to the
+    current trace span (llm_retries, llm_hedges).
+
+    Streaming retries only until the first chunk arrives (an answer that is
+    partly delivered cannot be replaced) and is not hedged; the deadline
+    applies until the first chunk.
+
+    The wrapped model should not retry itself (ChatOpenAI(max_retries=0), as
+    build_agents sets up): the openai client's own 2 retries per attempt
+    would otherwise multiply the requests of one call up to ninefold.
+    """
+    global _RESILIENT_CLASS
+    if _RESILIENT_CLASS is None:
+        from langchain_core.runnables import Runnable
+
+        from .tracing import annotate
+
+        class ResilientModel(Runnable):
+            def __init__(self, agent: str, model, policy: CallPolicy):
+                self.agent = agent
+                self.model = model
+                self.policy = policy
+                self.latencies = LatencyWindow()
+                self.name = f"{agent}_resilient"
+
+            @property
+            def InputType(self):
+                return self.model.InputType
+
+            @property
+            def OutputType(self):
+                return self.model.OutputType
+
+            # --- helpers ---
+            def _deadline(self) -> Optional[float]:
+                return time.monotonic() + self.policy.deadline if self.policy.deadline else None
+
+            def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+                return None if deadline is None else deadline - time.monotonic()
+
+            def _hedge_delay(self) -> Optional[float]:
+                if not self.policy.hedge:
+                    return None
+                quantile = self.latencies.quantile(self.policy.hedge_quantile, self.policy.hedge_min_samples)
+                return None if quantile is None else max(quantile, self.policy.hedge_min_delay)
+
+            def _wait_timeout(self, remaining: Optional[float], hedge_delay: Optional[float]) -> Optional[float]:
+                limits = [limit for limit in (remaining, hedge_delay) if limit is not None]
+                return min(limits) if limits else None
+
+            def _expired(self):
+                _CALL_STATS.add(self.agent, deadline_exceeded=1, failures=1)
+                return LLMDeadlineExceeded(f"{self.agent} LLM call exceeded its {self.policy.deadline}s deadline")
+
+            def _retry_wait(self, attempt: int, error: BaseException, deadline: Optional[float]) -> float:
+                """
+                Seconds to wait before the next attempt, or re-raise when the call is over.
+                """
+                remaining = self._remaining(deadline)
+                if attempt >= self.policy.retries or not is_transient(error):
+                    _CALL_STATS.add(self.agent, failures=1)
+                    raise error
+                wait = self.policy.backoff_delay(attempt)
+                if remaining is not None and wait >= remaining:
+                    raise self._expired() from error
+                _CALL_STATS.add(self.agent, retries=1)
+                annotate(llm_retries=1)
+                return wait
+
+            def _hedged(self):
+                _CALL_STATS.add(self.agent, attempts=1, hedges=1)
+                annotate(llm_hedges=1)
+
+            # --- invoke ---
+            def _attempt(self, input, config, deadline):
+                first = _pool().submit(self.model.invoke, input, config)
+                futures = [first]
+                # only the winner's latency is recorded: a slow loser would pull the quantile up
+                started = {first: time.monotonic()}
+                _CALL_STATS.add(self.agent, attempts=1)
+                hedge_delay = self._hedge_delay()
+                error = None
+                while futures:
+                    remaining = self._remaining(deadline)
+                    if remaining is not None and remaining <= 0:
+                        raise self._expired()
+                    hedge_pending = hedge_delay is not None and len(futures) == 1 and error is None
+                    timeout = self._wait_timeout(remaining, hedge_delay if hedge_pending else None)
+                    done, _ = concurrent.futures.wait(futures, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        futures.remove(future)
+                        if future.exception() is None:
+                            self.latencies.add(time.monotonic() - started[future])
+                            if future is not first:
+                                _CALL_STATS.add(self.agent, hedge_wins=1)
+                            return future.result()
+                        error = future.exception()
+                    if not done and hedge_pending:
+                        hedge = _pool().submit(self.model.invoke, input, config)
+                        started[hedge] = time.monotonic()
+                        futures.append(hedge)
+                        self._hedged()
+                        hedge_delay = None
+                raise error
+
+            def invoke(self, input, config=None, **kwargs):
+                _CALL_STATS.add(self.agent, calls=1)
+                deadline = self._deadline()
+                attempt = 0
+                while True:
+                    try:
+                        return self._attempt(input, config, deadline)
+                    except LLMDeadlineExceeded:
+                        raise
+                    except Exception as error:
+                        time.sleep(self._retry_wait(attempt, error, deadline))
+                        attempt += 1
+
+            # --- ainvoke ---
+            async def _aattempt(self, input, config, deadline):
+                first = asyncio.ensure_future(self.model.ainvoke(input, config))
+                tasks = [first]
+                started = {first: time.monotonic()}
+                _CALL_STATS.add(self.agent, attempts=1)
+                hedge_delay = self._hedge_delay()
+                error = None
+                try:
+                    while tasks:
+                        remaining = self._remaining(deadline)
+                        if remaining is not None and remaining <= 0:
+                            raise self._expired()
+                        hedge_pending = hedge_delay is not None and len(tasks) == 1 and error is None
+                        timeout = self._wait_timeout(remaining, hedge_delay if hedge_pending else None)
+                        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            tasks.remove(task)
+                            if task.exception() is None:
+                                self.latencies.add(time.monotonic() - started[task])
+                                if task is not first:
+                                    _CALL_STATS.add(self.agent, hedge_wins=1)
+                                return task.result()
+                            error = task.exception()
+                        if not done and hedge_pending:
+                            hedge = asyncio.ensure_future(self.model.ainvoke(input, config))
+                            started[hedge] = time.monotonic()
+                            tasks.append(hedge)
+                            self._hedged()
+                            hedge_delay = None
+                    raise error
+                finally:
+                    for task in tasks:
+                        task.cancel()
+
+            async def ainvoke(self, input, config=None, **kwargs):
+                _CALL_STATS.add(self.agent, calls=1)
+                deadline = self._deadline()
+                attempt = 0
+                while True:
+                    try:
+                        return await self._aattempt(input, config, deadline)
+                    except LLMDeadlineExceeded:
+                        raise
+                    except Exception as error:
+                        await asyncio.sleep(self._retry_wait(attempt, error, deadline))
+                        attempt += 1
+
+            # --- streaming ---
+            def _stream_attempt(self, input, config, deadline, **kwargs):
+                """
+                Chunks of one streaming attempt. The model is iterated in the
+                worker pool and hands its chunks over through a queue, so the
+                wait for the first one can be bounded by the deadline; an
+                abandoned stream stops when its next chunk arrives.
+                """
+                remaining = self._remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    raise self._expired()
+                chunks: queue.Queue = queue.Queue()
+                abandoned = threading.Event()
+
+                def produce():
+                    try:
+                        for chunk in self.model.stream(input, config, **kwargs):
+                            if abandoned.is_set():
+                                return
+                            chunks.put(("chunk", chunk))
+                    except BaseException as error:
+                        chunks.put(("error", error))
+                    else:
+                        chunks.put(("end", None))
+
+                _pool().submit(produce)
+                try:
+                    try:
+                        kind, value = chunks.get(timeout=None if remaining is None else max(0.0, self._remaining(deadline)))
+                    except queue.Empty:
+                        raise self._expired() from None
+                    while kind == "chunk":
+                        yield value
+                        kind, value = chunks.get()
+                    if kind == "error":
+                        raise value
+                finally:
+                    abandoned.set()
+
+            def stream(self, input, config=None, **kwargs):
+                _CALL_STATS.add(self.agent, calls=1)
+                deadline = self._deadline()
+                attempt = 0
+                while True:
+                    started = False
+                    try:
+                        _CALL_STATS.add(self.agent, attempts=1)
+                        for chunk in self._stream_attempt(input, config, deadline, **kwargs):
+                            started = True
+                            yield chunk
+                        return
+                    except LLMDeadlineExceeded:
+                        raise
+                    except Exception as error:
+                        if started:
+                            _CALL_STATS.add(self.agent, failures=1)
+                            raise
+                        time.sleep(self._retry_wait(attempt, error, deadline))
+                        attempt += 1
+
+            async def astream(self, input, config=None, **kwargs):
+                _CALL_STATS.add(self.agent, calls=1)
+                deadline = self._deadline()
+                attempt = 0
+                while True:
+                    chunks = self.model.astream(input, config, **kwargs)
+                    try:
+                        _CALL_STATS.add(self.agent, attempts=1)
+                        try:
+                            first = await asyncio.wait_for(chunks.__anext__(), self._remaining(deadline))
+                        except asyncio.TimeoutError:
+                            raise self._expired() from None
+                        except StopAsyncIteration:
+                            return
+                    except LLMDeadlineExceeded:
+                        await chunks.aclose()
+                        raise
+                    except Exception as error:
+                        await chunks.aclose()
+                        await asyncio.sleep(self._retry_wait(attempt, error, deadline))
+                        attempt += 1
+                        continue
+                    yield first
+                    try:
+                        async for chunk in chunks:
+                            yield chunk
+                    except Exception:
+                        _CALL_STATS.add(self.agent, failures=1)
+                        raise
+                    return
+
+        _RESILIENT_CLASS = ResilientModel
+    return _RESILIENT_CLASS(agent, model, policy or CallPolicy.from_env(agent))
@@ -0,0 +1,176 @@
+import hashlib
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .storage import atomic_write_text
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from have how i if in is it its "
+    "me my of on or our so that the their them then there these this to was we "
+    "what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase text and split it into word tokens, dropping common stopwords.
+    """
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def note_fields(note: Dict) -> Dict[str, List[str]]:
+    """
+    Tokenized fields of a profile note, as indexed by BM25Index.
+    """
+    return {
+        "title": tokenize(note.get("title", "")),
+        "content": tokenize(note.get("content", "")),
+    }
+
+
+def chain_digest(digest: str, key: str) -> str:
+    """
+    Digest of a list of document keys, extended by one key at a time.
+    """
+    return hashlib.sha1(f"{digest}\n{key}".encode("utf-8")).hexdigest()
+
+
+# === BM25 INDEX ===
+class BM25Index:
+    """
+    Inverted index over a growing list of documents with per-field Okapi BM25
+    scoring. A note's score is the weighted sum of its title and content
+    scores; titles weigh more, mirroring the old 3/2 substring scoring.
+
+    Documents are identified by their insertion position, which matches the
+    position of the note in Memory.profile_notes(), so the index can be
+    brought up to date by adding only the notes it has not seen yet. digest
+    chains the keys of the added documents, so a saved index can be checked
+    against the notes it is loaded for (see chain_digest).
+    """
+
+    FORMAT_VERSION = 2
+    FIELD_WEIGHTS = {"title": 1.5, "content": 1.0}
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, Dict[int, int]]] = {field: {} for field in self.FIELD_WEIGHTS}
+        self.lengths: Dict[str, List[int]] = {field: [] for field in self.FIELD_WEIGHTS}
+        self.total_lengths: Dict[str, int] = {field: 0 for field in self.FIELD_WEIGHTS}
+        self.n_docs = 0
+        self.digest = ""
+        self._norms: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def add(self, fields: Dict[str, List[str]], key: str = "") -> int:
+        """
+        Index a document given as {field: tokens} and return its id; key
+        identifies the document in digest (e.g. its text).
+        """
+        doc_id = self.n_docs
+        for field in self.FIELD_WEIGHTS:
+            counts = Counter(fields.get(field, ()))
+            postings = self.postings[field]
+            for term, tf in counts.items():
+                postings.setdefault(term, {})[doc_id] = tf
+
+            length = sum(counts.values())
+            self.lengths[field].append(length)
+            self.total_lengths[field] += length
+
+        self.n_docs += 1
+        self.digest = chain_digest(self.digest, key)
+        self._norms.clear()
+        return doc_id
+
+    def _field_norms(self, field: str) -> List[float]:
+        """
+        Per-document BM25 length normalization k1 * (1 - b + b * len / avg_len),
+        computed once per index size instead of once per posting.
+        """
+        norms = self._norms.get(field)
+        if norms is None:
+            k1, b = self.k1, self.b
+            avg_length = self.total_lengths[field] / self.n_docs or 1.0
+            norms = self._norms[field] = [k1 * (1 - b + b * length / avg_length) for length in self.lengths[field]]
+        return norms
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        """
+        Return up to k (doc_id, score) pairs with positive BM25 score, best first.
+        Ties keep insertion order.
+        """
+        n_docs = self.n_docs
+        if n_docs == 0 or k <= 0:
+            return []
+
+        terms = set(tokenize(query))
+        k1 = self.k1
+        scores: Dict[int, float] = {}
+
+        for field, weight in self.FIELD_WEIGHTS.items():
+            field_postings = self.postings[field]
+            norms = None
+
+            for term in terms:
+                postings = field_postings.get(term)
+                if not postings:
+                    continue
+                if norms is None:
+                    norms = self._field_norms(field)
+                df = len(postings)
+                idf = weight * (k1 + 1) * math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                get = scores.get
+                for doc_id, tf in postings.items():
+                    scores[doc_id] = get(doc_id, 0.0) + idf * tf / (tf + norms[doc_id])
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def save(self, path: Path):
+        data = {
+            "version": self.FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "n_docs": self.n_docs,
+            "digest": self.digest,
+            "lengths": self.lengths,
+            "postings": {
+                field: {term: [list(docs.keys()), list(docs.values())] for term, docs in postings.items()}
+                for field, postings in self.postings.items()
+            },
+        }
+        atomic_write_text(Path(path), json.dumps(data, separators=(",", ":")))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BM25Index"]:
+        """
+        Load a saved index, or return None if it is missing or unreadable.
+        """
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != cls.FORMAT_VERSION:
+            return None
+
+        index = cls(k1=data["k1"], b=data["b"])
+        index.n_docs = data["n_docs"]
+        index.digest = data["digest"]
+        for field in cls.FIELD_WEIGHTS:
+            index.lengths[field] = data["lengths"][field]
+            index.total_lengths[field] = sum(index.lengths[field])
+            index.postings[field] = {
+                term: dict(zip(doc_ids, tfs)) for term, (doc_ids, tfs) in data["postings"][field].items()
+            }
+        return index
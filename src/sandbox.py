@@ -0,0 +1,228 @@
+import atexit
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Callable, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows; workers then run without rlimits
+    resource = None
+
+
+class SandboxError(RuntimeError):
+    """A tool call could not be completed inside the sandbox."""
+
+
+class ToolTimeout(SandboxError):
+    """A tool call exceeded its wall-clock timeout."""
+
+
+# === WORKER PROCESS ===
+def _set_limit(kind: int, soft: int):
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _worker_main(conn, memory_bytes: Optional[int], parent_pid: int):
+    """
+    Serve (function, argument, cpu_seconds) requests from conn until None arrives.
+
+    The address space limit is fixed for the life of the worker. The CPU limit
+    is moved forward before every call to current usage + cpu_seconds; exceeding
+    it raises SIGXCPU, which terminates the worker.
+
+    The worker also exits when the parent process is gone: forked siblings
+    hold copies of each other's pipe ends, so EOF alone is not reliable.
+    """
+    # forked workers inherit the parent's handlers (e.g. a server's graceful
+    # shutdown hook); SIGTERM must end the worker, Ctrl-C is the parent's job
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_bytes:
+        _set_limit(resource.RLIMIT_AS, memory_bytes)
+
+    while True:
+        try:
+            if not conn.poll(1.0):
+                if os.getppid() != parent_pid:
+                    return
+                continue
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        func, argument, cpu_seconds = request
+        if resource is not None and cpu_seconds:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            _set_limit(resource.RLIMIT_CPU, math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds))
+
+        try:
+            result = str(func(argument))
+        except MemoryError:
+            result = "Error: memory limit exceeded"
+        except BaseException as exc:
+            result = f"Error: {exc}"
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, context, memory_bytes: Optional[int]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_bytes, os.getpid()), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+# === POOL ===
+class SandboxPool:
+    """
+    Pre-started worker processes that evaluate untrusted tool input.
+
+    Each worker runs with an address space limit of memory_mb and a CPU limit
+    of cpu_seconds per call; the caller additionally waits at most timeout
+    seconds of wall-clock time. A worker that times out, crashes or hits a
+    limit is killed and replaced, so the next call gets a fresh process.
+    Workers are also recycled after max_calls calls.
+
+    run() is thread-safe; up to `workers` calls execute in parallel.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 2.0,
+        cpu_seconds: Optional[float] = 1.0,
+        memory_mb: Optional[int] = 256,
+        max_calls: int = 1000,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024 if memory_mb else None
+        self.max_calls = max_calls
+
+        # fork: workers start instantly and need no importable __main__ (notebooks, scripts)
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "timeouts": 0, "crashes": 0, "respawns": 0}
+        self._all = [self._spawn() for _ in range(workers)]
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for worker in self._all:
+            self._idle.put(worker)
+        self._closed = False
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._context, self.memory_bytes)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        fresh = self._spawn()
+        with self._lock:
+            self._all[self._all.index(worker)] = fresh
+            self._counters["respawns"] += 1
+        return fresh
+
+    def run(self, func: Callable[[str], str], argument: str) -> str:
+        """
+        Call func(argument) in a worker process and return its result as a string.
+
+        func must be importable by name (a module-level function).
+
+        Raises:
+            ToolTimeout: if no result arrived within timeout seconds.
+            SandboxError: if the worker died, e.g. on the CPU limit.
+        """
+        if self._closed:
+            raise SandboxError("sandbox pool is closed")
+
+        worker = self._idle.get()
+        try:
+            with self._lock:
+                self._counters["calls"] += 1
+            worker.calls += 1
+
+            try:
+                worker.conn.send((func, argument, self.cpu_seconds))
+                ready = worker.conn.poll(self.timeout)
+                result = worker.conn.recv() if ready else None
+            except (EOFError, OSError):
+                ready, result = True, None
+
+            if not ready:
+                worker = self._replace(worker)
+                with self._lock:
+                    self._counters["timeouts"] += 1
+                raise ToolTimeout(f"timed out after {self.timeout:g}s")
+
+            if result is None:
+                worker.process.join(0.5)
+                exitcode = worker.process.exitcode
+                worker = self._replace(worker)
+                with self._lock:
+                    self._counters["crashes"] += 1
+                raise SandboxError(f"worker process died (exit code {exitcode})")
+
+            if worker.calls >= self.max_calls:
+                worker = self._replace(worker)
+            return result
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._all:
+            worker.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "workers": self.workers}
+
+
+_DEFAULT_POOL: Optional[SandboxPool] = None
+_DEFAULT_POOL_LOCK = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """
+    Process-wide sandbox pool, started on first use. TOOL_WORKERS sets the
+    number of workers, TOOL_TIMEOUT the wall-clock limit in seconds,
+    TOOL_CPU_SECONDS and TOOL_MEMORY_MB the per-worker rlimits.
+    """
+    global _DEFAULT_POOL
+    with _DEFAULT_POOL_LOCK:
+        if _DEFAULT_POOL is None:
+            _DEFAULT_POOL = SandboxPool(
+                workers=int(os.getenv("TOOL_WORKERS", "2")),
+                timeout=float(os.getenv("TOOL_TIMEOUT", "2.0")),
+                cpu_seconds=float(os.getenv("TOOL_CPU_SECONDS", "1.0")),
+                memory_mb=int(os.getenv("TOOL_MEMORY_MB", "256")),
+            )
+            atexit.register(_DEFAULT_POOL.close)
+        return _DEFAULT_POOL
@@ -0,0 +1,124 @@
+import math
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from .retrieval import TOKEN_PATTERN
+
+
+# === ENCODER ===
+class HashingEncoder:
+    """
+    Offline text encoder: character n-grams hashed into a fixed number of
+    buckets with a random sign, sublinear tf weighting and L2 normalization.
+
+    No vocabulary or corpus statistics are kept, so a text always maps to the
+    same vector and stored vectors never need to be recomputed.
+    """
+
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (3, 5), max_chars: int = 4000):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.max_chars = max_chars
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        low, high = self.ngram_range
+
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text[: self.max_chars].lower())
+            padded = f" {' '.join(words)} "
+            counts = Counter(
+                padded[i : i + n] for n in range(low, high + 1) for i in range(len(padded) - n + 1)
+            )
+            for gram, tf in counts.items():
+                h = zlib.crc32(gram.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + math.log(tf))
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+# === VECTOR STORE ===
+class VectorStore:
+    """
+    Row-major float32 matrix stored as a raw file and read through np.memmap.
+
+    Rows are appended to the end of the file, so growing the store never
+    rewrites existing vectors; the row count is derived from the file size.
+    """
+
+    def __init__(self, path: Path, dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self.row_bytes = 4 * dim
+        if not self.path.exists():
+            self.path.touch()
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return self.path.stat().st_size // self.row_bytes
+
+    def append(self, vectors: np.ndarray):
+        if len(vectors) == 0:
+            return
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+
+    def reset(self):
+        self._matrix = None
+        self.path.write_bytes(b"")
+
+    def matrix(self) -> np.ndarray:
+        count = len(self)
+        if self._matrix is None or self._matrix.shape[0] != count:
+            if count == 0:
+                self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self.path, dtype="<f4", mode="r", shape=(count, self.dim))
+        return self._matrix
+
+    def search(self, queries: np.ndarray, k: int = 3, block_rows: int = 65536) -> List[List[Tuple[int, float]]]:
+        """
+        Cosine top-k for a batch of L2-normalized query vectors.
+
+        The matrix is scanned in blocks of block_rows; each block is scored for
+        all queries with one matrix product and only k candidates per query
+        are carried over to the next block.
+
+        Returns:
+            For every query, a list of (row, score) pairs, best first.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        matrix = self.matrix()
+        n_queries = queries.shape[0]
+        if k <= 0 or matrix.shape[0] == 0:
+            return [[] for _ in range(n_queries)]
+
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+
+        for start in range(0, matrix.shape[0], block_rows):
+            scores = queries @ np.asarray(matrix[start : start + block_rows]).T
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)], axis=1
+            )
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
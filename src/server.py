@@ -0,0 +1,542 @@
+"""
+ASGI service exposing the agent graph over HTTP.
+
+Endpoints:
+    POST /v1/run      {"query": ..., "user_id": ..., "history_mode": ..., "run_id": ...}
+                      -> {"query", "category", "execution_plan", "final_answer"}
+    POST /v1/stream   same body; the answer as Server-Sent Events: one
+                      "data: <JSON string>" event per piece, then "event: done"
+    POST /v1/batch    {"queries": [...], "user_ids": [...], "batch_routing": false} -> {"results": [...]}
+                      (batch_routing classifies all queries with batched router calls)
+    GET  /healthz     liveness and current load
+    GET  /metrics     request counters, latencies and cache statistics (JSON)
+
+All requests share one Orchestrator (one compiled graph) and one pooled
+async HTTP client to the LLM backend. At most max_in_flight queries run at
+once; up to max_queue more wait for a slot (at most queue_timeout seconds).
+Beyond that the server answers 503 with Retry-After instead of piling up
+work. Batch queries (at most max_batch per request) wait for slots without
+counting against max_queue; one that gets none in time comes back with an
+"error".
+
+Usage (from the repository root, needs uvicorn):
+    python -m src.server --port 8000 --max-in-flight 16 --max-queue 64
+
+Against the local fake LLM backend:
+    python -m bench.fake_openai_server --port 8089 &
+    LITELLM_BASE_URL=http://127.0.0.1:8089/v1 python -m src.server
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .trace_report import percentile
+
+
+# === ADMISSION CONTROL ===
+class Overloaded(RuntimeError):
+    """
+    Raised when a query can get no slot: the queue is full or the wait timed out.
+    """
+
+
+class AdmissionControl:
+    """
+    Async context manager admitting at most max_in_flight queries at a time,
+    with a bounded waiting queue.
+
+        async with admission:
+            await orchestrator.arun(query)
+
+    Entering raises Overloaded when max_queue queries are already waiting or
+    no slot frees up within queue_timeout seconds.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self, bounded: bool = True):
+        """
+        Wait for a slot. With bounded=False the wait does not count against
+        max_queue (used for batch items, whose number is capped by max_batch).
+        """
+        if self._semaphore.locked():
+            if bounded and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"queue full ({self.waiting} waiting)")
+            self.waiting += bounded
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(f"no slot within {self.queue_timeout:g}s") from None
+            finally:
+                self.waiting -= bounded
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "AdmissionControl":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def unbounded(self) -> "_UnboundedSlots":
+        return _UnboundedSlots(self)
+
+
+class _UnboundedSlots:
+    def __init__(self, admission: AdmissionControl):
+        self.admission = admission
+
+    async def __aenter__(self):
+        await self.admission.acquire(bounded=False)
+
+    async def __aexit__(self, *exc_info):
+        self.admission.release()
+
+
+# === METRICS ===
+class ServerMetrics:
+    """
+    Request counters and the latencies of the last window requests per endpoint.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.started = time.time()
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        self.requests[endpoint] += 1
+        self.statuses[str(status)] += 1
+        self._latencies[endpoint].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        latency = {}
+        for endpoint, samples in self._latencies.items():
+            values = sorted(samples)
+            latency[endpoint] = {
+                "p50_ms": 1000 * percentile(values, 0.50),
+                "p95_ms": 1000 * percentile(values, 0.95),
+                "max_ms": 1000 * values[-1] if values else 0.0,
+            }
+        return {
+            "uptime_s": time.time() - self.started,
+            "requests": dict(self.requests),
+            "statuses": dict(self.statuses),
+            "latency": latency,
+        }
+
+
+def result_body(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON-safe part of a final graph state (the memory handle and the full
+    agent log stay on the server).
+    """
+    body = {key: result.get(key) for key in ("query", "category", "execution_plan", "final_answer")}
+    if result.get("error"):
+        body["error"] = result["error"]
+    return body
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+# === APP ===
+class AgentServer:
+    """
+    The ASGI application. Startup (on the ASGI lifespan event, or on the
+    first request when the server does not send one) creates the pooled LLM
+    client and the Orchestrator; shutdown closes the client.
+
+    Args:
+        orchestrator: Use this Orchestrator instead of building one from the
+            environment (see main.build_orchestrator).
+        max_in_flight: Queries running at the same time.
+        max_queue: Queries allowed to wait for a slot.
+        queue_timeout: Seconds a query may wait for a slot.
+        max_batch: Largest accepted /v1/batch request.
+        llm_connections: Size of the HTTP connection pool to the LLM backend.
+        max_body_bytes: Largest accepted request body.
+    """
+
+    def __init__(
+        self,
+        orchestrator=None,
+        max_in_flight: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 30.0,
+        max_batch: int = 256,
+        llm_connections: int = 64,
+        max_body_bytes: int = 1 << 20,
+    ):
+        self.orchestrator = orchestrator
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_batch = max_batch
+        self.llm_connections = llm_connections
+        self.max_body_bytes = max_body_bytes
+
+        self.admission: Optional[AdmissionControl] = None
+        self.metrics = ServerMetrics()
+        self._http_client = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+        self.routes: Dict[Tuple[str, str], Callable] = {
+            ("POST", "/v1/run"): self.handle_run,
+            ("POST", "/v1/stream"): self.handle_stream,
+            ("POST", "/v1/batch"): self.handle_batch,
+            ("GET", "/healthz"): self.handle_health,
+            ("GET", "/metrics"): self.handle_metrics,
+        }
+
+    # --- lifecycle ---
+    async def startup(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.admission is not None:
+                return
+            if self.orchestrator is None:
+                import httpx
+
+                from .llm import get_llm
+                from .main import build_orchestrator
+
+                limits = httpx.Limits(max_connections=self.llm_connections,
+                                      max_keepalive_connections=self.llm_connections)
+                self._http_client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120.0, connect=10.0))
+                # retries are made per agent by resilient_model (see build_agents)
+                llm = get_llm(http_async_client=self._http_client, max_retries=0)
+                # building the agents loads the pre-router and caches, keep it off the loop;
+                # every model tier shares the pooled client too (see ModelConfig)
+                self.orchestrator = await asyncio.to_thread(
+                    build_orchestrator, llm, {"http_async_client": self._http_client}
+                )
+            self.admission = AdmissionControl(self.max_in_flight, self.max_queue, self.queue_timeout)
+
+    async def shutdown(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as exc:
+                    await send({"type": "lifespan.startup.failed", "message": f"{type(exc).__name__}: {exc}"})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # --- HTTP plumbing ---
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        path = scope["path"]
+        handler = self.routes.get((scope["method"], path))
+        status = 200
+        try:
+            if handler is None:
+                known = any(route_path == path for _, route_path in self.routes)
+                raise HTTPError(405 if known else 404, "method not allowed" if known else "not found")
+            await self.startup()
+            status = await handler(scope, receive, send)
+        except HTTPError as exc:
+            status = exc.status
+            await send_json(send, status, {"error": exc.message}, exc.headers)
+        except Exception as exc:
+            status = 500
+            await send_json(send, status, {"error": f"{type(exc).__name__}: {exc}"})
+        finally:
+            self.metrics.record(path if handler else "other", status, time.perf_counter() - start)
+
+    async def _read_json(self, receive) -> Dict[str, Any]:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise HTTPError(413, f"body larger than {self.max_body_bytes} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        try:
+            body = json.loads(b"".join(chunks) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON") from None
+        if not isinstance(body, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return body
+
+    def _overloaded(self, exc: Overloaded) -> HTTPError:
+        retry_after = str(max(1, int(self.queue_timeout / 4)))
+        return HTTPError(503, f"overloaded: {exc}", [(b"retry-after", retry_after.encode())])
+
+    @staticmethod
+    def _query_args(body: Dict[str, Any]) -> Dict[str, Any]:
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, '"query" must be a non-empty string')
+        history_mode = body.get("history_mode", "recent")
+        if history_mode not in ("recent", "relevant"):
+            raise HTTPError(400, '"history_mode" must be "recent" or "relevant"')
+        user_id, run_id = body.get("user_id"), body.get("run_id")
+        if user_id is not None and not isinstance(user_id, str):
+            raise HTTPError(400, '"user_id" must be a string')
+        if run_id is not None and not isinstance(run_id, str):
+            raise HTTPError(400, '"run_id" must be a string')
+        return {"query": query, "history_mode": history_mode, "user_id": user_id, "run_id": run_id}
+
+    # --- endpoints ---
+    async def handle_run(self, scope, receive, send) -> int:
+        args = self._query_args(await self._read_json(receive))
+        from .main import RunInProgress
+
+        try:
+            async with self.admission:
+                result = await self.orchestrator.arun(**args)
+        except Overloaded as exc:
+            raise self._overloaded(exc)
+        except RunInProgress as exc:
+            raise HTTPError(409, str(exc))
+        await send_json(send, 200, result_body(result))
+        return 200
+
+    async def handle_stream(self, scope, receive, send) -> int:
+        """
+        Stream the run as server-sent events. A client that disconnects
+        (http.disconnect, or a failed send) cancels the run, which frees its
+        admission slot; such requests are counted with status 499. A run
+        failing after the headers went out ends the stream with an "error"
+        event and is counted as 500.
+        """
+        args = self._query_args(await self._read_json(receive))
+        try:
+            await self.admission.acquire()
+        except Overloaded as exc:
+            raise self._overloaded(exc)
+
+        try:
+            stream = asyncio.ensure_future(self._stream_events(args, _client_send(send)))
+            disconnect = asyncio.ensure_future(wait_disconnect(receive))
+            try:
+                await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (stream, disconnect):
+                    task.cancel()
+                await asyncio.gather(stream, disconnect, return_exceptions=True)
+            if stream.cancelled():
+                return CLIENT_CLOSED
+            return stream.result()
+        finally:
+            self.admission.release()
+
+    async def _stream_events(self, args: Dict[str, Any], send) -> int:
+        pieces = self.orchestrator.astream_run(**args)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            })
+            try:
+                async for piece in pieces:
+                    await send_event(send, json.dumps(piece))
+                await send_event(send, "{}", event="done", more=False)
+            except ClientGone:
+                raise
+            except Exception as exc:
+                # headers are already sent: report the failure in the stream, if the client is still there
+                with contextlib.suppress(ClientGone):
+                    await send_event(send, json.dumps({"error": f"{type(exc).__name__}: {exc}"}), event="error", more=False)
+                return 500
+        except ClientGone:
+            return CLIENT_CLOSED
+        finally:
+            await pieces.aclose()
+        return 200
+
+    async def handle_batch(self, scope, receive, send) -> int:
+        body = await self._read_json(receive)
+        queries = body.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise HTTPError(400, '"queries" must be a list of strings')
+        if len(queries) > self.max_batch:
+            raise HTTPError(413, f"at most {self.max_batch} queries per batch")
+        user_ids = body.get("user_ids")
+        if user_ids is not None and (not isinstance(user_ids, list) or len(user_ids) != len(queries)):
+            raise HTTPError(400, '"user_ids" must be a list with one entry per query')
+        history_mode = body.get("history_mode", "recent")
+        if history_mode not in ("recent", "relevant"):
+            raise HTTPError(400, '"history_mode" must be "recent" or "relevant"')
+        batch_routing = body.get("batch_routing", False)
+        if not isinstance(batch_routing, bool):
+            raise HTTPError(400, '"batch_routing" must be a boolean')
+
+        results = await self.orchestrator.arun_batch(
+            queries, history_mode=history_mode, user_ids=user_ids, limiter=self.admission.unbounded(),
+            batch_routing=batch_routing,
+        )
+        await send_json(send, 200, {"results": [result_body(result) for result in results]})
+        return 200
+
+    async def handle_health(self, scope, receive, send) -> int:
+        await send_json(send, 200, {
+            "status": "ok",
+            "in_flight": self.admission.in_flight,
+            "waiting": self.admission.waiting,
+        })
+        return 200
+
+    async def handle_metrics(self, scope, receive, send) -> int:
+        await send_json(send, 200, self.stats())
+        return 200
+
+    def stats(self) -> Dict[str, Any]:
+        from .models import get_tier_stats
+        from .resilience import get_call_stats
+        from .tool_cache import get_tool_cache
+
+        stats = self.metrics.stats()
+        stats["admission"] = {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.admission.in_flight if self.admission else 0,
+            "waiting": self.admission.waiting if self.admission else 0,
+            "rejected": self.admission.rejected if self.admission else 0,
+        }
+        stats["tool_cache"] = get_tool_cache().stats()
+        stats["models"] = get_tier_stats().stats()
+        stats["llm_calls"] = get_call_stats().stats()
+        if self.orchestrator is not None:
+            if self.orchestrator.llm_cache is not None:
+                stats["llm_cache"] = self.orchestrator.llm_cache.stats()
+            router = self.orchestrator.agents.get("router")
+            prerouter = getattr(router, "prerouter", None)
+            if prerouter is not None:
+                stats["prerouter"] = prerouter.stats()
+            if hasattr(router, "batch_stats"):
+                stats["batch_routing"] = router.batch_stats()
+            stats["runs"] = self.orchestrator.stats()
+            history_manager = getattr(self.orchestrator.agents.get("code_assistant"), "history_manager", None)
+            if history_manager is not None:
+                stats["history"] = history_manager.stats()
+        return stats
+
+
+# nginx's status for a request whose client went away before the response
+CLIENT_CLOSED = 499
+
+
+class ClientGone(Exception):
+    """
+    A message could not be sent: the client closed the connection.
+    """
+
+
+def _client_send(send):
+    """
+    send raising ClientGone for any failure, so it is told apart from a failing run.
+    """
+    async def client_send(message):
+        try:
+            await send(message)
+        except Exception as exc:
+            raise ClientGone(f"{type(exc).__name__}: {exc}") from exc
+
+    return client_send
+
+
+async def wait_disconnect(receive):
+    """
+    Return once the client disconnects (the request body was already read).
+    """
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_json(send, status: int, body: Dict[str, Any], headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        + list(headers or []),
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def send_event(send, data: str, event: Optional[str] = None, more: bool = True):
+    message = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+    await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": more})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--llm-connections", type=int, default=64)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = AgentServer(
+        max_in_flight=args.max_in_flight,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        max_batch=args.max_batch,
+        llm_connections=args.llm_connections,
+    )
+    # one process and one event loop: the graph and the connection pool are shared by all requests
+    uvicorn.run(app, host=args.host, port=args.port, workers=1, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
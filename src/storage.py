@@ -0,0 +1,449 @@
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only exclude threads of this process
+    fcntl = None
+
+
+# === LOCKING AND ATOMIC WRITES ===
+class FileLock:
+    """
+    Exclusive lock shared by the threads of this process and by other
+    processes: a re-entrant thread lock plus fcntl.flock on a sidecar lock
+    file. The lock file is never deleted; its content is irrelevant.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._file = open(self.path, "ab")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+def atomic_write_text(path: Path, text: str):
+    """
+    Replace path with text so readers see either the old or the new content,
+    never a truncated file: write a unique temp file next to it, fsync, rename.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            tmp.write(text)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+# === LEGACY JSON BACKEND ===
+class JsonBackend:
+    """
+    Original storage layout: one pretty-printed JSON document holding both
+    "msg_history" and "profile_notes". Every write rewrites the whole file
+    (atomically, under the "<name>.lock" file lock).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = FileLock(self.path.with_name(f"{self.path.name}.lock"))
+        with self._lock:
+            if not self.path.exists():
+                self._write({"msg_history": [], "profile_notes": []})
+
+    def lock(self) -> FileLock:
+        return self._lock
+
+    def _read(self) -> Dict:
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        data.setdefault("msg_history", [])
+        data.setdefault("profile_notes", data.pop("profile", []))
+        return data
+
+    def _write(self, data: Dict):
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def tail_history(self, n: int) -> List[Dict]:
+        return self._read()["msg_history"][-n:] if n > 0 else []
+
+    def history_at(self, positions: List[int]) -> List[Dict]:
+        history = self._read()["msg_history"]
+        return [history[i] for i in positions]
+
+    def append_history(self, entry: Dict):
+        with self._lock:
+            data = self._read()
+            data["msg_history"].append(entry)
+            self._write(data)
+
+    def profile_notes(self) -> List[Dict]:
+        return self._read()["profile_notes"]
+
+    def append_profile(self, note: Dict):
+        with self._lock:
+            data = self._read()
+            data["profile_notes"].append(note)
+            self._write(data)
+
+    def history_count(self) -> int:
+        return len(self._read()["msg_history"])
+
+    def fingerprint(self):
+        return _stat_key(self.path)
+
+    def close(self):
+        pass
+
+
+# === APPEND-ONLY JSONL BACKEND ===
+class JsonlLog:
+    """
+    Append-only log of JSON records, one per line, with a sidecar index of
+    fixed-width little-endian uint64 byte offsets (one per record).
+
+    Appends are O(1) and the last N records are read by seeking straight to
+    their offset, so reads never touch older entries.
+
+    Appends and crash recovery hold a FileLock ("<stem>.lock" unless one is
+    passed in), so threads and processes can share the log. Readers take no
+    lock: a record becomes visible once its index entry is written.
+    """
+
+    OFFSET = struct.Struct("<Q")
+
+    def __init__(self, path: Path, lock: Optional[FileLock] = None):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".idx")
+        self._lock = lock or FileLock(self.path.with_suffix(".lock"))
+        with self._lock:
+            if not self.path.exists():
+                self.path.touch()
+            self._recover()
+
+    def __len__(self) -> int:
+        return self.index_path.stat().st_size // self.OFFSET.size
+
+    def append(self, record: Dict):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as log:
+                offset = log.tell()
+                log.write(line)
+            with open(self.index_path, "ab") as index:
+                index.write(self.OFFSET.pack(offset))
+
+    def tail(self, n: int) -> List[Dict]:
+        count = len(self)
+        n = min(n, count)
+        if n <= 0:
+            return []
+
+        with open(self.index_path, "rb") as index:
+            index.seek((count - n) * self.OFFSET.size)
+            (start,) = self.OFFSET.unpack(index.read(self.OFFSET.size))
+
+        with open(self.path, "rb") as log:
+            log.seek(start)
+            # records appended after the index was read may follow; stop at n
+            lines = [line for line in log.read().splitlines() if line]
+        return [json.loads(line) for line in lines[:n]]
+
+    def get(self, positions: List[int]) -> List[Dict]:
+        """
+        Read the records at the given positions via their indexed offsets.
+        """
+        records = []
+        with open(self.index_path, "rb") as index, open(self.path, "rb") as log:
+            for position in positions:
+                index.seek(position * self.OFFSET.size)
+                (offset,) = self.OFFSET.unpack(index.read(self.OFFSET.size))
+                log.seek(offset)
+                records.append(json.loads(log.readline()))
+        return records
+
+    def read_all(self) -> List[Dict]:
+        count = len(self)
+        with open(self.path, "rb") as log:
+            lines = [line for line in log if line.strip()]
+        return [json.loads(line) for line in lines[:count]]
+
+    def _recover(self):
+        """
+        Bring the index back in sync with the log after a crash: drop a
+        trailing partial line and rebuild the index if it does not end
+        exactly at the end of the log.
+        """
+        size = self.path.stat().st_size
+        if size:
+            with open(self.path, "rb+") as log:
+                log.seek(size - 1)
+                if log.read(1) != b"\n":
+                    log.seek(0)
+                    data = log.read()
+                    size = data.rfind(b"\n") + 1
+                    log.truncate(size)
+
+        if self.index_path.exists() and self._index_matches(size):
+            return
+
+        offsets = bytearray()
+        with open(self.path, "rb") as log:
+            offset = 0
+            for line in log:
+                if line.strip():
+                    offsets += self.OFFSET.pack(offset)
+                offset += len(line)
+        self.index_path.write_bytes(bytes(offsets))
+
+    def _index_matches(self, log_size: int) -> bool:
+        index_size = self.index_path.stat().st_size
+        if index_size % self.OFFSET.size:
+            return False
+        if index_size == 0:
+            return log_size == 0
+
+        with open(self.index_path, "rb") as index:
+            index.seek(index_size - self.OFFSET.size)
+            (last,) = self.OFFSET.unpack(index.read(self.OFFSET.size))
+        if last >= log_size:
+            return False
+        with open(self.path, "rb") as log:
+            log.seek(last)
+            log.readline()
+            return log.tell() == log_size
+
+
+class JsonlBackend:
+    """
+    Two append-only logs next to the memory path:
+    "<stem>.history.jsonl" and "<stem>.profile.jsonl" (plus their ".idx" files),
+    sharing one "<stem>.lock" file lock.
+    """
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        self._lock = FileLock(path.with_suffix(".lock"))
+        self.history = JsonlLog(path.with_name(f"{path.stem}.history.jsonl"), self._lock)
+        self.profile = JsonlLog(path.with_name(f"{path.stem}.profile.jsonl"), self._lock)
+
+    def lock(self) -> FileLock:
+        return self._lock
+
+    def tail_history(self, n: int) -> List[Dict]:
+        return self.history.tail(n)
+
+    def history_at(self, positions: List[int]) -> List[Dict]:
+        return self.history.get(positions)
+
+    def append_history(self, entry: Dict):
+        self.history.append(entry)
+
+    def profile_notes(self) -> List[Dict]:
+        return self.profile.read_all()
+
+    def append_profile(self, note: Dict):
+        self.profile.append(note)
+
+    def history_count(self) -> int:
+        return len(self.history)
+
+    def fingerprint(self):
+        return _stat_key(self.history.path), _stat_key(self.profile.path)
+
+    def close(self):
+        pass
+
+
+# === SQLITE BACKEND ===
+class SqliteBackend:
+    """
+    SQLite database at "<stem>.db" with one table per memory section.
+
+    The database runs in WAL mode, so readers in other processes are not
+    blocked by a writer, and waits up to busy_timeout for a concurrent writer.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS msg_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT NOT NULL,
+        assistant TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS profile_notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path: Path, busy_timeout: float = 30.0):
+        path = Path(path)
+        self.path = path.with_suffix(".db")
+        self.conn = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        # the connection is shared by threads; keep their transactions apart
+        self._lock = threading.RLock()
+
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    def tail_history(self, n: int) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT user, assistant FROM msg_history ORDER BY id DESC LIMIT ?", (max(n, 0),)
+        ).fetchall()
+        return [{"user": user, "assistant": assistant} for user, assistant in reversed(rows)]
+
+    def history_at(self, positions: List[int]) -> List[Dict]:
+        entries = []
+        for position in positions:
+            user, assistant = self.conn.execute(
+                "SELECT user, assistant FROM msg_history ORDER BY id LIMIT 1 OFFSET ?", (position,)
+            ).fetchone()
+            entries.append({"user": user, "assistant": assistant})
+        return entries
+
+    def append_history(self, entry: Dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO msg_history (user, assistant) VALUES (?, ?)",
+                (entry.get("user", ""), entry.get("assistant", "")),
+            )
+
+    def profile_notes(self) -> List[Dict]:
+        rows = self.conn.execute("SELECT title, content FROM profile_notes ORDER BY id").fetchall()
+        return [{"title": title, "content": content} for title, content in rows]
+
+    def append_profile(self, note: Dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO profile_notes (title, content) VALUES (?, ?)",
+                (note.get("title", ""), note.get("content", "")),
+            )
+
+    def history_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM msg_history").fetchone()[0]
+
+    def fingerprint(self):
+        # data_version changes whenever another connection commits to the file
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _stat_key(path: Path):
+    """
+    Cheap change detector for a file: (mtime in ns, size).
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+BACKENDS = {
+    "json": JsonBackend,
+    "jsonl": JsonlBackend,
+    "sqlite": SqliteBackend,
+}
+
+
+def open_backend(path: Path, backend: str = "jsonl"):
+    """
+    Open a storage backend for the given memory path.
+
+    A legacy "memory.json" found at path is imported into the jsonl/sqlite
+    store once; the original file is left untouched. Completion is recorded
+    in a "<stem>.<backend>.migrated" marker file, and an import interrupted
+    by a crash is resumed on the next start (see _migrate).
+
+    Args:
+        path: Path of the (legacy) memory JSON file; other backends store
+            their files next to it.
+        backend: One of "json", "jsonl" or "sqlite".
+
+    Returns:
+        Backend instance exposing tail_history/history_at/append_history/profile_notes/append_profile
+        and lock() (held around writes that must not interleave with other writers).
+    """
+    path = Path(path)
+    backend_cls = BACKENDS.get(backend)
+    if backend_cls is None:
+        raise ValueError(f"Unknown memory backend '{backend}', expected one of {sorted(BACKENDS)}")
+
+    if backend_cls is JsonBackend:
+        return JsonBackend(path)
+
+    store = backend_cls(path)
+    marker = path.with_name(f"{path.stem}.{backend}.migrated")
+    with store.lock():
+        if path.exists() and not marker.exists():
+            _migrate(JsonBackend(path), store)
+            atomic_write_text(marker, "")
+    return store
+
+
+def _same_entry(a: Dict, b: Dict) -> bool:
+    return (a.get("user", ""), a.get("assistant", "")) == (b.get("user", ""), b.get("assistant", ""))
+
+
+def _migrate(source: JsonBackend, target):
+    """
+    Append the legacy history, then the legacy notes, to target.
+
+    An interrupted import leaves a prefix of that sequence in target, so the
+    import resumes after what is already there. A target whose history is
+    not such a prefix holds data of its own and is left alone.
+    """
+    data = source._read()
+    history, notes = data["msg_history"], data["profile_notes"]
+    n_history, n_notes = target.history_count(), len(target.profile_notes())
+
+    if n_history > len(history) or (n_notes and n_history < len(history)):
+        return
+    if n_history and not _same_entry(target.history_at([n_history - 1])[0], history[n_history - 1]):
+        return
+
+    for entry in history[n_history:]:
+        target.append_history(entry)
+    for note in notes[n_notes:]:
+        target.append_profile(note)
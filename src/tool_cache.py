@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+# Cache policies a tool can declare in AVAILABLE_TOOLS under "cache":
+#   "pure"      - the result depends only on the arguments; cached in memory and on disk
+#   "cacheable" - stable within a process; cached in memory only
+#   "never"     - always executed (default)
+CACHE_POLICIES = ("pure", "cacheable", "never")
+
+
+def normalize_arguments(arguments: str) -> str:
+    """
+    Canonical form of a tool argument string: unified line endings, no
+    surrounding whitespace. Inner whitespace is kept since it can be significant
+    (indentation, string literals).
+    """
+    return arguments.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def tool_cache_key(tool_name: str, arguments: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(tool_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_arguments(arguments).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# === TOOL RESULT CACHE ===
+class ToolResultCache:
+    """
+    Memoization of tool results keyed by tool name and normalized arguments.
+
+    Tier 1 is an in-process LRU of max_entries results; tier 2 is an optional
+    SQLite file (path) used only for "pure" tools and bounded by
+    max_disk_entries, evicting least recently used rows.
+    """
+
+    def __init__(self, max_entries: int = 4096, path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_entries = 0
+        self._tick = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tool_cache (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    accessed INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tool_cache_accessed ON tool_cache (accessed);
+                """
+            )
+            self._disk_entries, self._tick = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(accessed), 0) FROM tool_cache"
+            ).fetchone()
+
+    def get(self, tool_name: str, arguments: str, policy: str) -> Optional[str]:
+        if policy not in ("pure", "cacheable"):
+            return None
+        key = tool_cache_key(tool_name, arguments)
+
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return result
+
+            if policy == "pure" and self._conn is not None:
+                row = self._conn.execute("SELECT result FROM tool_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._tick += 1
+                    with self._conn:
+                        self._conn.execute("UPDATE tool_cache SET accessed = ? WHERE key = ?", (self._tick, key))
+                    self._remember(key, row[0])
+                    self._counters["disk_hits"] += 1
+                    return row[0]
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, tool_name: str, arguments: str, policy: str, result: str):
+        if policy not in ("pure", "cacheable"):
+            return
+        key = tool_cache_key(tool_name, arguments)
+
+        with self._lock:
+            self._remember(key, result)
+            self._counters["stores"] += 1
+
+            if policy == "pure" and self._conn is not None:
+                self._tick += 1
+                with self._conn:
+                    inserted = self._conn.execute(
+                        "INSERT OR IGNORE INTO tool_cache (key, result, accessed) VALUES (?, ?, ?)",
+                        (key, result, self._tick),
+                    ).rowcount
+                self._disk_entries += inserted
+                self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM tool_cache")
+                self._disk_entries = 0
+
+    def _remember(self, key: str, result: str):
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _evict_disk(self):
+        excess = self._disk_entries - self.max_disk_entries
+        if excess <= 0:
+            return
+        with self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM tool_cache WHERE key IN (SELECT key FROM tool_cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            ).rowcount
+        self._disk_entries -= removed
+        self._counters["evictions"] += removed
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            counters["hit_rate"] = (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+            counters["memory_entries"] = len(self._lru)
+            counters["disk_entries"] = self._disk_entries
+            return counters
+
+
+_DEFAULT_CACHE: Optional[ToolResultCache] = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_tool_cache() -> ToolResultCache:
+    """
+    Process-wide tool result cache. TOOL_CACHE_SIZE sets the LRU size;
+    TOOL_CACHE_PATH enables the SQLite tier for pure tools.
+    """
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = ToolResultCache(
+                max_entries=int(os.getenv("TOOL_CACHE_SIZE", "4096")),
+                path=os.getenv("TOOL_CACHE_PATH") or None,
+            )
+        return _DEFAULT_CACHE
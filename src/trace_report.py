@@ -0,0 +1,90 @@
+"""
+Summarize a JSONL trace file written with TRACE_PATH / configure_tracing().
+
+Prints one row per stage (span name: run, node.router, tool.calculator,
+memory.get_history, ...) with the call count, p50/p95/max latency, the share
+of total run time (spans running concurrently, like tool calls, can add up
+to more than 100%), errors and summed counters (tokens, cache hits).
+
+Usage (from the repository root):
+    python -m src.trace_report traces.jsonl
+    python -m src.trace_report traces.jsonl --json
+"""
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+
+def load_spans(paths: List[Path]) -> List[Dict]:
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    spans.append(json.loads(line))
+    return spans
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(spans: List[Dict]) -> Dict[str, Dict]:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    errors: Dict[str, int] = defaultdict(int)
+
+    for span in spans:
+        name = span["name"]
+        durations[name].append(span["duration_ms"])
+        for key, value in (span.get("counters") or {}).items():
+            counters[name][key] += value
+        if span.get("status") != "ok":
+            errors[name] += 1
+
+    run_total = sum(durations.get("run", [])) or sum(sum(v) for v in durations.values())
+
+    summary = {}
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "max_ms": values[-1],
+            "share": sum(values) / run_total if run_total else 0.0,
+            "errors": errors[name],
+            **dict(counters[name]),
+        }
+    return summary
+
+
+def format_table(summary: Dict[str, Dict]) -> str:
+    header = f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'share':>8}{'errors':>8}  counters"
+    lines = [header, "-" * len(header)]
+    fixed = {"count", "p50_ms", "p95_ms", "max_ms", "share", "errors"}
+    for name, row in summary.items():
+        extra = ", ".join(f"{k}={v:g}" for k, v in row.items() if k not in fixed)
+        lines.append(
+            f"{name:<28}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            f"{row['max_ms']:>10.1f}{row['share']:>8.1%}{row['errors']:>8}  {extra}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", type=Path, nargs="+", help="JSONL trace files")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(load_spans(args.traces))
+    print(json.dumps(summary, indent=2) if args.json else format_table(summary))
+
+
+if __name__ == "__main__":
+    main()
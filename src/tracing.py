@@ -0,0 +1,309 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# === SPANS ===
+class Span:
+    """
+    One timed operation: a graph node, a tool call, a memory operation, ...
+
+    attributes hold descriptive values set when the span is opened; counters
+    are numbers accumulated while it runs (tokens, cache hits) via annotate().
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "end",
+                 "attributes", "counters", "status", "error")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.counters: Dict[str, float] = {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def add(self, **counters: float):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_ms": 1000 * ((self.end or time.time()) - self.start),
+            "attributes": self.attributes,
+            "counters": self.counters,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+_CURRENT_SPAN: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT_SPAN.get()
+
+
+def annotate(**counters: float):
+    """
+    Add counters (e.g. prompt_tokens=120, llm_cache_hits=1) to the current span.
+    Does nothing when no span is open.
+    """
+    span = _CURRENT_SPAN.get()
+    if span is not None:
+        span.add(**counters)
+
+
+# === EXPORTERS ===
+class JsonlExporter:
+    """
+    Append finished spans to a JSONL file, one span per line (see Span.to_dict).
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class OpenTelemetryExporter:
+    """
+    Forward finished spans to the OpenTelemetry API (needs opentelemetry-api
+    and a configured TracerProvider). Parent/child links are kept by passing
+    the parent's OpenTelemetry context.
+    """
+
+    def __init__(self, service_name: str = "mas"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+        self._lock = threading.Lock()
+        self._open: Dict[str, Any] = {}
+
+    def start(self, span: Span):
+        parent = self._open.get(span.parent_id) if span.parent_id else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = self._tracer.start_span(
+            span.name,
+            context=context,
+            start_time=int(span.start * 1e9),
+            attributes={"kind": span.kind, **_flat(span.attributes)},
+        )
+        with self._lock:
+            self._open[span.span_id] = otel_span
+
+    def export(self, span: Span):
+        with self._lock:
+            otel_span = self._open.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attributes(_flat(span.counters))
+        if span.status != "ok":
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
+
+    def close(self):
+        pass
+
+
+def _flat(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in values.items()}
+
+
+# === TRACER ===
+class Tracer:
+    """
+    Creates spans and hands finished ones to the exporters.
+
+    With no exporter the tracer is disabled and span() costs a single check,
+    so instrumentation can stay in place on hot paths.
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        self.exporters = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+        if not self.exporters:
+            yield None
+            return
+
+        span = Span(name, kind, _CURRENT_SPAN.get(), attributes)
+        for exporter in self.exporters:
+            if hasattr(exporter, "start"):
+                exporter.start(span)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.status = "error"
+            span.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            try:
+                _CURRENT_SPAN.reset(token)
+            except ValueError:
+                # a generator holding the span was closed from another context
+                pass
+            span.end = time.time()
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+_TRACER = Tracer()
+_TRACER_LOCK = threading.Lock()
+_ENV_CHECKED = False
+
+
+def get_tracer() -> Tracer:
+    """
+    Process-wide tracer. Setting TRACE_PATH enables tracing to that JSONL file;
+    configure_tracing() replaces the exporters explicitly.
+    """
+    global _ENV_CHECKED
+    if not _ENV_CHECKED:
+        with _TRACER_LOCK:
+            if not _ENV_CHECKED:
+                path = os.getenv("TRACE_PATH")
+                if path and not _TRACER.exporters:
+                    _TRACER.exporters.append(JsonlExporter(path))
+                    atexit.register(_TRACER.close)
+                _ENV_CHECKED = True
+    return _TRACER
+
+
+def configure_tracing(path: Optional[str] = None, exporters: Optional[List[Any]] = None) -> Tracer:
+    """
+    Replace the exporters of the process-wide tracer: a JSONL file at path
+    and/or custom exporters. Call with no arguments to disable tracing.
+    """
+    global _ENV_CHECKED
+    with _TRACER_LOCK:
+        _TRACER.close()
+        _TRACER.exporters = list(exporters or [])
+        if path:
+            _TRACER.exporters.append(JsonlExporter(path))
+        _ENV_CHECKED = True
+    return _TRACER
+
+
+def traced(name: str, kind: str = "internal") -> Callable:
+    """
+    Decorator running the function inside a span.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = get_tracer()
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# === LLM TOKEN USAGE ===
+def response_token_usage(response) -> Tuple[int, int]:
+    """
+    (prompt_tokens, completion_tokens) of a LangChain LLMResult, read from the
+    messages' usage_metadata or else from llm_output["token_usage"].
+    """
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+
+    if not (prompt_tokens or completion_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+def response_cached_tokens(response) -> int:
+    """
+    Prompt tokens of a LangChain LLMResult served from the backend's prefix
+    cache (OpenAI usage.prompt_tokens_details.cached_tokens), 0 when not reported.
+    """
+    cached = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            cached += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    return cached
+
+
+_TOKEN_HANDLER_CLASS = None
+
+
+def token_usage_handler():
+    """
+    LangChain callback handler adding prompt/completion token counts of every
+    LLM response to the span that made the call (counters "llm_calls",
+    "prompt_tokens", "completion_tokens", "cached_prompt_tokens"). Pass it in the run config, e.g.
+    graph.invoke(state, config={"callbacks": [token_usage_handler()]}).
+    """
+    global _TOKEN_HANDLER_CLASS
+    if _TOKEN_HANDLER_CLASS is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TokenUsageHandler(BaseCallbackHandler):
+            run_inline = True
+
+            def on_llm_end(self, response, **kwargs: Any) -> None:
+                prompt_tokens, completion_tokens = response_token_usage(response)
+                annotate(
+                    llm_calls=1,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    cached_prompt_tokens=response_cached_tokens(response),
+                )
+
+        _TOKEN_HANDLER_CLASS = TokenUsageHandler
+    return _TOKEN_HANDLER_CLASS()
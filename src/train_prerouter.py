@@ -0,0 +1,199 @@
+"""
+Train and evaluate the pre-router's linear model on logged LLM routing decisions.
+
+The log is the JSONL file written by RouterAgent(decision_log=...), e.g. via
+ROUTER_LOG_PATH; each line holds "query", "category", "router" and "latency_s".
+
+The model is saved with the confidence threshold calibrated on the held-out
+examples and the rules' measured precision; PreRouter.load() uses both.
+
+Usage (from the repository root):
+    python -m src.train_prerouter router_log.jsonl --out src/prerouter.npz
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .prerouter import CATEGORIES, DEFAULT_MODEL_PATH, LinearRouterModel, PreRouter, hashed_features
+
+
+# Queries every evaluated variant must not route to a wrong category (falling
+# back to the LLM router is fine). Each was once misrouted by a rule.
+CHECKS: List[Tuple[str, str]] = [
+    ("What are my plans for the weekend?", "planning"),
+    ("What do I have on Friday?", "planning"),
+    ("What is the best way to organize my study schedule?", "planning"),
+]
+
+
+def load_examples(paths: List[Path]) -> Tuple[List[Tuple[str, str]], List[float]]:
+    """
+    Read (query, category) pairs and LLM routing latencies from decision logs.
+    The last decision for a repeated query wins.
+    """
+    examples: Dict[str, str] = {}
+    latencies: List[float] = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("category") in CATEGORIES:
+                    examples[record["query"]] = record["category"]
+                if "latency_s" in record:
+                    latencies.append(float(record["latency_s"]))
+    return list(examples.items()), latencies
+
+
+def train(
+    examples: List[Tuple[str, str]],
+    dim: int = 4096,
+    epochs: int = 15,
+    learning_rate: float = 0.5,
+    l2: float = 1e-4,
+    seed: int = 0,
+) -> LinearRouterModel:
+    """
+    Fit multinomial logistic regression with sparse SGD over hashed features.
+    """
+    rng = random.Random(seed)
+    classes = CATEGORIES
+    class_ids = {c: i for i, c in enumerate(classes)}
+    weights = np.zeros((len(classes), dim), dtype=np.float32)
+    bias = np.zeros(len(classes), dtype=np.float32)
+
+    data = []
+    for query, category in examples:
+        features = hashed_features(query, dim)
+        buckets = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        values = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+        data.append((buckets, values, class_ids[category]))
+
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        lr = learning_rate / (1 + epoch)
+        for buckets, values, label in data:
+            logits = weights[:, buckets] @ values + bias
+            logits -= logits.max()
+            probs = np.exp(logits)
+            probs /= probs.sum()
+            probs[label] -= 1.0
+
+            weights[:, buckets] -= lr * (np.outer(probs, values) + l2 * weights[:, buckets])
+            bias -= lr * probs
+
+    return LinearRouterModel(weights, bias, classes)
+
+
+def calibrate_threshold(model: LinearRouterModel, examples: List[Tuple[str, str]], target_precision: float) -> float:
+    """
+    Lowest confidence at which the model's decisions on examples are at least
+    target_precision accurate; inf (never decide) when there is none.
+    """
+    scored = []
+    for query, category in examples:
+        predicted, confidence = model.predict(query)
+        scored.append((confidence, predicted == category))
+    scored.sort(reverse=True)
+
+    threshold = float("inf")
+    correct = 0
+    for n, (confidence, right) in enumerate(scored, 1):
+        correct += right
+        end_of_ties = n == len(scored) or scored[n][0] < confidence
+        if end_of_ties and correct / n >= target_precision:
+            threshold = confidence
+    return threshold
+
+
+def measure_rule_precision(examples: List[Tuple[str, str]]) -> Optional[float]:
+    """
+    Accuracy of the rules on the examples they match; None when they match none.
+    """
+    prerouter = PreRouter()
+    matched = [(prerouter.match_rules(query), category) for query, category in examples]
+    matched = [(predicted, category) for predicted, category in matched if predicted is not None]
+    if not matched:
+        return None
+    return sum(predicted == category for predicted, category in matched) / len(matched)
+
+
+def evaluate(prerouter: PreRouter, examples: List[Tuple[str, str]], llm_latency: float) -> Dict[str, float]:
+    hits = correct_hits = 0
+    start = time.perf_counter()
+    for query, category in examples:
+        decision = prerouter._classify(query)
+        if decision is not None:
+            hits += 1
+            correct_hits += decision.category == category
+    elapsed = time.perf_counter() - start
+
+    failed_checks = []
+    for query, category in CHECKS:
+        decision = prerouter._classify(query)
+        if decision is not None and decision.category != category:
+            failed_checks.append(f"{query} -> {decision.category}")
+
+    total = len(examples)
+    return {
+        "examples": total,
+        "hit_rate": hits / total if total else 0.0,
+        "accuracy_on_hits": correct_hits / hits if hits else 0.0,
+        "avg_decision_us": 1e6 * elapsed / total if total else 0.0,
+        "llm_router_avg_s": llm_latency,
+        "saved_s_per_query": llm_latency * hits / total if total else 0.0,
+        "failed_checks": failed_checks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", type=Path, nargs="+", help="JSONL decision logs")
+    parser.add_argument("--out", type=Path, default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--dim", type=int, default=4096)
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="confidence needed to route early (default: calibrated on the eval set)")
+    parser.add_argument("--target-precision", type=float, default=0.98,
+                        help="accuracy of early decisions the calibrated threshold aims for")
+    parser.add_argument("--eval-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples, latencies = load_examples(args.logs)
+    if not examples:
+        parser.error("no routing decisions found in the given logs")
+
+    random.Random(args.seed).shuffle(examples)
+    n_eval = int(len(examples) * args.eval_fraction)
+    eval_set, train_set = examples[:n_eval], examples[n_eval:]
+    llm_latency = sum(latencies) / len(latencies) if latencies else 0.0
+
+    model = train(train_set, dim=args.dim, epochs=args.epochs, seed=args.seed)
+    model.threshold = args.threshold
+    if model.threshold is None:
+        model.threshold = calibrate_threshold(model, eval_set, args.target_precision)
+    model.rule_precision = measure_rule_precision(eval_set)
+
+    report = {
+        "train_examples": len(train_set),
+        "threshold": model.threshold,
+        "rule_precision": model.rule_precision,
+        "rules_only": evaluate(PreRouter(threshold=0.0, rule_confidence=1.0, use_rules=True), eval_set, llm_latency),
+        "model_only": evaluate(PreRouter(model), eval_set, llm_latency),
+        "rules_and_model": evaluate(PreRouter(model, use_rules=True), eval_set, llm_latency),
+    }
+    print(json.dumps(report, indent=2))
+
+    model.save(args.out)
+    print(f"Saved model to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,366 @@
-import re
-from typing import Any, Dict, List, Tuple
+import ast
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .sandbox import get_sandbox_pool
+from .tool_cache import get_tool_cache
+from .tracing import get_tracer
 from .tools import validate_code, safe_execute, calculator
 
 
-def apply_tools(model_output: str) -> Tuple[str, List[Dict[str, Any]]]:
+TOOL_CALL_PREFIX = "<TOOL_CALL>_["
+
+# scan outcomes
+_COMPLETE, _PARTIAL, _INVALID = "complete", "partial", "invalid"
+
+# Longest tool name; a marker whose name is not closed by then is plain text.
+MAX_TOOL_NAME = 64
+# How far the quote-aware argument scan may get past the quote-agnostic
+# closing parenthesis while still inside a quote opened before it. Beyond
+# that the quote is taken for an apostrophe in free text, e.g.
+# (don't panic), and the quote-agnostic match is used, also while streaming.
+QUOTE_LOOKAHEAD = 256
+
+
+def apply_tools(model_output: str, max_workers: int = 4) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Parse, execute, and inline all tool calls found in model_output.
 
+    The output is scanned once; every call is replaced by its result using the
+    recorded span, so the cost is linear in the text length. The calls are
+    independent of each other and run concurrently (sandboxed tools on the
+    worker pool, see sandbox.py).
+
     Args:
         model_output: Text that may contain <TOOL_CALL>_[...] markers.
+        max_workers: Maximum number of tool calls executed at the same time.
 
     Returns:
         A tuple:
             - processed text with tool calls replaced by [Result: ...]
-            - list of executed tool calls with their results
+            - list of executed tool calls with their results (see execute_tool)
     """
     calls = extract_tool_calls(model_output)
-    executed: List[Dict[str, Any]] = []
-    processed = model_output
+    if len(calls) > 1 and max_workers > 1:
+        with ThreadPoolExecutor(max_workers=min(len(calls), max_workers)) as executor:
+            # each call gets a copy of the caller's context so its trace span nests correctly
+            futures = [
+                executor.submit(contextvars.copy_context().run, execute_tool, call["tool"], call["arguments"])
+                for call in calls
+            ]
+            executed = [future.result() for future in futures]
+    else:
+        executed = [execute_tool(call["tool"], call["arguments"]) for call in calls]
+
+    pieces: List[str] = []
+    position = 0
+
+    for call, record in zip(calls, executed):
+        pieces.append(model_output[position:call["start"]])
+        pieces.append(f"[Result: {record['result']}]")
+        position = call["end"]
+
+    pieces.append(model_output[position:])
+
+    return "".join(pieces), executed
+
+
+def extract_tool_calls(text: str) -> List[Dict[str, Any]]:
+    """
+    Find tool calls in the form <TOOL_CALL>_[tool_name](arguments).
+
+    Arguments may contain balanced parentheses and quoted strings, e.g.
+    <TOOL_CALL>_[calculator](sin(pi/2)) or <TOOL_CALL>_[safe_execute]("a)b").
+
+    Args:
+        text: Model output that may contain tool call markers.
+
+    Returns:
+        A list of dicts with:
+            - "tool": tool name as string
+            - "arguments": argument string (a single quoted literal is unquoted)
+            - "start", "end": span of the whole marker in text
+    """
+    calls: List[Dict[str, Any]] = []
+    position = 0
+
+    while True:
+        start = text.find(TOOL_CALL_PREFIX, position)
+        if start == -1:
+            return calls
+
+        status, call = _scan_call(text, start, final=True)
+        if status == _COMPLETE:
+            calls.append(call)
+            position = call["end"]
+        else:
+            position = start + len(TOOL_CALL_PREFIX)
+
+
+def _scan_call(
+    text: str, start: int, final: bool, scan: Optional["_ArgumentScan"] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Parse one marker beginning at text[start] (which starts with TOOL_CALL_PREFIX).
+
+    Returns (status, call): "complete" with the call dict, "invalid" if this
+    is not a tool call, or "partial" if the text ends before the marker does
+    and final is False. A streaming caller passes the same scan for the same
+    marker on every call, so its arguments are scanned only once.
+    """
+    name_start = start + len(TOOL_CALL_PREFIX)
+    name_end = text.find("]", name_start, name_start + MAX_TOOL_NAME + 1)
+    if name_end == -1:
+        if final or len(text) > name_start + MAX_TOOL_NAME:
+            return _INVALID, None
+        return _PARTIAL, None
+
+    tool_name = text[name_start:name_end].strip()
+    if not tool_name:
+        return _INVALID, None
+
+    open_paren = name_end + 1
+    if open_paren >= len(text):
+        return (_INVALID if final else _PARTIAL), None
+    if text[open_paren] != "(":
+        return _INVALID, None
+
+    scan = scan or _ArgumentScan()
+    scan.advance(text, open_paren)
+    closing = scan.closing(final)
+    if closing is None:
+        return (_INVALID if final else _PARTIAL), None
+
+    close_paren = open_paren + 1 + closing
+    raw_args = text[open_paren + 1:close_paren]
+    return _COMPLETE, {
+        "tool": tool_name,
+        "arguments": _unquote(raw_args.strip()),
+        "start": start,
+        "end": close_paren + 1,
+    }
+
+
+class _ArgumentScan:
+    """
+    Incremental search for the parenthesis closing a tool call's arguments.
+
+    One pass tracks two scans: one honouring nesting and single/double quoted
+    strings with backslash escapes, and one honouring nesting only. Offsets
+    are relative to the character after the opening parenthesis, and
+    advance() resumes where the previous call stopped, so the state survives
+    the text before the marker being dropped and every character is looked
+    at once.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.depth = 1
+        self.quote: Optional[str] = None
+        self.quote_start = 0
+        self.escaped = False
+        self.plain_depth = 1
+        self.close: Optional[int] = None
+        self.plain_close: Optional[int] = None
+        # the quote-aware scan gave up on a quote, see QUOTE_LOOKAHEAD
+        self.unquoted = False
+
+    def advance(self, text: str, open_paren: int):
+        base = open_paren + 1
+        position = base + self.scanned
+        length = len(text)
+
+        while position < length and self.close is None and not self.unquoted:
+            char = text[position]
+            offset = position - base
+            if self.plain_close is None:
+                if char == "(":
+                    self.plain_depth += 1
+                elif char == ")":
+                    self.plain_depth -= 1
+                    if self.plain_depth == 0:
+                        self.plain_close = offset
+            if self.escaped:
+                self.escaped = False
+            elif self.quote:
+                if char == "\\":
+                    self.escaped = True
+                elif char == self.quote:
+                    self.quote = None
+                elif (self.plain_close is not None and self.quote_start < self.plain_close
+                      and offset - self.plain_close >= QUOTE_LOOKAHEAD):
+                    self.unquoted = True
+            elif char in "\"'":
+                self.quote = char
+                self.quote_start = offset
+            elif char == "(":
+                self.depth += 1
+            elif char == ")":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.close = offset
+            position += 1
+
+        self.scanned = position - base
+
+    def closing(self, final: bool) -> Optional[int]:
+        """
+        Offset of the closing parenthesis, or None if there is none (yet).
+        """
+        if self.unquoted:
+            return self.plain_close
+        if self.close is not None:
+            return self.close
+        # an unmatched apostrophe in free text, e.g. (don't panic), must not hide the call
+        return self.plain_close if final else None
+
+
+def _unquote(args: str) -> str:
+    """
+    Turn a single string literal argument ("3 + 10") into its value (3 + 10).
+    """
+    if len(args) >= 2 and args[0] == args[-1] and args[0] in "\"'":
+        try:
+            value = ast.literal_eval(args)
+        except (ValueError, SyntaxError):
+            return args
+        if isinstance(value, str):
+            return value
+    return args
+
+
+class ToolCallStream:
+    """
+    Incremental version of apply_tools for streamed model output.
+
+    feed() takes the next chunk of text and returns the part that can already
+    be shown: plain text is passed through, complete tool call markers are
+    executed and replaced by [Result: ...], and a marker that may still be
+    incomplete is held back until more text arrives. finish() flushes the rest.
+    afeed()/afinish() do the same without running tools on the event loop.
+
+    Text before a pending marker is never rescanned and the arguments of a
+    pending marker are scanned once (see _ArgumentScan), so the total work
+    stays linear in the length of the stream.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.executed: List[Dict[str, Any]] = []
+        # argument scan of the pending marker, which starts the buffer
+        self._scan: Optional[_ArgumentScan] = None
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        return self._render(self._drain(final=False))
+
+    def finish(self) -> str:
+        return self._render(self._drain(final=True))
+
+    async def afeed(self, chunk: str) -> str:
+        """
+        feed() for event loops: the text is scanned on the loop, tool calls
+        (sandbox, tool cache) run in a worker thread.
+        """
+        self.buffer += chunk
+        return await self._arender(self._drain(final=False))
 
-    for call in calls:
-        tool_name = call["tool"]
-        args = call["arguments"]
+    async def afinish(self) -> str:
+        return await self._arender(self._drain(final=True))
 
-        result = run_tool(tool_name, args)
-        executed.append(
-            {
-                "tool": tool_name,
-                "arguments": args,
-                "result": result,
-            }
-        )
+    def _render(self, pieces: List[Any]) -> str:
+        return "".join(piece if isinstance(piece, str) else self._execute(piece) for piece in pieces)
 
-        original_call = f"<TOOL_CALL>_[{tool_name}]({args})"
-        processed = processed.replace(original_call, f"[Result: {result}]")
+    async def _arender(self, pieces: List[Any]) -> str:
+        out: List[str] = []
+        for piece in pieces:
+            out.append(piece if isinstance(piece, str) else await asyncio.to_thread(self._execute, piece))
+        return "".join(out)
 
-    return processed, executed
+    def _drain(self, final: bool) -> List[Any]:
+        """
+        Consume the buffer up to a possibly incomplete marker; returns text
+        pieces and the complete tool calls between them, in order.
+        """
+        out: List[Any] = []
+        buffer = self.buffer
+        position = 0
+
+        while True:
+            start = buffer.find(TOOL_CALL_PREFIX, position)
+            if start == -1:
+                # keep a tail that could be the beginning of a marker
+                keep = 0 if final else _prefix_overlap(buffer, TOOL_CALL_PREFIX)
+                out.append(buffer[position:len(buffer) - keep])
+                position = len(buffer) - keep
+                break
+
+            scan = self._scan if start == 0 and self._scan is not None else _ArgumentScan()
+            self._scan = None
+            status, call = _scan_call(buffer, start, final, scan)
+            if status == _PARTIAL:
+                out.append(buffer[position:start])
+                position = start
+                self._scan = scan
+                break
+
+            if status == _COMPLETE:
+                out.append(buffer[position:start])
+                out.append(call)
+                position = call["end"]
+            else:
+                # not a tool call after all, emit the prefix as text
+                out.append(buffer[position:start + len(TOOL_CALL_PREFIX)])
+                position = start + len(TOOL_CALL_PREFIX)
+
+        self.buffer = buffer[position:]
+        return out
+
+    def _execute(self, call: Dict[str, Any]) -> str:
+        record = execute_tool(call["tool"], call["arguments"])
+        self.executed.append(record)
+        return f"[Result: {record['result']}]"
+
+
+def _prefix_overlap(text: str, prefix: str) -> int:
+    """
+    Length of the longest suffix of text that is a proper prefix of prefix.
+    """
+    for size in range(min(len(text), len(prefix) - 1), 0, -1):
+        if text.endswith(prefix[:size]):
+            return size
+    return 0
+
+
+_TOOLS_TEXT: Optional[Tuple[Tuple[str, ...], str]] = None
 
 
 def get_available_tools() -> str:
     """
     Return a human-readable list of all available tools.
+
+    The text is built once and rebuilt only when tools are added or removed,
+    so every prompt embeds the same string (see the layout note in prompts.py).
     """
-    lines = ["Available tools:"]
-    for tool_name, tool_info in AVAILABLE_TOOLS.items():
-        lines.append(f"- {tool_name}: {tool_info['description']}")
-    return "\n".join(lines)
+    global _TOOLS_TEXT
+    names = tuple(AVAILABLE_TOOLS)
+    if _TOOLS_TEXT is None or _TOOLS_TEXT[0] != names:
+        lines = ["Available tools:"]
+        for tool_name, tool_info in AVAILABLE_TOOLS.items():
+            lines.append(f"- {tool_name}: {tool_info['description']}")
+        _TOOLS_TEXT = (names, "\n".join(lines))
+    return _TOOLS_TEXT[1]
 
 
 def run_tool(tool_name: str, arguments: str) -> str:
     """
     Execute a tool by name using the provided argument string.
 
+    Tools marked "sandboxed" in AVAILABLE_TOOLS evaluate untrusted input and
+    run in a resource-limited worker process (see sandbox.py). Results of tools
+    with a "cache" policy of "pure" or "cacheable" are memoized (see tool_cache.py).
+
     Args:
         tool_name: Name of a tool from AVAILABLE_TOOLS.
         arguments: Argument string passed directly to the tool function.
@@ -59,42 +368,61 @@ def run_tool(tool_name: str, arguments: str) -> str:
     Returns:
         Result of the tool call as a string, or an error message.
     """
+    return execute_tool(tool_name, arguments)["result"]
+
+
+def execute_tool(tool_name: str, arguments: str) -> Dict[str, Any]:
+    """
+    Same as run_tool, but returns the record stored in agent_log.
+
+    Returns:
+        A dict with "tool", "arguments", "result" and "cached" (True if the
+        result came from the tool cache).
+    """
+    record = {"tool": tool_name, "arguments": arguments, "result": None, "cached": False}
+
     tool_info = AVAILABLE_TOOLS.get(tool_name)
     if tool_info is None:
-        return f"Error: Unknown tool '{tool_name}'"
+        record["result"] = f"Error: Unknown tool '{tool_name}'"
+        return record
+
+    with get_tracer().span(f"tool.{tool_name}", "tool") as span:
+        _execute_tool(tool_info, record)
+        if span is not None:
+            span.attributes["cached"] = record["cached"]
+    return record
+
+
+def _execute_tool(tool_info: Dict[str, Any], record: Dict[str, Any]):
+    tool_name, arguments = record["tool"], record["arguments"]
+    policy = tool_info.get("cache", "never")
+    cache = get_tool_cache()
+    cached = cache.get(tool_name, arguments, policy)
+    if cached is not None:
+        record.update(result=cached, cached=True)
+        return
 
     try:
         func = tool_info["function"]
-        result = func(arguments)
-        return str(result)
+        if tool_info.get("sandboxed"):
+            result = get_sandbox_pool().run(func, arguments)
+        else:
+            result = str(func(arguments))
     except Exception as exc:
-        return f"Error executing {tool_name}: {exc}"
+        # timeouts and crashes are not a property of the arguments, don't cache them
+        record["result"] = f"Error executing {tool_name}: {exc}"
+        return
 
+    cache.put(tool_name, arguments, policy, result)
+    record["result"] = result
 
-def extract_tool_calls(text: str) -> List[Dict[str, Any]]:
-    """
-    Find tool calls in the form <TOOL_CALL>_[tool_name](arguments).
-
-    Args:
-        text: Model output that may contain tool call markers.
 
-    Returns:
-        A list of dicts with:
-            - "tool": tool name as string
-            - "arguments": raw argument string
+def tool_cache_counters(executed: List[Dict[str, Any]]) -> Dict[str, int]:
     """
-    pattern = r'<TOOL_CALL>_\[([^\]]+)\]\(([^)]*)\)'
-    matches = re.findall(pattern, text)
-
-    calls: List[Dict[str, Any]] = []
-    for tool_name, args in matches:
-        calls.append(
-            {
-                "tool": tool_name.strip(),
-                "arguments": args.strip(),
-            }
-        )
-    return calls
+    Cache hits and misses among executed tool call records.
+    """
+    hits = sum(1 for record in executed if record.get("cached"))
+    return {"hits": hits, "misses": len(executed) - hits}
 
 
 AVAILABLE_TOOLS = {
@@ -107,6 +435,7 @@ AVAILABLE_TOOLS = {
             "or describing the syntax error."
         ),
         "function": validate_code,
+        "cache": "pure",
     },
     "safe_execute": {
         "name": "safe_execute",
@@ -116,6 +445,8 @@ AVAILABLE_TOOLS = {
             "Output: result of the expression or an error message."
         ),
         "function": safe_execute,
+        "sandboxed": True,
+        "cache": "cacheable",
     },
     "calculator": {
         "name": "calculator",
@@ -126,5 +457,7 @@ AVAILABLE_TOOLS = {
             "Output: result as string or an error message."
         ),
         "function": calculator,
+        "sandboxed": True,
+        "cache": "pure",
     },
 }
\ No newline at end of file
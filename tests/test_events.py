@@ -0,0 +1,86 @@
+from datetime import date
+
+import pytest
+
+from src.events import EventCalendar, parse_dates, query_window
+from src.memory import Memory
+
+TODAY = date(2026, 10, 17)  # a Saturday
+
+
+# === DATE PARSING ===
+@pytest.mark.parametrize("text, expected", [
+    ("dentist on January 6th", [(date(2027, 1, 6), date(2027, 1, 6))]),
+    ("6 Jan", [(date(2027, 1, 6), date(2027, 1, 6))]),
+    ("Oct 20", [(date(2026, 10, 20), date(2026, 10, 20))]),
+    ("exam on October 17", [(TODAY, TODAY)]),
+    ("trip January 6-8", [(date(2027, 1, 6), date(2027, 1, 8))]),
+    ("Dec 30 to Jan 2", [(date(2026, 12, 30), date(2027, 1, 2))]),
+    ("June 3rd, 2025", [(date(2025, 6, 3), date(2025, 6, 3))]),
+    ("January 6-8, 2028", [(date(2028, 1, 6), date(2028, 1, 8))]),
+    ("2027-01-06 to 2027-01-09", [(date(2027, 1, 6), date(2027, 1, 9))]),
+    ("February 29th", [(date(2028, 2, 29), date(2028, 2, 29))]),
+    ("no dates here, may I ask?", []),
+    ("2027-02-30", []),
+])
+def test_parse_dates(text, expected):
+    assert parse_dates(text, TODAY) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("what is on November 3?", (date(2026, 11, 3), date(2026, 11, 3))),
+    ("anything in January", (date(2027, 1, 1), date(2027, 1, 31))),
+    ("plans for today", (TODAY, TODAY)),
+    ("tomorrow", (date(2026, 10, 18), date(2026, 10, 18))),
+    ("next week", (date(2026, 10, 19), date(2026, 10, 25))),
+    ("this weekend", (TODAY, date(2026, 10, 18))),
+    ("on friday", (date(2026, 10, 23), date(2026, 10, 23))),
+    ("how do closures work?", None),
+])
+def test_query_window(query, expected):
+    assert query_window(query, TODAY) == expected
+
+
+# === CALENDAR ===
+NOTES = [
+    {"title": "Exam", "content": "Algebra exam on 2026-11-03"},
+    {"title": "Trip", "content": "Ski trip 2026-12-28 to 2027-01-04"},
+    {"title": "Hobby", "content": "Likes chess"},
+    {"title": "Past", "content": "Moved on 2026-09-01"},
+    {"title": "Course", "content": "Course 2026-10-01 to 2026-12-15, final on 2026-12-15"},
+]
+
+
+def calendar():
+    calendar = EventCalendar(TODAY)
+    for note in NOTES:
+        calendar.add(note)
+    return calendar
+
+
+def test_overlapping_finds_ranges_starting_before_the_window():
+    cal = calendar()
+    assert cal.note_ids(cal.overlapping(date(2027, 1, 1), date(2027, 1, 31))) == [1]
+    assert cal.note_ids(cal.overlapping(date(2026, 11, 1), date(2026, 11, 30))) == [4, 0]
+    assert cal.note_ids(cal.overlapping(date(2026, 12, 15), date(2026, 12, 15))) == [4]
+    assert cal.overlapping(date(2027, 2, 1), date(2027, 2, 1)) == []
+
+
+def test_upcoming_skips_past_events():
+    cal = calendar()
+    assert cal.note_ids(cal.upcoming(10)) == [4, 0, 1]
+    assert len(cal.upcoming(1)) == 1
+
+
+def test_memory_events_between(tmp_path):
+    memory = Memory(str(tmp_path / "memory.json"))
+    for note in NOTES:
+        memory.add_to_profile(note["title"], note["content"])
+
+    titles = [note["title"] for note in memory.events_between(date(2026, 12, 1), date(2026, 12, 31))]
+    assert titles == ["Course", "Trip"]
+
+    memory.add_to_profile("Party", "New year party 2026-12-31")
+    titles = [note["title"] for note in memory.events_between(date(2026, 12, 31), date(2026, 12, 31))]
+    assert titles == ["Trip", "Party"]
+    memory.close()
@@ -0,0 +1,39 @@
+from src.memory import Memory
+from src.retrieval import BM25Index, note_fields
+
+
+def titles(notes):
+    return [note["title"] for note in notes]
+
+
+def test_saved_index_round_trip(tmp_path):
+    index = BM25Index()
+    for title in ("apples", "bananas"):
+        index.add(note_fields({"title": title, "content": f"likes {title}"}), title)
+    index.save(tmp_path / "index.json")
+
+    loaded = BM25Index.load(tmp_path / "index.json")
+    assert loaded.digest == index.digest
+    assert loaded.search("bananas") == index.search("bananas")
+
+
+def test_index_saved_for_other_notes_is_rebuilt(tmp_path):
+    path = tmp_path / "memory.json"
+    memory = Memory(str(path))
+    for title in ("apples", "bananas", "cherries"):
+        memory.add_to_profile(title, f"likes {title}")
+    assert titles(memory.get_from_profile("bananas", 1)) == ["bananas"]
+    memory.close()
+
+    # another store of more notes takes the place of the indexed one
+    for log in tmp_path.glob("memory.profile.*"):
+        log.unlink()
+    memory = Memory(str(path))
+    for title in ("dogs", "cats", "birds", "fish"):
+        memory.backend.append_profile({"title": title, "content": f"owns {title}"})
+    memory.close()
+
+    memory = Memory(str(path))
+    assert titles(memory.get_from_profile("cats", 1)) == ["cats"]
+    assert memory.get_from_profile("bananas", 1) == []
+    memory.close()
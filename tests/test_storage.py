@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from src.storage import BACKENDS, JsonlLog, open_backend
+
+
+def records(n):
+    return [{"i": i} for i in range(n)]
+
+
+# === JSONL RECOVERY ===
+def test_truncated_last_line_is_dropped(tmp_path):
+    log = JsonlLog(tmp_path / "h.jsonl")
+    for record in records(3):
+        log.append(record)
+    with open(log.path, "ab") as raw:
+        raw.write(b'{"i": 3')
+
+    log = JsonlLog(log.path)
+    assert len(log) == 3
+    assert log.read_all() == records(3)
+    log.append({"i": 3})
+    assert log.tail(2) == [{"i": 2}, {"i": 3}]
+
+
+@pytest.mark.parametrize("damage", [b"", b"\x00\x00\x00", b"\x00" * 8 * 7])
+def test_bad_index_is_rebuilt(tmp_path, damage):
+    log = JsonlLog(tmp_path / "h.jsonl")
+    for record in records(5):
+        log.append(record)
+    log.index_path.write_bytes(log.index_path.read_bytes()[:16] + damage)
+
+    log = JsonlLog(log.path)
+    assert len(log) == 5
+    assert log.tail(5) == records(5)
+    assert log.get([4, 0]) == [{"i": 4}, {"i": 0}]
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    log = JsonlLog(tmp_path / "h.jsonl")
+    for record in records(4):
+        log.append(record)
+    log.index_path.unlink()
+
+    assert JsonlLog(log.path).tail(2) == [{"i": 2}, {"i": 3}]
+
+
+# === LEGACY MIGRATION ===
+def legacy(path, n_history=5, n_notes=3):
+    data = {
+        "msg_history": [{"user": f"q{i}", "assistant": f"a{i}"} for i in range(n_history)],
+        "profile_notes": [{"title": f"t{i}", "content": f"c{i}"} for i in range(n_notes)],
+    }
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return data
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_migration_runs_once(tmp_path, backend):
+    path = tmp_path / "memory.json"
+    data = legacy(path)
+
+    store = open_backend(path, backend)
+    assert store.tail_history(10) == data["msg_history"]
+    assert store.profile_notes() == data["profile_notes"]
+    store.close()
+
+    store = open_backend(path, backend)
+    assert store.history_count() == 5
+    assert len(store.profile_notes()) == 3
+    store.close()
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_interrupted_migration_resumes(tmp_path, backend, monkeypatch):
+    path = tmp_path / "memory.json"
+    data = legacy(path)
+    appended = []
+    store_cls = BACKENDS[backend]
+    original = store_cls.append_history
+
+    def append_history(self, entry):
+        if len(appended) == 2:
+            raise KeyboardInterrupt
+        appended.append(entry)
+        original(self, entry)
+
+    monkeypatch.setattr(store_cls, "append_history", append_history)
+    with pytest.raises(KeyboardInterrupt):
+        open_backend(path, backend)
+    monkeypatch.undo()
+    assert len(appended) == 2
+
+    store = open_backend(path, backend)
+    assert store.tail_history(10) == data["msg_history"]
+    assert store.profile_notes() == data["profile_notes"]
+    store.close()
+
+
+def test_store_with_own_data_is_not_overwritten(tmp_path):
+    path = tmp_path / "memory.json"
+    (tmp_path / "memory.history.jsonl").write_text('{"user": "mine", "assistant": "kept"}\n', encoding="utf-8")
+    legacy(path)
+
+    store = open_backend(path, "jsonl")
+    assert store.tail_history(10) == [{"user": "mine", "assistant": "kept"}]
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from src import utils
+from src.utils import QUOTE_LOOKAHEAD, ToolCallStream, apply_tools, extract_tool_calls
+
+
+@pytest.fixture(autouse=True)
+def echo_tools(monkeypatch):
+    """
+    Replace tool execution by an echo, so the tests only exercise parsing.
+    """
+    def execute_tool(tool_name, arguments):
+        return {"tool": tool_name, "arguments": arguments, "result": f"{tool_name}:{arguments}", "cached": False}
+
+    monkeypatch.setattr(utils, "execute_tool", execute_tool)
+
+
+def calls(text):
+    return [(call["tool"], call["arguments"]) for call in extract_tool_calls(text)]
+
+
+def stream(text, sizes):
+    parser = ToolCallStream()
+    out, position = [], 0
+    for size in sizes:
+        out.append(parser.feed(text[position:position + size]))
+        position += size
+    out.append(parser.feed(text[position:]))
+    out.append(parser.finish())
+    return "".join(out), parser.executed
+
+
+# === EXTRACTION ===
+def test_nested_parentheses():
+    assert calls("x <TOOL_CALL>_[calculator](sin(pi/2) * (1 + 2)) y") == [("calculator", "sin(pi/2) * (1 + 2)")]
+
+
+def test_quoted_closing_parenthesis():
+    assert calls('<TOOL_CALL>_[safe_execute]("a)b")') == [("safe_execute", "a)b")]
+    assert calls("<TOOL_CALL>_[safe_execute](print(')'))") == [("safe_execute", "print(')')")]
+
+
+def test_escaped_quote_inside_string():
+    assert calls(r'<TOOL_CALL>_[safe_execute]("say \")\"")') == [("safe_execute", 'say ")"')]
+
+
+def test_apostrophe_in_free_text():
+    assert calls("<TOOL_CALL>_[search](don't panic) and more") == [("search", "don't panic")]
+    text = "<TOOL_CALL>_[search](it's) " + "x" * (QUOTE_LOOKAHEAD + 10) + " <TOOL_CALL>_[calculator](1+1)"
+    assert calls(text) == [("search", "it's"), ("calculator", "1+1")]
+
+
+def test_unterminated_calls_are_text():
+    assert calls("<TOOL_CALL>_[calculator](1 + 2") == []
+    assert calls("<TOOL_CALL>_[calculator") == []
+    assert calls("<TOOL_CALL>_[](1)") == []
+    assert calls("<TOOL_CALL>_[calculator] (1)") == []
+
+
+def test_unterminated_call_does_not_hide_later_ones():
+    text = "<TOOL_CALL>_[" + "n" * 100 + " then <TOOL_CALL>_[calculator](2*3)"
+    assert calls(text) == [("calculator", "2*3")]
+    assert calls("<TOOL_CALL>_[calculator](1 + <TOOL_CALL>_[calculator](2)") == [("calculator", "2")]
+
+
+def test_apply_tools_replaces_spans():
+    text, executed = apply_tools("a <TOOL_CALL>_[calculator](1+1) b <TOOL_CALL>_[search](x) c")
+    assert text == "a [Result: calculator:1+1] b [Result: search:x] c"
+    assert [record["tool"] for record in executed] == ["calculator", "search"]
+
+
+# === STREAMING ===
+STREAM_CASES = [
+    "plain text without calls",
+    "a <TOOL_CALL>_[calculator](sin(pi/2)) b",
+    'q <TOOL_CALL>_[safe_execute]("a)b") <TOOL_CALL>_[calculator](2)',
+    "<TOOL_CALL>_[search](don't panic) tail",
+    "<TOOL_CALL>_[search](it's) " + "y" * (QUOTE_LOOKAHEAD + 20) + ")",
+    "broken <TOOL_CALL>_[calculator](1 + 2",
+    "<TOOL_CALL>_[calculator](1 + <TOOL_CALL>_[calculator](2)",
+    "prefix only <TOOL_CALL>_",
+    "<TOOL_CALL>_[" + "n" * 80 + "](1) <TOOL_CALL>_[calculator](4)",
+]
+
+
+@pytest.mark.parametrize("text", STREAM_CASES)
+def test_stream_matches_batch_for_any_split(text):
+    expected, executed = apply_tools(text)
+    rng = random.Random(text)
+    splits = [[1] * len(text), [len(text)]]
+    splits += [[rng.randint(1, 7) for _ in range(len(text))] for _ in range(20)]
+    for sizes in splits:
+        out, streamed = stream(text, sizes)
+        assert out == expected
+        assert [(r["tool"], r["arguments"]) for r in streamed] == [(r["tool"], r["arguments"]) for r in executed]
+
+
+def test_stream_holds_back_a_pending_call():
+    parser = ToolCallStream()
+    assert parser.feed("before <TOOL_CALL>_[calc") == "before "
+    assert parser.feed("ulator](1+") == ""
+    assert parser.feed("1) after") == "[Result: calculator:1+1] after"
+    assert parser.finish() == ""